@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import override
+from typing import Optional, override
 
 from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
 from beetsplug.cd.cd import CD
@@ -16,6 +16,7 @@ class AudioCD(CD):
         super().__init__(path, executor)
         self._tracks = tracks
         self._executor = executor
+        self._attach_manifest()
 
     @CD.pretty_type.getter
     def pretty_type(self) -> str:
@@ -27,8 +28,8 @@ class AudioCD(CD):
         return 80 * 60
 
     @override
-    def _cleanup(self):
-        self._cleanup_path(self._path, self._tracks)
+    def _cleanup(self, executor: Optional[DimensionalThreadPoolExecutor]):
+        self._cleanup_path(self._path, self._tracks, executor)
 
     @override
     def get_tracks(self):
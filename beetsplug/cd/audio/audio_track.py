@@ -2,13 +2,27 @@ import math
 import os
 from pathlib import Path
 import shutil
-from typing import override
+from typing import Optional, override
 
 from beetsplug.stats import Stats
 from beetsplug.config import Config
+from beetsplug.manifest import ManifestEntry
+from beetsplug.dimensional_thread_pool_executor import Resource
 from beetsplug.cd.track import CDTrack
 from beetsplug.cd.audio.audio_populate_mode import AudioPopulateMode
-from beetsplug.util import ffmpeg
+from beetsplug.scheduler import LINK_COST, copy_cost, encode_cost
+from beetsplug.stream_info import StreamInfo
+from beetsplug.transcoder import Transcoder
+
+
+# Codecs whose conversions to FLAC take up about as much space as the source
+_LOSSLESS_CODECS = {"flac", "alac", "ape", "wavpack", "tta"}
+# What lossless sources are recognized by when nothing is known about their codec
+_LOSSLESS_EXTENSIONS = {".flac", ".ape", ".wv", ".tta", ".wav", ".aif", ".aiff"}
+# Bytes per second of CD audio: 44.1 kHz, 16 bit, stereo
+CD_BYTE_RATE = 44_100 * 2 * 2
+# How much of its uncompressed size FLAC takes up, for typical music
+FLAC_RATIO = 0.6
 
 
 class AudioTrack(CDTrack):
@@ -17,39 +31,110 @@ class AudioTrack(CDTrack):
         src_path: Path,
         dst_directory: Path,
         populate_mode: AudioPopulateMode,
+        src_info: Optional[StreamInfo] = None,
+        loudness_target: Optional[float] = None,
     ):
-        super().__init__(src_path, dst_directory)
+        # Only converted tracks can be normalized, the other modes leave the audio untouched
+        if populate_mode != AudioPopulateMode.CONVERT:
+            loudness_target = None
+        super().__init__(src_path, dst_directory, src_info, loudness_target)
         self._populate_mode = populate_mode
 
     @override
     def _get_dst_extension(self) -> str:
+        if self._populate_mode == AudioPopulateMode.CONVERT:
+            return ".flac"
         return self.src_path.suffix
 
+    @override
+    def _get_populate_signature(self) -> str:
+        return self._populate_mode.value + self._get_normalize_signature()
+
+    def _is_in_populate_mode(self) -> bool:
+        """
+        Determines whether the existing destination file was made with this track's populate mode.
+        """
+        assert self._dst_path is not None
+        is_hard_link = self._dst_path.stat().st_nlink > 1
+        match self._populate_mode:
+            case AudioPopulateMode.SOFT_LINK:
+                return self._dst_path.is_symlink()
+            case AudioPopulateMode.HARD_LINK:
+                return is_hard_link
+            case AudioPopulateMode.COPY:
+                return self._dst_path.is_file() and not is_hard_link and self._dst_path.stat().st_size == self._src_path.stat().st_size
+            case AudioPopulateMode.CONVERT:
+                # Converted tracks may be hard linked to identical conversions in other CDs
+                return self._dst_path.is_file() and self._dst_path.stat().st_size != self._src_path.stat().st_size
+        return False
+
+    @override
+    def estimate_cost(self) -> float:
+        match self._populate_mode:
+            case AudioPopulateMode.SOFT_LINK | AudioPopulateMode.HARD_LINK:
+                return LINK_COST
+            case AudioPopulateMode.COPY:
+                return copy_cost(self._src_info)
+            case AudioPopulateMode.CONVERT:
+                return encode_cost(self._src_info)
+        return LINK_COST
+
+    @override
+    def estimate_measure(self, src_stream: StreamInfo) -> int:
+        return math.ceil(src_stream.duration)
+
+    @override
+    def estimate_disk_size(self, measure: int) -> int:
+        if self._populate_mode in (AudioPopulateMode.SOFT_LINK, AudioPopulateMode.HARD_LINK):
+            return 0
+        if self._populate_mode == AudioPopulateMode.CONVERT and not self._is_src_lossless():
+            # Decoding a lossy source can only produce as much FLAC as any other audio of its length
+            return math.ceil(measure * CD_BYTE_RATE * FLAC_RATIO)
+        try:
+            return self.src_path.stat().st_size
+        except OSError:
+            return 0
+
+    def _is_src_lossless(self) -> bool:
+        src_stream = self.get_known_src_stream()
+        if src_stream is not None and src_stream.codec is not None:
+            return src_stream.codec in _LOSSLESS_CODECS or src_stream.codec.startswith("pcm_")
+        return self.src_path.suffix.lower() in _LOSSLESS_EXTENSIONS
+
+    @override
+    def get_resource(self) -> Resource:
+        match self._populate_mode:
+            case AudioPopulateMode.SOFT_LINK | AudioPopulateMode.HARD_LINK:
+                return Resource.META
+            case AudioPopulateMode.COPY:
+                return Resource.IO_WRITE
+        return Resource.CPU
+
     @override
     def populate(self):
         if self._dst_path is None:
             raise RuntimeError("set_dst_path must be run before populate!")
 
         # First check if track already exists
-        if self.is_similar(self._dst_path):
-            # Track already exists, is it the correct mode?
-            is_hard_link = self._dst_path.stat().st_nlink > 1
-            skip = (self._populate_mode == AudioPopulateMode.SOFT_LINK and self._dst_path.is_symlink())
-            skip = skip or (self._populate_mode == AudioPopulateMode.HARD_LINK and is_hard_link)
-            skip = skip or (self._populate_mode == AudioPopulateMode.COPY and self._dst_path.is_file() and not is_hard_link and self._dst_path.stat().st_size == self._src_path.stat().st_size)
-            skip = skip or (self._populate_mode == AudioPopulateMode.CONVERT and self._dst_path.is_file() and not is_hard_link and self._dst_path.stat().st_size != self._src_path.stat().st_size)
-            if skip:
-                # Track is in the same mode, we can safely skip this
-                Stats.skip_track()
-                if Config.verbose:
-                    print(f"Skipped {self._dst_path}")
-                return
-
-            # Track is not in the same mode, delete it so we can rewrite in the correct mode
+        populated = self._is_populated()
+        if populated is None and self.is_similar(self._dst_path):
+            # The manifest doesn't know about this track, is it the correct mode?
+            populated = self._is_in_populate_mode()
+            if populated:
+                self._record_populated()
+        if populated:
+            # Track is up to date and in the same mode, we can safely skip this
+            Stats.skip_track()
+            if Config.verbose:
+                print(f"Skipped {self._dst_path}")
+            return
+
+        if os.path.lexists(self._dst_path):
+            # Track is outdated or not in the same mode, delete it so we can rewrite it
             if not Config.dry:
                 os.remove(self._dst_path)
             if Config.verbose:
-                print(f"Removed {self._dst_path} -- populate mode has changed.")
+                print(f"Removed {self._dst_path} -- source or populate mode has changed.")
             Stats.delete_track()
 
         # Ensure CD directory is created
@@ -79,21 +164,25 @@ class AudioTrack(CDTrack):
                     if Config.verbose:
                         print(verbose_format.format("Converting"))
                     if not Config.dry:
-                        result = ffmpeg(
-                            self._src_path,
-                            self._dst_path.with_suffix(".flac"),
-                            ["-vn"]
-                        )
-                        result.check_returncode()
+                        success = Transcoder.transcode(self._src_path, self._dst_path, self._get_gain_args() + ["-vn"])
+                        if not success:
+                            raise RuntimeError(f"Failed to convert {self._src_path}")
                 case _:
                     Stats.fail_track()
                     raise ValueError("Invalid populate_mode")
+            self._record_populated()
             Stats.populate_track()
         except:
             Stats.fail_track()
 
+    @override
+    def _get_measure(self, entry: ManifestEntry) -> int:
+        return math.ceil(entry.duration)
+
     @override
     def __len__(self):
+        if self._measure is not None:
+            return self._measure
         # Audio CDs are measured in duration, so track size is also measured in duration
         return math.ceil(self.get_duration(self.dst_path))
 
@@ -1,36 +1,50 @@
 from abc import ABC, abstractmethod
-from collections.abc import Sequence
+from collections.abc import Iterator, Sequence
 import os
 from pathlib import Path
-from typing import Iterator
-from magic import Magic
-from more_itertools import divide
+from typing import Callable, Optional
 
 from beetsplug.stats import Stats
 from beetsplug.config import Config
-from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor, Resource
+from beetsplug.file_classifier import FileClassifier
+from beetsplug.manifest import Manifest
+from beetsplug.partition import partition
+from beetsplug.scheduler import JobGroup, LongestFirstPolicy, PopulateJob, Scheduler
 from beetsplug.util import unnumber_name
+from beetsplug.cd.cleanup_plan import CleanupPlan
 from beetsplug.cd.track import CDTrack
 
 
-def _rm_job(path: Path):
+def _rm_job(path: Path, manifest: Manifest):
     if Config.verbose:
         print(f"Removed track {path}")
 
     if not Config.dry:
         os.remove(path)
+        manifest.remove(path)
     Stats.delete_track()
 
 
-def _mv_job(src_path: Path, dst_path: Path):
+def _mv_job(src_path: Path, dst_path: Path, manifest: Manifest):
     if Config.verbose:
         print(f"Existing track moved from {src_path} to {dst_path}")
     
     if not Config.dry:
         src_path.rename(dst_path)
+        manifest.move(src_path, dst_path)
     Stats.move_track()
 
 
+def _rename(src_path: Path, dst_path: Path, manifest: Manifest):
+    """
+    Renames a path without reporting it, used for temporary names while reordering.
+    """
+    if not Config.dry:
+        src_path.rename(dst_path)
+        manifest.move(src_path, dst_path)
+
+
 class CDSplit:
     """
     A section of a populated CD that fits onto a single physical CD.
@@ -54,7 +68,10 @@ class CD(ABC):
         super().__init__()
         self._path = path
         self._executor = executor
+        self._manifest = Manifest(path)
         self._test_size = -1
+        # Identifies the definition and tracks this CD was parsed from, if known
+        self.fingerprint: Optional[str] = None
 
     @property
     def pretty_type(self) -> str:
@@ -68,72 +85,127 @@ class CD(ABC):
     def max_size(self) -> float:
         raise RuntimeError("max_size is not overridden!")
 
+    def _attach_manifest(self):
+        """
+        Lets this CD's tracks use its manifest.
+        Must be called by subclasses once their tracks are known.
+        """
+        for track in self.get_tracks():
+            track.manifest = self._manifest
+        return None
+
+    def is_fully_populated(self) -> bool:
+        """
+        Checks whether every track of this CD is populated and up to date, according to its manifest
+        """
+        return all(track.is_populated() for track in self.get_tracks())
+
+    def save_manifest(self):
+        """
+        Writes what was populated into the CD's manifest
+        """
+        self._manifest.save()
+        return None
+
     def cleanup(self):
         """
         Removes tracks that no longer exist in the CD,
         and renames tracks that have been reordered.
         """
-        self._executor.submit(self._cleanup)
+        self._executor.submit_as(Resource.IO_READ, self._cleanup, self._executor)
+
+    def cleanup_now(self):
+        """
+        Cleans up the CD on the calling thread, returning once it's done.
+        """
+        self._cleanup(None)
+        return None
 
     @abstractmethod
-    def _cleanup(self):
+    def _cleanup(self, executor: Optional[DimensionalThreadPoolExecutor]):
+        """
+        Cleans up the CD, spreading the work over `executor`, or immediately if `executor` is None.
+        """
         pass
 
-    def _cleanup_path(self, path: Path, tracks: Sequence[CDTrack]):
+    def _cleanup_path(
+        self,
+        path: Path,
+        tracks: Sequence[CDTrack],
+        executor: Optional[DimensionalThreadPoolExecutor],
+    ):
         # If the directory doesn't exist, don't bother cleaning it up
         if not path.exists(): return
+
+        dst_paths = set(track.dst_path for track in tracks)
+        def is_known(existing_path: Path) -> bool:
+            return existing_path in dst_paths or self._manifest.get(existing_path) is not None
+
+        existing_paths: list[Path] = []
         for existing_path in path.iterdir():
             # If not a file, don't bother, it wasn't made by cdman
             if not existing_path.is_file() and not existing_path.is_symlink():
                 continue
             
             # Skip over all non-audio files
-            mime_path = existing_path.resolve() if existing_path.is_symlink() else existing_path
-            mimetype = Magic(mime=True).from_file(mime_path)
-            if not mimetype.startswith("audio/"):
+            if not FileClassifier.is_audio(existing_path, is_known):
                 continue
+            existing_paths.append(existing_path)
 
-            # Check for existing tracks
-            existing_track_name = unnumber_name(existing_path.stem)
-            existing_tracks = [track for track in tracks if track.name == existing_track_name]
-            if len(existing_tracks) == 0:
-                # Track is no longer in CD
-                self._executor.submit(_rm_job, existing_path)
-                continue
+        plan = CleanupPlan(
+            existing_paths,
+            tracks,
+            path_of=lambda track: track.dst_path,
+            name_of=lambda track: track.name,
+            existing_name_of=lambda existing_path: unnumber_name(existing_path.stem),
+            is_match=self._is_same_track,
+        )
+        plan.execute(
+            executor,
+            lambda existing_path: _rm_job(existing_path, self._manifest),
+            lambda src_path, dst_path: _mv_job(src_path, dst_path, self._manifest),
+            lambda src_path, dst_path: _rename(src_path, dst_path, self._manifest),
+        )
+        return None
 
-            # Check if this track already exists in this position
-            exact_track = next(filter(lambda t: t.dst_path == existing_path, existing_tracks), None)
-            if exact_track is not None:
-                # Path remains unchanged
-                continue
-            
-            found_track = False
-            for existing_track in existing_tracks:
-                if existing_track.is_similar(existing_path) and not existing_track.dst_path.exists():
-                    # Path changed, and is likely the same song
-                    self._executor.submit(_mv_job, existing_path, existing_track.dst_path)
-                    found_track = True
-                    break
-            if found_track:
-                continue
-            
-            # Does not appear to be the same song
-            self._executor.submit(_rm_job, existing_path)
+    def _is_same_track(self, track: CDTrack, path: Path) -> bool:
+        """
+        Determines whether the file at `path` was populated from `track`.
+        """
+        # The manifest knows exactly where a file came from, only probe when it doesn't
+        entry = self._manifest.get(path)
+        if entry is not None:
+            return entry.src_path == str(track.src_path)
+        return track.is_similar(path)
     
-    def populate(self):
+    def populate(self, scheduler: Optional[Scheduler] = None):
         """
         Takes the found tracks from the user's library and puts them into CD folders.
+        Without a scheduler, this CD's jobs are scheduled on their own, longest first.
         """
-
-        tracks = self.get_tracks()
-        for track_chunk in divide(self._executor.max_workers, tracks):
-            self._executor.submit(self._populate_chunk, track_chunk)
+        if scheduler is None:
+            scheduler = Scheduler(self._executor, LongestFirstPolicy())
+        scheduler.schedule(self.get_populate_jobs())
         return None
 
-    def _populate_chunk(self, chunk: Iterator[CDTrack]):
-        for track in chunk:
-            self._executor.submit(track.populate)
-        return None
+    def get_populate_jobs(self, on_done: Optional[Callable[["CD"], None]] = None) -> Iterator[PopulateJob]:
+        """
+        Yields the jobs that populate this CD, in definition order
+
+        :param on_done: Called with this CD once all of its jobs have finished
+        """
+        if on_done is None:
+            yield from self._create_populate_jobs()
+            return
+
+        group = JobGroup(lambda: on_done(self))
+        for job in self._create_populate_jobs():
+            yield group.add(job)
+        group.close()
+
+    def _create_populate_jobs(self) -> Iterator[PopulateJob]:
+        for track in self.get_tracks():
+            yield PopulateJob(track.estimate_cost(), track.populate, resource=track.get_resource())
 
     @abstractmethod
     def get_tracks(self) -> Sequence[CDTrack]:
@@ -147,29 +219,41 @@ class CD(ABC):
     def numberize(self):
         pass
 
-    def calculate_splits(self) -> Sequence[CDSplit]:
+    def calculate_splits(self, measure: Optional[Callable[[CDTrack], int]] = None) -> Sequence[CDSplit]:
         """
         Determine where the CD must be split to fit onto a physical CD.
+        Uses as few physical CDs as possible, and fills them as evenly as possible.
+        Tracks measured while populating aren't read from the filesystem again.
+
+        :param measure: Measures each track, instead of using the populated tracks
         """
-        
-        splits: list[CDSplit] = []
+        if measure is None:
+            measure = len
+
         tracks = self.get_tracks()
         if len(tracks) == 0:
             return []
 
-        next_split = CDSplit(tracks[0])
         max_size = self.max_size if self._test_size < 0 else self._test_size
-        for track in tracks:
-            track_size = len(track)
-
-            if next_split.size + track_size > max_size:
-                # Too big for one CD
-                splits.append(next_split)
-                next_split = CDSplit(track, track_size)
-            else:
-                next_split.size += track_size
-                
-            next_split.end = track
-        
-        splits.append(next_split)
+        sizes = [self._allocated_size(measure(track)) for track in tracks]
+
+        splits: list[CDSplit] = []
+        start = 0
+        for end in self._partition(sizes, int(max_size)):
+            split = CDSplit(tracks[start], sum(sizes[start:end]))
+            split.end = tracks[end - 1]
+            splits.append(split)
+            start = end
         return splits
+
+    def _allocated_size(self, size: int) -> int:
+        """
+        How much of a physical CD a track of the given measure takes up
+        """
+        return size
+
+    def _partition(self, sizes: Sequence[int], capacity: int) -> list[int]:
+        """
+        Splits the tracks with the given sizes into physical CDs, returning where each one ends
+        """
+        return partition(sizes, capacity)
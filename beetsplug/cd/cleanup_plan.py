@@ -0,0 +1,165 @@
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+from typing import Generic, Optional, TypeVar
+
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor, Resource
+
+
+T = TypeVar("T")
+
+# A single filesystem operation, run as part of a group of operations that must happen in order
+_Step = Callable[[], None]
+
+
+def _run_steps(steps: Sequence[_Step]):
+    for step in steps:
+        step()
+
+
+class CleanupPlan(Generic[T]):
+    """
+    The difference between what exists in a directory and what a CD expects to be there.
+
+    Every existing path is either kept where it is, renamed to where a target expects it,
+    or deleted. Targets that aren't claimed by any existing path are left for populate to create.
+    """
+
+    def __init__(
+        self,
+        existing: Iterable[Path],
+        targets: Iterable[T],
+        *,
+        path_of: Callable[[T], Path],
+        name_of: Callable[[T], str],
+        existing_name_of: Callable[[Path], str],
+        is_match: Callable[[T, Path], bool],
+    ):
+        """
+        :param existing: Paths currently in the directory
+        :param targets: What the CD expects to be in the directory
+        :param path_of: Where a target expects to be
+        :param name_of: The unnumbered name of a target
+        :param existing_name_of: The unnumbered name of an existing path
+        :param is_match: Whether an existing path holds the same content as a target
+        """
+        self.keep: list[Path] = []
+        self.renames: dict[Path, Path] = {}
+        self.deletes: list[Path] = []
+        self.creates: list[T] = []
+
+        # Index targets once so each existing path is matched without scanning every target
+        by_path: dict[Path, T] = {}
+        by_name: dict[str, list[T]] = {}
+        for target in targets:
+            by_path.setdefault(path_of(target), target)
+            by_name.setdefault(name_of(target), []).append(target)
+
+        # Paths that are already exactly where a target expects them are kept as-is,
+        # and are matched before anything else so they can't be claimed by a rename.
+        claimed: set[Path] = set()
+        unmatched: list[Path] = []
+        for path in sorted(existing):
+            if path in by_path:
+                self.keep.append(path)
+                claimed.add(path)
+            else:
+                unmatched.append(path)
+
+        for path in unmatched:
+            match: Optional[Path] = None
+            for candidate in by_name.get(existing_name_of(path), []):
+                candidate_path = path_of(candidate)
+                if candidate_path in claimed:
+                    continue
+                if is_match(candidate, path):
+                    match = candidate_path
+                    break
+
+            if match is None:
+                self.deletes.append(path)
+            else:
+                self.renames[path] = match
+                claimed.add(match)
+
+        self.creates = [target for path, target in by_path.items() if path not in claimed]
+
+    def execute(
+        self,
+        executor: Optional[DimensionalThreadPoolExecutor],
+        remove: Callable[[Path], None],
+        move: Callable[[Path, Path], None],
+        rename: Callable[[Path, Path], None],
+    ):
+        """
+        Runs the plan as a batch of jobs on `executor`, or immediately if `executor` is None.
+
+        Renames that depend on each other, such as two tracks swapping positions,
+        are grouped into a single job that moves through a temporary name,
+        so reordering never deletes a track that could have been kept.
+
+        :param remove: Deletes a path
+        :param move: Moves a path to where a target expects it
+        :param rename: Moves a path to or from a temporary name
+        """
+        for steps in self._groups(remove, move, rename):
+            if executor is None:
+                _run_steps(steps)
+            else:
+                executor.submit_as(Resource.META, _run_steps, steps)
+        return None
+
+    def _groups(
+        self,
+        remove: Callable[[Path], None],
+        move: Callable[[Path, Path], None],
+        rename: Callable[[Path, Path], None],
+    ) -> list[list[_Step]]:
+        groups: list[list[_Step]] = []
+        deletes = set(self.deletes)
+        destinations = set(self.renames.values())
+
+        # Renames form chains (A -> B -> C, where C is free or being deleted)
+        # and cycles (A -> B -> A). Each one only needs to happen in the right order.
+        visited: set[Path] = set()
+        for head in self.renames:
+            if head in destinations:
+                continue
+
+            chain = [head]
+            while self.renames[chain[-1]] in self.renames:
+                chain.append(self.renames[chain[-1]])
+            visited.update(chain)
+
+            steps: list[_Step] = []
+            tail_destination = self.renames[chain[-1]]
+            if tail_destination in deletes:
+                # The end of the chain is occupied by a file that's being deleted
+                deletes.remove(tail_destination)
+                steps.append(lambda path=tail_destination: remove(path))
+            for src in reversed(chain):
+                steps.append(lambda src=src, dst=self.renames[src]: move(src, dst))
+            groups.append(steps)
+
+        for start in self.renames:
+            if start in visited:
+                continue
+
+            cycle = [start]
+            while self.renames[cycle[-1]] != start:
+                cycle.append(self.renames[cycle[-1]])
+            visited.update(cycle)
+
+            # Move the first path out of the way, shift the rest of the cycle, then move it into place
+            tmp_path = start.with_name(f".cdman-tmp-{start.name}")
+            steps: list[_Step] = [lambda src=start, dst=tmp_path: rename(src, dst)]
+            for src in reversed(cycle[1:]):
+                steps.append(lambda src=src, dst=self.renames[src]: move(src, dst))
+            steps.append(lambda src=tmp_path, dst=self.renames[start]: move(src, dst))
+            groups.append(steps)
+
+        # Deletes that nothing depends on can all happen independently
+        for path in self.deletes:
+            if path in deletes:
+                groups.append([lambda path=path: remove(path)])
+
+        return groups
@@ -1,42 +1,62 @@
+from collections.abc import Iterator, Sequence
 from pathlib import Path
 import shutil
-from typing import override
+from typing import Optional, override
+from more_itertools import chunked
 
 from beetsplug.stats import Stats
 from beetsplug.config import Config
-from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor, Resource
+from beetsplug.manifest import Manifest
+from beetsplug.partition import partition
+from beetsplug.scheduler import PopulateJob
 from beetsplug.util import unnumber_name
-from beetsplug.cd.cd import CD
+from beetsplug.cd.cd import CD, _rename
+from beetsplug.cd.cleanup_plan import CleanupPlan
 from beetsplug.cd.mp3.mp3_folder import MP3Folder
+from beetsplug.cd.mp3.mp3_track import MP3Track
 
 
-def _rmdir_job(path: Path):
+def _rmdir_job(path: Path, manifest: Manifest):
     if Config.verbose:
         print(f"Remove folder {path}")
 
     if not Config.dry:
         shutil.rmtree(path)
+        manifest.remove(path)
     Stats.delete_folder()
 
 
-def _mvdir_job(src_path: Path, dst_path: Path):
+def _mvdir_job(src_path: Path, dst_path: Path, manifest: Manifest):
     if Config.verbose:
         print(f"Existing folder moved from {src_path} to {dst_path}")
 
     if not Config.dry:
         src_path.rename(dst_path)
+        manifest.move(src_path, dst_path)
     Stats.move_folder()
 
 
+# The size of a sector on a data CD, in bytes
+SECTOR_SIZE = 2048
+
+
 class MP3CD(CD):
     def __init__(
         self,
         path: Path,
         folders: list[MP3Folder],
         executor: DimensionalThreadPoolExecutor,
+        batch_size: int = 1,
+        split_at_folders: bool = False,
     ) -> None:
         super().__init__(path, executor)
         self._folders = folders
+        # How many tracks are converted by a single ffmpeg process
+        self._batch_size = batch_size
+        # Whether physical CDs should only be split between folders, when that takes no extra CDs
+        self._split_at_folders = split_at_folders
+        self._attach_manifest()
 
     @CD.pretty_type.getter
     def pretty_type(self) -> str:
@@ -49,45 +69,89 @@ class MP3CD(CD):
         return 735_397_888
 
     @override
-    def _cleanup(self):
-        # If the CD doesn't exist yet, there's nothing to cleanup
-        if not self._path.exists(): return
+    def _allocated_size(self, size: int) -> int:
+        # Data CDs store files in whole sectors
+        return -(-size // SECTOR_SIZE) * SECTOR_SIZE
 
-        for existing_path in self._path.iterdir():
-            # MP3 CDs are defined with folders first
-            # (__root__ folder will cleanup itself later)
-            if not existing_path.is_dir():
+    @override
+    def _partition(self, sizes: Sequence[int], capacity: int) -> list[int]:
+        track_ends = partition(sizes, capacity)
+        if not self._split_at_folders:
+            return track_ends
+
+        # Keep each folder together, unless the folder can't fit on a CD by itself
+        unit_ends: list[int] = []
+        start = 0
+        for folder in self._folders:
+            end = start + len(folder.tracks)
+            if end == start:
                 continue
+            if sum(sizes[start:end]) > capacity:
+                unit_ends.extend(range(start + 1, end + 1))
+            else:
+                unit_ends.append(end)
+            start = end
+
+        unit_sizes: list[int] = []
+        start = 0
+        for end in unit_ends:
+            unit_sizes.append(sum(sizes[start:end]))
+            start = end
+        folder_ends = [unit_ends[end - 1] for end in partition(unit_sizes, capacity)]
+
+        # Splitting inside a folder is better than burning another CD
+        return folder_ends if len(folder_ends) <= len(track_ends) else track_ends
 
-            # Check for existing folders
-            existing_folder_name = unnumber_name(existing_path.name)
-            existing_folders = [folder for folder in self._folders if folder.name == existing_folder_name]
-            if len(existing_folders) == 0:
-                # Folder is no longer in CD
-                self._executor.submit(_rmdir_job, existing_path)
-                continue
-            
-            # Confirm that the folders have been numberized
-            for existing_folder in existing_folders:
-                assert existing_folder._numberized
-
-            # Check if this exact folder exists in its current position
-            exact_folder = next(filter(lambda f: f.path == existing_path, existing_folders), None)
-            if exact_folder is not None:
-                # Path remains unchanged
-                continue
+    @override
+    def _cleanup(self, executor: Optional[DimensionalThreadPoolExecutor]):
+        # If the CD doesn't exist yet, there's nothing to cleanup
+        if not self._path.exists(): return
 
-            for existing_folder in existing_folders:
-                if not existing_folder.path.exists():
-                    # Folder has been renamed
-                    _mvdir_job(existing_path, existing_folder.path)
-                    break
+        # MP3 CDs are defined with folders first
+        # (__root__ folder will cleanup itself later)
+        existing_paths = [existing_path for existing_path in self._path.iterdir() if existing_path.is_dir()]
+        folders = [folder for folder in self._folders if not folder.is_root]
+
+        # Confirm that the folders have been numberized
+        for folder in folders:
+            assert folder._numberized
+
+        plan = CleanupPlan(
+            existing_paths,
+            folders,
+            path_of=lambda folder: folder.path,
+            name_of=lambda folder: folder.name,
+            existing_name_of=lambda existing_path: unnumber_name(existing_path.name),
+            # Folders are identified by name alone
+            is_match=lambda folder, existing_path: True,
+        )
+        # Folders must be in place before their tracks can be cleaned up, so don't use the executor
+        plan.execute(
+            None,
+            lambda existing_path: _rmdir_job(existing_path, self._manifest),
+            lambda src_path, dst_path: _mvdir_job(src_path, dst_path, self._manifest),
+            lambda src_path, dst_path: _rename(src_path, dst_path, self._manifest),
+        )
 
         # Go through each folder and clean up their tracks
         for folder in self._folders:
-            self._executor.submit(self._cleanup_path, folder.path, folder._tracks)
+            if executor is None:
+                self._cleanup_path(folder.path, folder.tracks, None)
+            else:
+                executor.submit_as(Resource.IO_READ, self._cleanup_path, folder.path, folder.tracks, executor)
         return None
 
+    @override
+    def _create_populate_jobs(self) -> Iterator[PopulateJob]:
+        if self._batch_size <= 1:
+            yield from super()._create_populate_jobs()
+            return
+
+        # Batches never span folders, so tracks in a batch all end up in the same place
+        for folder in self._folders:
+            for batch in chunked(folder.tracks, self._batch_size):
+                yield PopulateJob(sum(track.estimate_cost() for track in batch), MP3Track.populate_many, batch)
+
     @override
     def get_tracks(self):
         # Get all tracks from each folder
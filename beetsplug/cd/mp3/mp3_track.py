@@ -1,69 +1,186 @@
+from collections.abc import Sequence
+import math
 from pathlib import Path
 import subprocess
 import sys
-from typing import override
+from typing import Optional, override
 
 from beetsplug.stats import Stats
 from beetsplug.config import Config
+from beetsplug.manifest import ManifestEntry
+from beetsplug.dimensional_thread_pool_executor import Resource
 from beetsplug.cd.track import CDTrack
-from beetsplug.util import ffmpeg
+from beetsplug.scheduler import encode_cost
+from beetsplug.stream_info import StreamInfo
+from beetsplug.transcoder import Transcoder
+
+
+# Bytes an MP3 has on top of its audio frames, for tags and the Xing/LAME header
+MP3_OVERHEAD = 4096
 
 
 class MP3Track(CDTrack):
-    def __init__(self, src_path: Path, bitrate: int, dst_directory: Path = Path()):
+    def __init__(
+        self,
+        src_path: Path,
+        bitrate: int,
+        dst_directory: Path = Path(),
+        src_info: Optional[StreamInfo] = None,
+        passthrough: bool = False,
+        loudness_target: Optional[float] = None,
+    ):
         # dst_directory will be overwritten by MP3Folder,
         # but we should still expose dst_directory for tests.
-        super().__init__(src_path, dst_directory)
+        super().__init__(src_path, dst_directory, src_info, loudness_target)
         self._bitrate = bitrate
+        # Whether sources that are already suitable MP3s are copied instead of re-encoded
+        self._passthrough = passthrough
 
     @override
     def _get_dst_extension(self) -> str:
         return ".mp3"
 
     @override
-    def populate(self):
+    def _get_populate_signature(self) -> str:
+        if self._is_copy():
+            return f"mp3:{self._bitrate}:copy"
+        return f"mp3:{self._bitrate}{self._get_normalize_signature()}"
+
+    def _is_copy(self) -> bool:
+        """
+        Determines whether the source is already an MP3 that fits on this CD as is,
+        meaning it can be stream copied rather than re-encoded.
+        """
+        return self._can_copy(self._src_stream)
+
+    def _can_copy(self, stream: Optional[StreamInfo]) -> bool:
+        return (
+            self._passthrough
+            # Normalizing changes the audio, so it can't be copied
+            and self._loudness_target is None
+            and stream is not None
+            and stream.codec == "mp3"
+            and stream.sample_rate == 44100
+            and stream.bit_rate is not None
+            and stream.bit_rate <= self._bitrate * 1_000
+        )
+
+    def _get_encoder_args(self) -> list[str]:
+        if self._is_copy():
+            # Remuxing keeps the audio untouched, while still dropping cover art like an encode would
+            return ["-acodec", "copy", "-vn"]
+
+        # ffmpeg -i "$source_file" -hide_banner -loglevel error -acodec libmp3lame -ar 44100 -b:a ${bitrate}k -vn "$output_file"
+        args = ["-acodec", "libmp3lame"]
+        stream = self._src_stream
+        if stream is None or stream.sample_rate != 44100:
+            args += ["-ar", "44100"]
+        return args + self._get_gain_args() + [
+            "-b:a", f"{self._bitrate}k",
+            "-vn",
+        ]
+
+    def _get_expected_bit_rate(self) -> Optional[int]:
+        """
+        The bit rate a populated copy of this track should have
+        """
+        if self._is_copy():
+            stream = self._src_stream
+            return stream.bit_rate if stream is not None else None
+        return self._bitrate * 1_000
+
+    def _begin_populate(self) -> bool:
+        """
+        Checks whether this track needs to be converted, and prepares to convert it if so.
+        """
         if self._dst_path is None:
             raise RuntimeError("set_dst_path must be run before populate!")
 
         # First check if track already exists
-        if self.is_similar(self.dst_path):
-            # Track already exists, is it the same bitrate?
+        populated = self._is_populated()
+        if populated is None and self.is_similar(self.dst_path):
+            # The manifest doesn't know about this track, is it the same bitrate?
             stream = self._dst_stream
-            if stream is not None and "bit_rate" in stream:
-                dst_bitrate = int(stream["bit_rate"])
-                if dst_bitrate == self._bitrate * 1_000:
-                    # Track already exists and has matching bitrate, skip
-                    if Config.verbose:
-                        print(f"Skipped {self._dst_path}")
-                    Stats.skip_track()
-                    return
+            populated = stream is not None and stream.bit_rate == self._get_expected_bit_rate()
+            if populated:
+                self._record_populated()
+        if populated:
+            # Track already exists and has matching bitrate, skip
+            if Config.verbose:
+                print(f"Skipped {self._dst_path}")
+            Stats.skip_track()
+            return False
         self._dst_path.parent.mkdir(parents=True, exist_ok=True)
 
         # Populate the track
         Stats.populating_track()
         if Config.verbose:
-            print(f"Converting {self._src_path} to {self._dst_path} ...")
+            action = "Copying" if self._is_copy() else "Converting"
+            print(f"{action} {self._src_path} to {self._dst_path} ...")
         if Config.dry:
             Stats.populate_track()
-            return None
-        
-        # Convert to MP3 using ffmpeg
-        # ffmpeg -i "$source_file" -hide_banner -loglevel error -acodec libmp3lame -ar 44100 -b:a ${bitrate}k -vn "$output_file"
-        result = ffmpeg(self._src_path, self._dst_path, [
-            "-acodec", "libmp3lame",
-            "-ar", "44100",
-            "-b:a", f"{self._bitrate}k",
-            "-vn",
-        ])
+            return False
+        return True
 
+    def _finish_populate(self, success: bool):
         # Check that the conversion actually went through
-        if result.returncode != 0:
+        if not success:
             Stats.fail_track()
         else:
+            self._record_populated()
             Stats.populate_track()
+        return None
 
+    @override
+    def estimate_cost(self) -> float:
+        return encode_cost(self._src_info, copy=self._can_copy(self._src_info))
+
+    @override
+    def estimate_measure(self, src_stream: StreamInfo) -> int:
+        if self._can_copy(src_stream):
+            # Copies keep their audio as is
+            bit_rate = src_stream.bit_rate or self._bitrate * 1_000
+        else:
+            bit_rate = self._bitrate * 1_000
+        return math.ceil(src_stream.duration * bit_rate / 8) + MP3_OVERHEAD
+
+    @override
+    def get_resource(self) -> Resource:
+        return Resource.IO_WRITE if self._can_copy(self._src_info) else Resource.CPU
+
+    @override
+    def populate(self):
+        if not self._begin_populate():
+            return None
+
+        # Convert to MP3 using ffmpeg
+        success = Transcoder.transcode(self._src_path, self.dst_path, self._get_encoder_args())
+        self._finish_populate(success)
         return None
 
+    @classmethod
+    def populate_many(cls, tracks: Sequence["MP3Track"]):
+        """
+        Populates several tracks, converting them all with a single ffmpeg process.
+        """
+        pending = [track for track in tracks if track._begin_populate()]
+        if len(pending) == 0:
+            return None
+
+        results = Transcoder.transcode_many([
+            (track.src_path, track.dst_path, track._get_encoder_args())
+            for track in pending
+        ])
+        for track, success in zip(pending, results):
+            track._finish_populate(success)
+        return None
+
+    @override
+    def _get_measure(self, entry: ManifestEntry) -> int:
+        return entry.dst_size
+
     @override
     def __len__(self):
+        if self._measure is not None:
+            return self._measure
         return self.get_size()
@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Optional, override
-import ffmpeg
+from typing import Optional, override
 
+from beetsplug.config import Config
+from beetsplug.dimensional_thread_pool_executor import Resource
+from beetsplug.manifest import Manifest, ManifestEntry
+from beetsplug.probe_cache import ProbeCache
+from beetsplug.stream_info import StreamInfo
 from beetsplug.util import unnumber_name
 
 
@@ -11,13 +15,27 @@ class CDTrack(ABC):
     A track found from a defined CD
     """
 
-    def __init__(self, src_path: Path, dst_directory: Path):
+    def __init__(
+        self,
+        src_path: Path,
+        dst_directory: Path,
+        src_info: Optional[StreamInfo] = None,
+        loudness_target: Optional[float] = None,
+    ):
         self._src_path = src_path
         self.dst_directory = dst_directory
         self._dst_path: Optional[Path] = None
         self._name = unnumber_name(src_path.stem)
-        self.__src_stream: Optional[Any] = None
-        self.__dst_stream: Optional[Any] = None
+        # Library metadata for the source, used instead of probing while it's still current
+        self._src_info = src_info
+        self.__src_stream: Optional[StreamInfo] = None
+        self.__dst_stream: Optional[StreamInfo] = None
+        # Set by the CD this track belongs to
+        self.manifest: Optional[Manifest] = None
+        # How big this track is as measured by its CD, once known from populating
+        self._measure: Optional[int] = None
+        # The integrated loudness in LUFS that encodes are normalized to, if any
+        self._loudness_target = loudness_target
 
     @property
     def dst_path(self) -> Path:
@@ -34,28 +52,34 @@ class CDTrack(ABC):
         return self._name
 
     @property
-    def _src_stream(self) -> Optional[Any]:
+    def _src_stream(self) -> Optional[StreamInfo]:
         if self.__src_stream is None:
-            self.__src_stream = self._get_stream(self.src_path)
+            if self._src_info is not None and self._src_info.is_current(self.src_path):
+                self.__src_stream = self._src_info
+            else:
+                self.__src_stream = self._get_stream(self.src_path)
 
         return self.__src_stream
 
     @property
-    def _dst_stream(self) -> Optional[Any]:
+    def _dst_stream(self) -> Optional[StreamInfo]:
         if self.__dst_stream is None:
             self.__dst_stream = self._get_stream(self.dst_path)
 
         return self.__dst_stream
 
     @classmethod
-    def _get_stream(cls, path: Path) -> Any:
-        try:
-            probe = ffmpeg.probe(str(path))
-        except ffmpeg.Error:
-            return None
+    def _get_stream(cls, path: Path) -> Optional[StreamInfo]:
+        return ProbeCache.probe(path)
 
-        stream = next((stream for stream in probe["streams"] if stream["codec_type"] == "audio"), None)
-        return stream
+    def get_known_src_stream(self) -> Optional[StreamInfo]:
+        """
+        Gets what's already known about the source from the library or the probe cache,
+        without running ffprobe.
+        """
+        if self._src_info is not None and self._src_info.is_current(self.src_path):
+            return self._src_info
+        return ProbeCache.probe(self.src_path, cached_only=True)
 
     @abstractmethod
     def _get_dst_extension(self) -> str:
@@ -64,6 +88,89 @@ class CDTrack(ABC):
         """
         pass
 
+    @abstractmethod
+    def _get_populate_signature(self) -> str:
+        """
+        Describes how this track is populated.
+        If the signature changes, the track must be populated again.
+        """
+        pass
+
+    def _get_normalize_signature(self) -> str:
+        """
+        Describes how this track is normalized, to be added to its populate signature.
+        """
+        if self._loudness_target is None:
+            return ""
+        return f":norm{self._loudness_target:g}"
+
+    def _get_gain_args(self) -> list[str]:
+        """
+        Gets the ffmpeg arguments that normalize the source's loudness while encoding.
+        The source's loudness is only measured once, after which it's taken from the probe cache.
+        """
+        if self._loudness_target is None:
+            return []
+        loudness = ProbeCache.loudness(self.src_path)
+        if loudness is None:
+            if Config.verbose:
+                print(f"Couldn't measure the loudness of {self.src_path}, it won't be normalized")
+            return []
+        gain = loudness.gain(self._loudness_target)
+        if abs(gain) < 0.01:
+            return []
+        return ["-filter:a", f"volume={gain:.2f}dB"]
+
+    def _is_populated(self) -> Optional[bool]:
+        """
+        Checks the manifest for whether this track is already populated and up to date.
+        Returns None if the manifest doesn't know about this track.
+        """
+        if self.manifest is None:
+            return None
+        populated = self.manifest.is_current(self.dst_path, self.src_path, self._get_populate_signature())
+        if populated:
+            self._remember_measure()
+        return populated
+
+    def is_populated(self) -> bool:
+        """
+        Checks the manifest for whether this track is populated and up to date.
+        """
+        return self._is_populated() is True
+
+    def _record_populated(self):
+        """
+        Records in the manifest that this track has been populated.
+        """
+        if self.manifest is None or Config.dry:
+            return
+        self.manifest.record(
+            self.dst_path,
+            self.src_path,
+            self._get_populate_signature(),
+            self.get_duration(self.src_path),
+        )
+        self._remember_measure()
+        return None
+
+    def _remember_measure(self):
+        """
+        Keeps this track's measure from its manifest entry,
+        so calculating splits doesn't have to read the populated file again.
+        """
+        entry = self.manifest.get(self.dst_path) if self.manifest is not None else None
+        if entry is not None:
+            self._measure = self._get_measure(entry)
+        return None
+
+    @abstractmethod
+    def _get_measure(self, entry: ManifestEntry) -> int:
+        """
+        Gets the size of the track as it is measured by its CD, from its manifest entry.
+        """
+        pass
+
     def set_dst_path(self, track_number: int, track_count: int):
         """
         Numbers the track and determines where it will be populated.
@@ -110,8 +217,35 @@ class CDTrack(ABC):
         if stream is None:
             return 0.0
 
-        duration = float(stream["duration"])
-        return duration
+        return stream.duration
+
+    @abstractmethod
+    def estimate_cost(self) -> float:
+        """
+        Estimates how long populating this track takes, for scheduling.
+        Must be cheap, so it only uses what's already known about the source.
+        """
+        pass
+
+    @abstractmethod
+    def estimate_measure(self, src_stream: StreamInfo) -> int:
+        """
+        Estimates the size of the track as it will be measured by its CD, without populating it.
+        """
+        pass
+
+    def estimate_disk_size(self, measure: int) -> int:
+        """
+        Estimates how many bytes populating this track takes up, given its estimated measure.
+        """
+        return measure
+
+    @abstractmethod
+    def get_resource(self) -> Resource:
+        """
+        What populating this track mostly spends its time on
+        """
+        pass
 
     @abstractmethod
     def populate(self):
@@ -1,8 +1,13 @@
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from optparse import Values
+import os
 from pathlib import Path
-from typing import OrderedDict
-from confuse import ConfigView, RootView, YamlSource, Subview
-from beets.library import Library, parse_query_string, Item
+from typing import Any, Callable, Optional, OrderedDict, TypeVar
+from confuse import ConfigSource, ConfigView, RootView, Subview
+import yaml
+from beets.library import Library
 
 from beetsplug.cd.audio.audio_cd import AudioCD
 from beetsplug.cd.audio.audio_populate_mode import AudioPopulateMode
@@ -11,9 +16,41 @@ from beetsplug.cd.cd import CD
 from beetsplug.cd.mp3.mp3_cd import MP3CD
 from beetsplug.cd.mp3.mp3_folder import MP3Folder
 from beetsplug.cd.mp3.mp3_track import MP3Track
+from beetsplug.definition_cache import DefinitionCache
 from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.library_queries import LibraryQueries
 from beetsplug.m3uparser import parsem3u
+from beetsplug.run_fingerprint import CDFingerprints, RunInputs, cd_fingerprint, populate_config
 from beetsplug.stats import Stats
+from beetsplug.track_source import TrackSource
+
+
+T = TypeVar("T")
+
+# libyaml's loader is much faster, but isn't available everywhere
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _load_definition(path: Path) -> tuple[Any, Optional[Exception]]:
+    """
+    Reads a CD definition file, or takes it from the DefinitionCache if it hasn't changed.
+    Returns the parsed file, or the error that stopped it from being read.
+    """
+    try:
+        stat = path.stat()
+        data = DefinitionCache.get(path, stat)
+        if data is None:
+            with path.open("rb") as file:
+                data = yaml.load(file, Loader=_YamlLoader)
+            # An empty file defines no CDs
+            if data is None:
+                data = {}
+            if not isinstance(data, dict):
+                raise ValueError("A CD definition file must map CD names to their definitions")
+            DefinitionCache.put(path, stat, data)
+        return data, None
+    except Exception as e:
+        return None, e
 
 
 class CDParser:
@@ -21,96 +58,313 @@ class CDParser:
     Handles parsing CD definitions into CD objects
     """
 
+    # How many definition files are read at once
+    LOAD_THREADS = 8
+
     def __init__(
         self,
         lib: Library,
         opts: Values,
         config: ConfigView,
         executor: DimensionalThreadPoolExecutor,
+        queries: Optional[LibraryQueries] = None,
     ):
+        """
+        :param queries: Results of earlier queries to reuse, if the library hasn't changed since they were run
+        """
         self.lib = lib
         self.opts = opts
         self.config = config
         self.cds_path = Path(config["path"].get(str)).expanduser() # type: ignore
         self.executor = executor
+        self._queries = queries if queries is not None else LibraryQueries(lib)
+        # How many definition files couldn't be loaded
+        self.error_count = 0
+        # If set, only CDs whose name or key matches one of these glob patterns are parsed
+        self.only: Optional[list[str]] = getattr(opts, "only", None)
+        # If set, CDs that haven't changed since they were last fully populated are skipped
+        self.unchanged: Optional[CDFingerprints] = None
+        # How many CDs were skipped for being unchanged
+        self.unchanged_count = 0
+        self._cd_config = populate_config(config, opts, include_definitions=False)
     
     def from_config(self) -> list[CD]:
         """
         Loads CD definitions from the config
         """
+        return list(self.iter_from_config())
 
-        cds: list[CD] = []
+    def iter_from_config(self) -> Iterator[CD]:
+        """
+        Loads CD definitions from the config, yielding each CD as soon as its tracks are found
+        """
+        return self._iter_config(self._parse_data)
+
+    def iter_sources_from_config(self) -> Iterator[list[TrackSource]]:
+        """
+        Finds the tracks of each CD defined in the config, without creating any CDs
+        """
+        return self._iter_config(self._parse_sources)
 
+    def _iter_config(self, parse: Callable[[ConfigView], Iterator[T]]) -> Iterator[T]:
         # Get CDs directly defined in the config file
         if "cds" in self.config:
-            cds.extend(self._parse_data(self.config["cds"]))
+            yield from parse(self.config["cds"])
 
         # Get CDs defined in external files referenced in the config
         if "cd_files" in self.config:
             cd_files: list[str] = self.config["cd_files"].get(list) # type: ignore
-            for cd_file in cd_files:
-                cds.extend(self.from_path(Path(cd_file)))
-
-        return cds
+            yield from self._iter_paths([Path(cd_file) for cd_file in cd_files], parse)
 
     def from_path(self, path: Path) -> list[CD]:
         """
         Loads CD definitions from a CD definition file, or directory containing CD definition files
         """
+        return list(self.iter_from_path(path))
+
+    def iter_from_path(self, path: Path) -> Iterator[CD]:
+        """
+        Loads CD definitions from a CD definition file, or directory containing CD definition files,
+        yielding each CD as soon as its tracks are found
+        """
+        return self._iter_path(path, self._parse_data)
+
+    def iter_sources_from_path(self, path: Path) -> Iterator[list[TrackSource]]:
+        """
+        Finds the tracks of each CD defined in a CD definition file,
+        or directory containing CD definition files, without creating any CDs
+        """
+        return self._iter_path(path, self._parse_sources)
+
+    def _iter_path(self, path: Path, parse: Callable[[ConfigView], Iterator[T]]) -> Iterator[T]:
+        return self._iter_paths([path], parse)
+
+    def _iter_paths(self, paths: list[Path], parse: Callable[[ConfigView], Iterator[T]]) -> Iterator[T]:
+        """
+        Loads every definition file found in the given paths at once, then parses each one in order
+        """
+        files = [file for path in paths for file in self._find_definition_files(path.expanduser())]
+        if len(files) == 0:
+            return
+
+        with ThreadPoolExecutor(min(self.LOAD_THREADS, len(files)), thread_name_prefix="Definitions") as pool:
+            for path, (data, error) in zip(files, pool.map(_load_definition, files)):
+                try:
+                    if error is not None:
+                        raise error
+                    # Parse CD data found in the definition file
+                    view = RootView([ConfigSource(data, str(path))])
+                    yield from parse(view)
+                except Exception as e:
+                    self.error_count += 1
+                    # CDs found before the error have already been yielded
+                    print(f"Error while loading from file `{path}` - is this a valid cdman definition file?")
+                    print(e)
+                    print()
+
+    def find_inputs(self, paths: Optional[list[Path]] = None) -> RunInputs:
+        """
+        Finds the files CDs defined in the given paths, or in the config if no paths are given, depend on,
+        without parsing any CDs or running any queries
+        """
+        paths, files, datas = self._load_definitions(paths)
+        definition_dirs = [
+            Path(directory)
+            for path in paths if path.expanduser().is_dir()
+            for directory, _, _ in os.walk(path.expanduser())
+        ]
 
-        path = path.expanduser()
+        playlists: dict[Path, None] = {}
+        cd_roots: dict[Path, None] = {self.cds_path: None}
+        for data in datas:
+            for tracks_data in self._find_data_track_entries(data):
+                for track_entry in tracks_data:
+                    if isinstance(track_entry.get("playlist"), str):
+                        playlists[Path(track_entry["playlist"]).expanduser()] = None
+            if not isinstance(data, dict):
+                continue
+            for cd_data in data.values():
+                if isinstance(cd_data, dict) and isinstance(cd_data.get("path"), str):
+                    cd_roots[Path(cd_data["path"])] = None
+        return RunInputs(files, list(playlists), list(cd_roots), definition_dirs)
 
+    def find_duplicates(self, paths: Optional[list[Path]] = None) -> set[str]:
+        """
+        Finds the names of selected CDs defined more than once in the given paths,
+        or in the config if no paths are given, without parsing any CDs or running any queries
+        """
+        _, _, datas = self._load_definitions(paths)
+        cd_paths = set[Path]()
+        duplicates = set[str]()
+        for data in datas:
+            if not isinstance(data, dict):
+                continue
+            for cd_key, cd_data in data.items():
+                if not isinstance(cd_data, dict) or not self._is_selected(cd_key, cd_data):
+                    continue
+                name = str(cd_data.get("name", cd_key))
+                cd_path = Path(cd_data["path"]) / name if isinstance(cd_data.get("path"), str) else self.cds_path / name
+                if cd_path in cd_paths:
+                    duplicates.add(cd_path.name)
+                cd_paths.add(cd_path)
+        return duplicates
+
+    def _load_definitions(self, paths: Optional[list[Path]]) -> tuple[list[Path], list[Path], list[Any]]:
+        """
+        Loads every definition in the given paths, or in the config if no paths are given.
+        Returns the searched paths, the definition files found in them, and the data of every definition.
+        Definitions that can't be loaded are left out, they're reported when they're parsed.
+        """
+        datas: list[Any] = []
+        if paths is None:
+            if "cds" in self.config:
+                datas.append(self.config["cds"].get())
+            cd_files: list[str] = self.config["cd_files"].get(list) if "cd_files" in self.config else [] # type: ignore
+            paths = [Path(cd_file) for cd_file in cd_files]
+
+        files = [file for path in paths for file in self._find_definition_files(path.expanduser())]
+        if len(files) > 0:
+            with ThreadPoolExecutor(min(self.LOAD_THREADS, len(files)), thread_name_prefix="Definitions") as pool:
+                datas.extend(data for data, _ in pool.map(_load_definition, files))
+        return paths, files, datas
+
+    def _find_definition_files(self, path: Path) -> Iterator[Path]:
+        """
+        Finds CD definition files, searching directories recursively
+        """
         # If the path is a directory, check its contents for CD definitions
         if path.is_dir():
-            cds: list[CD] = []
             for child in path.iterdir():
-                cds.extend(self.from_path(child))
-            return cds
+                yield from self._find_definition_files(child)
+            return
 
         # The path has already been confirmed to not be a directory,
         # if it isn't a file or symlink, we shouldn't bother with it
         if not path.is_file() and not path.is_symlink():
-            return []
+            return
 
         # If the file isn't a YAML file, we shouldn't bother with it
         if path.suffix != ".yml" and path.suffix != ".yaml":
-            return []
-        
-        try:
-            # Parse CD data found in the definition file
-            view = RootView([YamlSource(str(path))])
-            return self._parse_data(view)
-        except BaseException as e:
-            print(f"Error while loading from file `{path}` - is this a valid cdman definition file?")
-            print(e)
-            print()
-            return []
+            return
+        yield path
 
-    def _parse_data(self, view: ConfigView) -> list[CD]:
+    def _parse_data(self, view: ConfigView) -> Iterator[CD]:
         """
         Loads a top-level CD definition view
         """
         
-        cds: list[CD] = []
+        # Run every query in this definition at once, rather than one by one as each CD is parsed
+        self._queries.prefetch(self._find_queries(view))
+
         cd_names: list[str] = view.keys()
         for cd_name in cd_names:
             cd_view = view[cd_name]
+            if not self._is_selected(cd_name, cd_view.get()):
+                continue
+
             cd_type: str = cd_view["type"].get(str) # type: ignore
             if cd_type.lower() == "mp3":
-                cds.append(self._parse_mp3_data(cd_view))
+                cd = self._parse_mp3_data(cd_view)
             elif cd_type.lower() == "audio":
-                cds.append(self._parse_audio_data(cd_view))
+                cd = self._parse_audio_data(cd_view)
             else:
                 raise ValueError(f"Invalid type for CD '{cd_name}'. Must be either 'mp3' or 'audio'.\n")
-        return cds
+            # Unchanged CDs aren't created at all
+            if cd is not None:
+                yield cd
+
+    def _is_selected(self, cd_key: str, cd_data: Any) -> bool:
+        """
+        Checks whether a CD was selected by name, or every CD if none were
+        """
+        if self.only is None:
+            return True
+        name = cd_data.get("name", cd_key) if isinstance(cd_data, dict) else cd_key
+        return any(fnmatchcase(str(name), pattern) or fnmatchcase(str(cd_key), pattern) for pattern in self.only)
+
+    def _parse_sources(self, view: ConfigView) -> Iterator[list[TrackSource]]:
+        """
+        Finds the tracks of each CD in a top-level CD definition view
+        """
+        self._queries.prefetch(self._find_queries(view))
+        for tracks_data in self._find_track_entries(view):
+            yield self._parse_tracks(tracks_data, lookup_info=False)
+
+    def _find_queries(self, view: ConfigView) -> Iterator[str]:
+        """
+        Finds every query in a top-level CD definition view.
+        Malformed definitions are skipped here, they're reported when they're parsed.
+        """
+        for tracks_data in self._find_data_track_entries(view.get(), selected_only=True):
+            for track_entry in tracks_data:
+                if isinstance(track_entry.get("query"), str):
+                    yield track_entry["query"]
+
+    def _find_track_entries(self, view: ConfigView) -> Iterator[list[OrderedDict[str, str]]]:
+        """
+        Finds the track entries of each CD in a top-level CD definition view,
+        without looking at anything else in the definitions.
+        Malformed definitions are skipped.
+        """
+        return self._find_data_track_entries(view.get())
+
+    def _find_data_track_entries(self, data: Any, selected_only: bool = False) -> Iterator[list[OrderedDict[str, str]]]:
+        if not isinstance(data, dict):
+            return
+        for cd_key, cd_data in data.items():
+            if not isinstance(cd_data, dict):
+                continue
+            if selected_only and not self._is_selected(cd_key, cd_data):
+                continue
+            yield self._find_cd_track_entries(cd_data)
+
+    def _find_cd_track_entries(self, cd_data: Any) -> list[OrderedDict[str, str]]:
+        """
+        Finds the track entries of a single CD definition, skipping malformed entries
+        """
+        if not isinstance(cd_data, dict):
+            return []
+        tracks_lists = [cd_data.get("tracks")]
+        folders = cd_data.get("folders")
+        if isinstance(folders, dict):
+            tracks_lists.extend(folder.get("tracks") for folder in folders.values() if isinstance(folder, dict))
+        return [
+            track_entry
+            for tracks_data in tracks_lists if isinstance(tracks_data, list)
+            for track_entry in tracks_data if isinstance(track_entry, dict)
+        ]
+
+    def _get_fingerprint(self, view: Subview, sources: list[TrackSource]) -> str:
+        """
+        Identifies a CD by its definition, the playlists it uses, and the tracks it resolved to
+        """
+        cd_data = view.get()
+        playlists = [
+            Path(track_entry["playlist"]).expanduser()
+            for track_entry in self._find_cd_track_entries(cd_data)
+            if isinstance(track_entry.get("playlist"), str)
+        ]
+        return cd_fingerprint(
+            cd_data,
+            self._cd_config,
+            playlists,
+            [(source.path, source.info.mtime if source.info is not None else None) for source in sources],
+        )
+
+    def _is_unchanged(self, cd_path: Path, fingerprint: str) -> bool:
+        if self.unchanged is None or not self.unchanged.is_current(cd_path, fingerprint):
+            return False
+        self.unchanged_count += 1
+        return True
 
     def _get_cd_path(self, view: Subview) -> Path:
         name: str = view["name"].get(str) if "name" in view else view.key # type: ignore
         return Path(view["path"].get(str)) / name if "path" in view else self.cds_path / name # type: ignore
 
-    def _parse_mp3_data(self, view: Subview) -> CD:
+    def _parse_mp3_data(self, view: Subview) -> Optional[CD]:
         """
-        Loads an MP3 CD from a CD definition view
+        Loads an MP3 CD from a CD definition view.
+        Returns None if the CD is skipped for being unchanged.
         """
         cd_path: Path = self._get_cd_path(view)
 
@@ -123,12 +377,21 @@ class CDParser:
         if self.opts.bitrate is not None:
             bitrate = self.opts.bitrate
 
+        # Determine whether sources that are already MP3s can be copied as is
+        passthrough: bool = False
+        if "mp3_passthrough" in self.config:
+            passthrough = self.config["mp3_passthrough"].get(bool) # type: ignore
+        if "passthrough" in view:
+            passthrough = view["passthrough"].get(bool) # type: ignore
+
+        loudness_target = self._get_loudness_target(view)
+
         # Parse folders
         cd_folders: list[MP3Folder] = []
+        cd_sources: list[TrackSource] = []
         folders_view = view["folders"]
         for folder_key in folders_view:
             folder_view = folders_view[folder_key]
-            track_paths: list[Path] = []
 
             # Get folder name
             folder_name: str = folder_key # type: ignore
@@ -136,10 +399,20 @@ class CDParser:
                 folder_name = folder_view["name"].get(str) # type: ignore
 
             tracks_data: list[OrderedDict[str, str]] = folder_view["tracks"].get(list) # type: ignore
-            track_paths = self._parse_tracks(tracks_data)
+            track_sources = self._parse_tracks(tracks_data)
+            cd_sources.extend(track_sources)
 
-            # Convert found track paths into MP3Tracks
-            mp3_tracks = [MP3Track(track_path, bitrate) for track_path in track_paths]
+            # Convert found tracks into MP3Tracks
+            mp3_tracks = [
+                MP3Track(
+                    source.path,
+                    bitrate,
+                    src_info=source.info,
+                    passthrough=passthrough,
+                    loudness_target=loudness_target,
+                )
+                for source in track_sources
+            ]
 
             # Create folder and add it to the new CD
             folder = MP3Folder(
@@ -148,13 +421,33 @@ class CDParser:
             )
             cd_folders.append(folder)
 
-        cd = MP3CD(cd_path, cd_folders, self.executor)
-        Stats.found_cd(cd.path.name, cd.pretty_type)
+        # Determine how many tracks are converted by each ffmpeg process
+        batch_size: int = 1
+        if "ffmpeg_batch_size" in self.config:
+            batch_size = self.config["ffmpeg_batch_size"].get(int) # type: ignore
+        if self.opts.batch_size is not None:
+            batch_size = self.opts.batch_size
+
+        # Determine whether physical CDs are only split between folders
+        split_at_folders: bool = False
+        if "split_at_folders" in self.config:
+            split_at_folders = self.config["split_at_folders"].get(bool) # type: ignore
+        if "split_at_folders" in view:
+            split_at_folders = view["split_at_folders"].get(bool) # type: ignore
+
+        fingerprint = self._get_fingerprint(view, cd_sources)
+        if self._is_unchanged(cd_path, fingerprint):
+            return None
+
+        cd = MP3CD(cd_path, cd_folders, self.executor, batch_size, split_at_folders)
+        cd.fingerprint = fingerprint
+        Stats.found_cd(cd.path.name, cd.pretty_type, len(cd.get_tracks()))
         return cd
 
-    def _parse_audio_data(self, view: Subview) -> CD:
+    def _parse_audio_data(self, view: Subview) -> Optional[CD]:
         """
-        Loads an Audio CD from a CD definition view
+        Loads an Audio CD from a CD definition view.
+        Returns None if the CD is skipped for being unchanged.
         """
         cd_path = self._get_cd_path(view)
 
@@ -172,59 +465,85 @@ class CDParser:
         if populate_mode is None:
             raise ValueError(f"Invalid populate_mode for CD {view.key}")
 
+        loudness_target = self._get_loudness_target(view)
+
         # Parse tracks
         tracks_data: list[OrderedDict[str, str]] = view["tracks"].get(list) # type: ignore
-        track_paths = self._parse_tracks(tracks_data)
+        track_sources = self._parse_tracks(tracks_data)
+
+        fingerprint = self._get_fingerprint(view, track_sources)
+        if self._is_unchanged(cd_path, fingerprint):
+            return None
 
-        # Convert found track paths into AudioTracks
-        tracks = [AudioTrack(track_path, cd_path, populate_mode) for track_path in track_paths]
+        # Convert found tracks into AudioTracks
+        tracks = [
+            AudioTrack(source.path, cd_path, populate_mode, src_info=source.info, loudness_target=loudness_target)
+            for source in track_sources
+        ]
         cd = AudioCD(cd_path, tracks, self.executor)
-        Stats.found_cd(cd.path.name, cd.pretty_type)
+        cd.fingerprint = fingerprint
+        Stats.found_cd(cd.path.name, cd.pretty_type, len(tracks))
         return cd
     
-    def _parse_tracks(self, tracks_data: list[OrderedDict[str, str]]) -> list[Path]:
+    def _get_loudness_target(self, view: Subview) -> Optional[float]:
+        """
+        Determines the loudness a CD's tracks are normalized to, or None if they aren't normalized
+        """
+        normalize: bool = False
+        if "normalize" in self.config:
+            normalize = self.config["normalize"].get(bool) # type: ignore
+        if "normalize" in view:
+            normalize = view["normalize"].get(bool) # type: ignore
+        if not normalize:
+            return None
+
+        target: float = -18.0
+        if "normalize_target" in self.config:
+            target = self.config["normalize_target"].as_number() # type: ignore
+        return float(target)
+
+    def _parse_tracks(self, tracks_data: list[OrderedDict[str, str]], lookup_info: bool = True) -> list[TrackSource]:
         """
-        Gets track paths from a tracks view
+        Gets tracks from a tracks view
+
+        :param lookup_info: Whether playlist tracks are looked up in the library
         """
-        track_paths: list[Path] = []
+        track_sources: list[TrackSource] = []
         for track_entry in tracks_data:
             if "query" in track_entry:
                 query = track_entry["query"]
                 query_tracks = self._get_tracks_from_query(query)
-                track_paths.extend(query_tracks)
+                track_sources.extend(query_tracks)
             if "playlist" in track_entry:
                 playlist_path = Path(track_entry["playlist"])
-                playlist_tracks = self._get_tracks_from_playlist(playlist_path)
-                track_paths.extend(playlist_tracks)
-        return track_paths
+                playlist_tracks = self._get_tracks_from_playlist(playlist_path, lookup_info)
+                track_sources.extend(playlist_tracks)
+        return track_sources
 
-    def _get_tracks_from_query(self, query: str) -> list[Path]:
+    def _get_tracks_from_query(self, query: str) -> list[TrackSource]:
         """
-        Finds track paths from a beets query
+        Finds tracks from a beets query
         """
-        parsed_query, _ = parse_query_string(query, Item)
-        items = list(item for item in self.lib.items(parsed_query))
-        items.sort(key=lambda i: int(i.get("track") if "track" in i.keys() else 0))
-        return [item.filepath for item in items]
+        return self._queries.get(query)
 
-    def _get_tracks_from_playlist(self, playlist_path: Path) -> list[Path]:
+    def _get_tracks_from_playlist(self, playlist_path: Path, lookup_info: bool = True) -> list[TrackSource]:
         """
-        Finds track paths from a playlist file
+        Finds tracks from a playlist file
         """
         playlist_path = playlist_path.expanduser()
         if not playlist_path.is_file() and not playlist_path.is_symlink():
             raise ValueError(f"Provided playlist path `{playlist_path}` is not a file!")
 
         if playlist_path.suffix == ".m3u":
-            return self._get_tracks_from_m3u_playlist(playlist_path)
+            return self._get_tracks_from_m3u_playlist(playlist_path, lookup_info)
         raise ValueError(f"Provided playlist file `{playlist_path}` is unsupported!")
 
-    def _get_tracks_from_m3u_playlist(self, playlist_path: Path) -> list[Path]:
+    def _get_tracks_from_m3u_playlist(self, playlist_path: Path, lookup_info: bool = True) -> list[TrackSource]:
         """
-        Finds track paths from an M3U playlist
+        Finds tracks from an M3U playlist
         """
         tracks = parsem3u(str(playlist_path))
-        paths: list[Path] = []
+        resolved_paths: list[Path] = []
         for track in tracks:
             track_path = Path(track.path)
             if track_path.is_absolute():
@@ -233,5 +552,11 @@ class CDParser:
                 resolved_path = (playlist_path.parent / track_path).resolve()
             if not resolved_path.exists():
                 raise ValueError(f"Playlist at `{playlist_path}` references missing track `{resolved_path}`")
-            paths.append(resolved_path)
-        return paths
+            resolved_paths.append(resolved_path)
+
+        if not lookup_info:
+            return [TrackSource(path) for path in resolved_paths]
+
+        # Look up the whole playlist in the library at once
+        infos = self._queries.get_infos(resolved_paths)
+        return [TrackSource(path, infos[path]) for path in resolved_paths]
@@ -1,32 +1,67 @@
-from collections.abc import Sequence
+from collections.abc import Iterable, Iterator, Sequence
 from datetime import datetime
 import os
 from pathlib import Path
+from queue import Queue
+import shutil
 from threading import Lock, Thread
-import psutil
-from typing import Optional, override
+from typing import Any, Optional, override
+from beets import config as beets_config
 from beets.plugins import BeetsPlugin
 from beets.ui import Subcommand
-from beets.library import Library, parse_query_string, Item
+from beets.library import Library
 from optparse import Values
 
 from beetsplug.cd.cd import CD, CDSplit
+from beetsplug.cd.track import CDTrack
 from beetsplug.cd_parser import CDParser
 from beetsplug.config import Config
-from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.definition_cache import DefinitionCache
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor, Resource
+from beetsplug.encode_limiter import EncodeLimiter
+from beetsplug.library_queries import LibraryQueries
 from beetsplug.printer import Printer
+from beetsplug.probe_cache import ProbeCache
+from beetsplug.query_cache import QueryCache, library_fingerprint
+from beetsplug.run_fingerprint import CDFingerprints, LastRun, RunFingerprint, RunInputs, populate_config
+from beetsplug.scheduler import DEFAULT_DURATION, PopulateJob, Scheduler, SchedulingPolicy
 from beetsplug.stats import Stats
+from beetsplug.stream_info import StreamInfo
+from beetsplug.track_source import TrackSource
+from beetsplug.transcode_store import TranscodeStore
+from beetsplug.transcoder import Transcoder
+from beetsplug.util import dir_size, effective_cpu_count, peak_rss
+from beetsplug.watcher import Watcher
 
 
 class CDManPlugin(BeetsPlugin):
     def __init__(self, name: Optional[str] = None):
         super().__init__(name)
 
-        hw_thread_count = psutil.cpu_count() or 4
+        # Containers and CPU affinity can leave far fewer CPUs than the host has
+        hw_thread_count = effective_cpu_count()
         self.config.add({
             "cds_path": "~/Music/CDs",
             "bitrate": 192,
+            "mp3_passthrough": False,
+            "split_at_folders": False,
+            "normalize": False,
+            "normalize_target": -18.0,
+            "query_cache": True,
             "threads": hw_thread_count,
+            "probe_cache_size": 200_000,
+            "transcode_cache_path": "~/.cache/cdman/transcodes",
+            "transcode_cache_size": 0,
+            "ffmpeg_batch_size": 1,
+            "ffmpeg_threads": 0,
+            "adaptive_concurrency": False,
+            "scheduling_policy": "longest_first",
+            "scheduling_window": 1000,
+            "max_queued_tasks": 256,
+            "io_read_threads": 4,
+            "io_write_threads": 2,
+            "meta_threads": 4,
+            "watch_debounce": 2.0,
         })
         return None
 
@@ -42,12 +77,49 @@ class CDManPlugin(BeetsPlugin):
                 "This overrides the config value of the same name.",
             type=int,
         )
+        cmd.parser.add_option(
+            "--io-read-threads",
+            help="The maximum number of threads scanning and reading files. " +
+                "This overrides the config value `io_read_threads`.",
+            type=int,
+        )
+        cmd.parser.add_option(
+            "--io-write-threads",
+            help="The maximum number of threads copying files into CDs. " +
+                "This overrides the config value `io_write_threads`.",
+            type=int,
+        )
+        cmd.parser.add_option(
+            "--meta-threads",
+            help="The maximum number of threads linking, moving and deleting files. " +
+                "This overrides the config value `meta_threads`.",
+            type=int,
+        )
+        cmd.parser.add_option(
+            "--adaptive",
+            help="Tunes how many conversions run at once based on their throughput and the system load. " +
+                "This overrides the config value `adaptive_concurrency`.",
+            action="store_true",
+            default=None,
+        )
         cmd.parser.add_option(
             "--bitrate", "-b",
             help="The bitrate (in kbps) to use when converting files to MP3. " +
                 "This overrides the config value of the same name.",
             type=int,
         )
+        cmd.parser.add_option(
+            "--batch-size",
+            help="How many tracks in an MP3 CD folder are converted by a single ffmpeg process. " +
+                "This overrides the config value `ffmpeg_batch_size`.",
+            type=int,
+        )
+        cmd.parser.add_option(
+            "--scheduling-policy",
+            help="Determines the order tracks are populated in. " +
+                "Must be one of LONGEST_FIRST or DEFINITION_ORDER. " +
+                "This overrides the config value of the same name.",
+        )
         cmd.parser.add_option(
             "--populate-mode", "-p",
             help="Determines how Audio CDs are populated. "+
@@ -89,6 +161,40 @@ class CDManPlugin(BeetsPlugin):
             help="Lists any empty CD definitions in the found CDs.",
             action="store_true",
         )
+        cmd.parser.add_option(
+            "--plan",
+            help="Estimates the size and splits of each CD, and whether they fit on disk, "+
+                "without converting anything or creating any directories.",
+            action="store_true",
+        )
+        cmd.parser.add_option(
+            "--only", "-o",
+            help="Only processes the CD with this name, which may be a glob pattern such as 'rock-*'. "+
+                "Can be given multiple times.",
+            action="append",
+            metavar="NAME",
+        )
+        cmd.parser.add_option(
+            "--changed", "-c",
+            help="Only populates CDs whose definition, playlists, or tracks changed since they were last populated.",
+            action="store_true",
+        )
+        cmd.parser.add_option(
+            "--watch", "-w",
+            help="Keeps running, and populates CDs again whenever their definitions, playlists, "+
+                "or the beets library change. Only CDs that changed are populated.",
+            action="store_true",
+        )
+        cmd.parser.add_option(
+            "--force", "-f",
+            help="Populates CDs even if nothing changed since the last run.",
+            action="store_true",
+        )
+        cmd.parser.add_option(
+            "--rebuild-probe-cache",
+            help="Discards all cached ffprobe results before running.",
+            action="store_true",
+        )
 
         def cdman_cmd(lib: Library, opts: Values, args: list[str]):
             self._cmd(lib, opts, args)
@@ -107,28 +213,193 @@ class CDManPlugin(BeetsPlugin):
             cd_paths.add(cd.path)
         return duplicates
 
-    def _cmd(self, lib: Library, opts: Values, args: list[str]):
+    def _print_duplicates(self, duplicates: set[str]):
+        print("Duplicate CD definitions found! Check your beets config and CD definition files for duplicate CD names.")
+        print(f"Duplicate CDs: {", ".join(duplicates)}")
+        return None
+
+    def _create_executor(self, opts: Values) -> DimensionalThreadPoolExecutor:
         max_threads: int = self.config["threads"].get(int) if opts.threads is None else opts.threads  # type: ignore
-        self._executor = DimensionalThreadPoolExecutor(max_threads)
+        resource_limits: dict[Resource, int] = {}
+        for resource, key in [
+            (Resource.IO_READ, "io_read_threads"),
+            (Resource.IO_WRITE, "io_write_threads"),
+            (Resource.META, "meta_threads"),
+        ]:
+            option: Optional[int] = getattr(opts, key)
+            resource_limits[resource] = self.config[key].get(int) if option is None else option # type: ignore
+        max_queued: int = self.config["max_queued_tasks"].get(int) # type: ignore
+        return DimensionalThreadPoolExecutor(
+            max_threads,
+            resource_limits=resource_limits,
+            max_queued=max_queued,
+        )
+
+    def _open_query_cache(self, lib: Library):
+        """
+        Opens the query cache if it's enabled, discarding its results if the library changed
+        """
+        if Config.state_path is None or not self.config["query_cache"].get(bool):
+            return None
+        QueryCache.open(
+            Config.state_path / "query_cache.db",
+            Path(os.fsdecode(lib.path)),
+            os.fsdecode(lib.directory),
+        )
+        return None
+
+    def _cmd(self, lib: Library, opts: Values, args: list[str]):
+        self._executor = self._create_executor(opts)
+        max_threads = self._executor.max_workers
+
+        # Every worker may be running an ffmpeg, so split the CPUs between them
+        # rather than letting each ffmpeg start a thread per CPU
+        cpu_count = effective_cpu_count()
+        ffmpeg_threads: int = self.config["ffmpeg_threads"].get(int) # type: ignore
+        Config.ffmpeg_threads = ffmpeg_threads if ffmpeg_threads > 0 else max(1, cpu_count // max_threads)
+        adaptive: bool = self.config["adaptive_concurrency"].get(bool) if opts.adaptive is None else opts.adaptive # type: ignore
+        EncodeLimiter.configure(max_threads, cpu_count, adaptive)
 
         Config.verbose = opts.verbose
         Config.dry = opts.dry
+        Config.state_path = Path(beets_config.config_dir()) / "cdman"
+
+        probe_cache_size: int = self.config["probe_cache_size"].get(int) # type: ignore
+        if probe_cache_size > 0:
+            ProbeCache.open(
+                Config.state_path / "probe_cache.db",
+                probe_cache_size,
+                rebuild=opts.rebuild_probe_cache,
+            )
+
+        DefinitionCache.open(Config.state_path / "definition_cache.db")
+        self._open_query_cache(lib)
+
+        # Size is configured in megabytes
+        transcode_cache_size: int = self.config["transcode_cache_size"].get(int) # type: ignore
+        if transcode_cache_size > 0 and not Config.dry:
+            transcode_cache_path = Path(self.config["transcode_cache_path"].get(str)).expanduser() # type: ignore
+            TranscodeStore.open(transcode_cache_path, transcode_cache_size * 1_000_000)
+
+        try:
+            self._run(lib, opts, args)
+        finally:
+            # An error while parsing would otherwise leave the workers waiting forever
+            self._executor.shutdown()
+            ProbeCache.close()
+            QueryCache.close()
+            DefinitionCache.close()
+            TranscodeStore.close()
+        return None
 
-        cd_parser = CDParser(lib, opts, self.config, self._executor)
+    def _iter_cds(self, cd_parser: CDParser, args: list[str]) -> Iterator[CD]:
+        """
+        Loads CDs from the config, or from the paths given as arguments
+        """
         if len(args) == 0:
             # Load CDs from config
-            cds = cd_parser.from_config()
-        else:
-            # Load CDs from args
-            cds: list[CD] = []
-            for arg in args:
-                arg_path = Path(arg)
-                if not arg_path.exists():
-                    print(f"No such file or directory: {arg_path}")
-                    continue
-                arg_cds = cd_parser.from_path(arg_path)
-                cds.extend(arg_cds)
-        
+            yield from cd_parser.iter_from_config()
+            return
+
+        # Load CDs from args
+        for arg in args:
+            arg_path = Path(arg)
+            if not arg_path.exists():
+                print(f"No such file or directory: {arg_path}")
+                continue
+            yield from cd_parser.iter_from_path(arg_path)
+
+    def _run(self, lib: Library, opts: Values, args: list[str]):
+        cd_parser = CDParser(lib, opts, self.config, self._executor)
+        cds_iter = self._iter_cds(cd_parser, args)
+
+        if opts.plan:
+            self._plan(cds_iter)
+            return None
+
+        if opts.list_unused or opts.list_unused_paths:
+            # Finding unused tracks only needs the paths of the tracks in each CD
+            self._list_unused(lib, opts, cd_parser, args)
+            if not opts.list_empty:
+                return None
+
+        if not opts.list_empty:
+            policy_str: str = self.config["scheduling_policy"].get(str) if opts.scheduling_policy is None else opts.scheduling_policy # type: ignore
+            scheduling_window: int = self.config["scheduling_window"].get(int) # type: ignore
+            policy = SchedulingPolicy.from_str(policy_str, scheduling_window)
+            if policy is None:
+                self._executor.shutdown()
+                raise ValueError(f"Invalid scheduling_policy `{policy_str}`")
+
+            if opts.watch:
+                self._watch(lib, opts, args, policy)
+                return None
+
+            # CDs are populated as they're parsed, so duplicates must be found before any are
+            duplicates = cd_parser.find_duplicates([Path(arg) for arg in args] if len(args) > 0 else None)
+            if len(duplicates) > 0:
+                self._print_duplicates(duplicates)
+                self._executor.shutdown()
+                return None
+
+            fingerprints: Optional[CDFingerprints] = None
+            if not Config.dry and Config.state_path is not None:
+                fingerprints = CDFingerprints(Config.state_path)
+                if opts.changed:
+                    cd_parser.unchanged = fingerprints
+
+            # Most runs change nothing, which can be told without parsing a single CD.
+            # Runs of a few selected CDs can't tell anything about the rest
+            fingerprint: Optional[RunFingerprint] = None
+            inputs: Optional[RunInputs] = None
+            reason: Optional[str] = None
+            if not Config.dry and Config.state_path is not None and opts.only is None:
+                inputs = cd_parser.find_inputs([Path(arg) for arg in args] if len(args) > 0 else None)
+                fingerprint = RunFingerprint.create(
+                    inputs,
+                    [populate_config(self.config, opts), args],
+                    library_fingerprint(Path(os.fsdecode(lib.path)), os.fsdecode(lib.directory)),
+                )
+                last_run = LastRun.load(Config.state_path)
+                if last_run is None:
+                    reason = "There was no previous run to compare against."
+                else:
+                    changed = fingerprint.changed_inputs(last_run.fingerprint)
+                    if len(changed) == 0 and not opts.force:
+                        print(f"Nothing changed since the last run at {last_run.finished}. Its summary was:")
+                        for line in last_run.summary:
+                            print(line)
+                        self._executor.shutdown()
+                        return None
+                    if len(changed) > 0:
+                        reason = f"Changed since the last run: {", ".join(changed)}"
+
+            # CDs start populating while later CDs are still being parsed
+            summary = self._populate(cds_iter, opts.skip_cleanup, policy, fingerprints)
+            if cd_parser.unchanged_count > 0:
+                message = f"Unchanged CDs skipped: {cd_parser.unchanged_count}"
+                print(message)
+                summary.append(message)
+            if reason is not None:
+                print(reason)
+                summary.append(reason)
+
+            # A run that left anything undone must run again, even if nothing changes
+            if (
+                fingerprint is not None
+                and inputs is not None
+                and Config.state_path is not None
+                and cd_parser.error_count == 0
+                and Stats.tracks_failed == 0
+                and Stats.tasks_failed == 0
+            ):
+                # Populating changes the CD directories, the next run should compare against them as they're left
+                fingerprint.digests["cds"] = RunFingerprint.cd_tree_digest(inputs.cd_roots)
+                LastRun(fingerprint, summary, datetime.now().isoformat(sep=" ", timespec="seconds")).save(Config.state_path)
+            return None
+
+        cds = list(cds_iter)
+
         # Check if there's even any CDs to work with
         if len(cds) == 0:
             print("No CD definitions found!")
@@ -138,121 +409,356 @@ class CDManPlugin(BeetsPlugin):
         # Check if there are duplicate CD definitions
         duplicates = self._get_duplicates(cds)
         if len(duplicates) > 0:
-            print("Duplicate CD definitions found! Check your beets config and CD definition files for duplicate CD names.")
-            print(f"Duplicate CDs: {", ".join(duplicates)}")
+            self._print_duplicates(duplicates)
             self._executor.shutdown()
             return None
 
-        # Determine which subcommand is run
-        run_populate = True
-        if opts.list_unused or opts.list_unused_paths:
-            self._list_unused(lib, opts, cds)
-            run_populate = False
-        if opts.list_empty:
-            self._list_empty_cds(cds)
-            run_populate = False
-
-        if run_populate:
-            self._populate(cds, opts.skip_cleanup)
+        self._list_empty_cds(cds)
+        return None
 
+    def _watch(self, lib: Library, opts: Values, args: list[str], policy: SchedulingPolicy):
+        """
+        Populates CDs, then keeps watching their definitions, playlists, and the library,
+        populating the CDs that changed again shortly after each change.
+        Query results, parsed definitions and probe results stay in memory between populates.
+        """
+        assert Config.state_path is not None
+        fingerprints = CDFingerprints(Config.state_path) if not Config.dry else None
+        debounce = float(self.config["watch_debounce"].as_number()) # type: ignore
+        library_path = Path(os.fsdecode(lib.path)).absolute()
+        library_files = [library_path, library_path.with_name(library_path.name + "-wal")]
+        paths = [Path(arg) for arg in args] if len(args) > 0 else None
+
+        queries = LibraryQueries(lib)
+        watcher = Watcher()
+        try:
+            while True:
+                cd_parser = CDParser(lib, opts, self.config, self._executor, queries)
+                cd_parser.unchanged = fingerprints
+
+                # Watching starts before populating, so edits made while populating aren't missed
+                inputs = cd_parser.find_inputs(paths)
+                watcher.watch(inputs.definition_files + inputs.playlists + library_files, inputs.definition_dirs)
+                try:
+                    duplicates = cd_parser.find_duplicates(paths)
+                    if len(duplicates) > 0:
+                        self._print_duplicates(duplicates)
+                    else:
+                        Stats.reset()
+                        self._populate(self._iter_cds(cd_parser, args), opts.skip_cleanup, policy, fingerprints)
+                        if cd_parser.unchanged_count > 0:
+                            print(f"Unchanged CDs skipped: {cd_parser.unchanged_count}")
+                except Exception as e:
+                    # A broken definition shouldn't stop the watch, it gets fixed by editing it
+                    print(f"Error while populating CDs: {e}")
+
+                method = "inotify" if watcher.uses_inotify else "polling"
+                print(
+                    f"Watching {len(inputs.definition_files)} definition files, {len(inputs.playlists)} playlists, "
+                    f"and the beets library for changes with {method}. Press Ctrl+C to stop."
+                )
+                changed = watcher.wait(debounce)
+                print()
+                print(f"Changed: {", ".join(sorted(str(path) for path in changed))}")
+
+                if any(path in library_files for path in changed):
+                    # Earlier query results may no longer match the library
+                    self._open_query_cache(lib)
+                    queries = LibraryQueries(lib)
+
+                # Each populate shuts its executor down once it's done
+                self._executor.shutdown()
+                self._executor = self._create_executor(opts)
+        except KeyboardInterrupt:
+            print()
+            print("Stopped watching.")
+        finally:
+            watcher.close()
         return None
 
-    def _list_unused(self, lib: Library, opts: Values, cds: list[CD]):
+    def _iter_cd_sources(self, cd_parser: CDParser, args: list[str]) -> Iterator[list[TrackSource]]:
+        """
+        Finds the tracks of each CD from the config, or from the paths given as arguments
+        """
+        if len(args) == 0:
+            yield from cd_parser.iter_sources_from_config()
+            return
+
+        for arg in args:
+            arg_path = Path(arg)
+            if not arg_path.exists():
+                print(f"No such file or directory: {arg_path}")
+                continue
+            yield from cd_parser.iter_sources_from_path(arg_path)
+
+    def _list_unused(self, lib: Library, opts: Values, cd_parser: CDParser, args: list[str]):
         """
         Lists all tracks in the user's library that aren't used in any CDs
         """
-        # While the executor wasn't used, neglecting to shut it down will result in an infinite hang
-        with self._executor:
-            cd_track_paths = set([track.src_path for cd in cds for track in cd.get_tracks()])
+        # Only the paths of CD tracks are kept, rather than whole CDs
+        used_paths = set[bytes]()
+        cd_count = 0
+        for sources in self._iter_cd_sources(cd_parser, args):
+            cd_count += 1
+            used_paths.update(os.fsencode(source.path) for source in sources)
+        if cd_count == 0:
+            print("No CD definitions found!")
+            return None
 
-            parsed_query, _ = parse_query_string("", Item)
-            items = lib.items(parsed_query)
-            for item in items:
-                if item.filepath in cd_track_paths:
-                    continue
+        columns = ["path"] if opts.list_unused_paths else ["path", "artist", "album", "title"]
+        for item in LibraryQueries(lib).iter_all(columns):
+            if item["path"] in used_paths:
+                continue
 
-                # Either show the path or the default beet format for a track
-                if opts.list_unused_paths:
-                    print(item.filepath)
-                else:
-                    print(f"{item.get("artist")} - {item.get("album")} - {item.get("title")}")
+            # Either show the path or the default beet format for a track
+            if opts.list_unused_paths:
+                print(os.fsdecode(item["path"]))
+            else:
+                print(f"{item["artist"]} - {item["album"]} - {item["title"]}")
         return None
 
-    def _populate(self, cds: list[CD], skip_cleanup: bool):
+    def _populate(
+        self,
+        cds_iter: Iterable[CD],
+        skip_cleanup: bool,
+        policy: SchedulingPolicy,
+        fingerprints: Optional[CDFingerprints] = None,
+    ) -> list[str]:
         """
-        Populates all CDs with their defined tracks
+        Populates all CDs with their defined tracks.
+        Each CD is cleaned up and populated as soon as it has been parsed.
+        Returns a summary of the run.
+
+        :param fingerprints: Where CDs that were fully populated are recorded, so later runs can tell if they changed
         """
-        track_count = 0
-        for cd in cds:
-            track_count += len(cd.get_tracks())
+        Transcoder.reset()
 
         # Show the current status to the user
         self._summary_thread = Thread(
             target=self._summary_thread_function,
-            kwargs={
-                "track_count": track_count,
-            },
             name="Summary",
         )
         self._summary_thread.start()
 
-        # Prepare splits
+        # Each CD's splits are calculated as soon as it's done,
+        # from the sizes its tracks measured while populating
         cd_splits: dict[CD, Sequence[CDSplit]] = {}
         cd_splits_lock = Lock()
-        def split_job(cd: CD):
+        def finish_cd(cd: CD):
+            cd.save_manifest()
+            if Config.dry:
+                return
+            if fingerprints is not None and cd.fingerprint is not None:
+                # A CD that failed any track must be populated again, even if it doesn't change
+                if cd.is_fully_populated():
+                    fingerprints.record(cd.path, cd.fingerprint)
+                else:
+                    fingerprints.forget(cd.path)
             splits = cd.calculate_splits()
             with cd_splits_lock:
                 cd_splits[cd] = splits
 
-        with self._executor:
-            # Populate CDs
-            for cd in cds:
-                cd.numberize()
+        # Cleanups run on workers, but every CD's jobs are scheduled from this thread,
+        # so submitting them is held back by full queues and ordered across all CDs
+        ready_cds: Queue[tuple[CD, bool]] = Queue()
+        def prepare_job(cd: CD):
+            # Tracks must be in their new places before populating,
+            # otherwise moved tracks would be populated from scratch
+            prepared = False
+            try:
                 if not skip_cleanup:
-                    cd.cleanup()
-                cd.populate()
-
-            # Wait for all populates to finish before calculating splits
-            self._executor.wait()
-            if not Config.dry:
-                Stats.set_calculating()
-                for cd in cds:
-                    self._executor.submit(split_job, cd)
+                    cd.cleanup_now()
+                prepared = True
+            finally:
+                ready_cds.put((cd, prepared))
+
+        def skip_cd(cd: CD):
+            # A CD whose cleanup failed isn't populated, later runs must try it again
+            Stats.fail_task()
+            if fingerprints is not None:
+                fingerprints.forget(cd.path)
+
+        cds: list[CD] = []
+        def populate_jobs() -> Iterator[PopulateJob]:
+            preparing = 0
+            for cd in cds_iter:
+                cds.append(cd)
 
-        # Inform summary thread to exit
-        Stats.set_done()
-        self._summary_thread.join()
+                cd.numberize()
+                self._executor.submit_as(Resource.IO_READ, prepare_job, cd)
+                preparing += 1
+                # Start on CDs that are already cleaned up while the rest are parsed
+                while not ready_cds.empty():
+                    ready_cd, prepared = ready_cds.get()
+                    preparing -= 1
+                    if prepared:
+                        yield from ready_cd.get_populate_jobs(on_done=finish_cd)
+                    else:
+                        skip_cd(ready_cd)
+            while preparing > 0:
+                ready_cd, prepared = ready_cds.get()
+                preparing -= 1
+                if prepared:
+                    yield from ready_cd.get_populate_jobs(on_done=finish_cd)
+                else:
+                    skip_cd(ready_cd)
+
+        scheduler = Scheduler(self._executor, policy)
+        try:
+            with self._executor:
+                scheduler.schedule(populate_jobs())
+                self._executor.wait()
+        finally:
+            # Inform summary thread to exit, even if parsing a CD failed
+            Stats.set_done()
+            self._summary_thread.join()
+            if fingerprints is not None:
+                fingerprints.save()
+
+        # Everything reported from here on is kept with the run's fingerprint, after the stats already on screen
+        messages: list[str] = []
+        if len(cds) == 0:
+            messages.append("No CD definitions found!")
+        if Stats.tasks_failed > 0:
+            messages.append(f"Errors while populating: {Stats.tasks_failed}, the next run will try again")
 
         # Show user where CDs need to be split to fit on physical CDs.
         for cd in cd_splits:
             splits = cd_splits[cd]
             if len(splits) > 1:
-                print(f"`{cd.path.name}` is too big to fit on one CD! It must be split across multiple CDs like so:")
-                for i, split in enumerate(splits):
-                    path_start = split.start.dst_path.name
-                    path_end = split.end.dst_path.name
-                    if cd.pretty_type == "MP3":
-                        path_start = f"{split.start.dst_path.parent.name}{os.path.sep}{path_start}"
-                        path_end = f"{split.end.dst_path.parent.name}{os.path.sep}{path_end}"
-                    print(f"\t({i+1}/{len(splits)}): {path_start} -- {path_end}")
+                messages.append(f"`{cd.path.name}` is too big to fit on one CD! It must be split across multiple CDs like so:")
+                messages.extend(self._format_splits(cd, splits))
+        for line in messages:
+            print(line)
+
+        if len(cds) > 0:
+            if scheduler.achieved_makespan > 0:
+                print(f"Populating took {scheduler.achieved_makespan:.1f}s, the ideal for {self._executor.max_workers} threads is {scheduler.ideal_makespan:.1f}s")
+
+            print()
+            empty_messages = self._format_empty_cds(cds, report_none=False)
+            for line in empty_messages:
+                print(line)
+            messages.extend(empty_messages)
+            self._executor.shutdown()
+        return self._get_stats_summary() + messages
+
+    def _get_stats_summary(self) -> list[str]:
+        """
+        The final counts shown by the summary
+        """
+        with Stats.lock:
+            s = "s" if Stats.cds != 1 else ""
+            return [
+                f"Found {Stats.cds} CD{s}",
+                f"Tracks populated: {Stats.tracks_populated}",
+                f"Tracks skipped: {Stats.tracks_skipped}",
+                f"Tracks deleted: {Stats.tracks_deleted}",
+                f"Tracks moved: {Stats.tracks_moved}",
+                f"Tracks failed: {Stats.tracks_failed}",
+                f"Folders deleted: {Stats.folders_deleted}",
+                f"Folders moved: {Stats.folders_moved}",
+            ]
+
+    def _print_splits(self, cd: CD, splits: Sequence[CDSplit]):
+        for line in self._format_splits(cd, splits):
+            print(line)
+        return None
+
+    def _format_splits(self, cd: CD, splits: Sequence[CDSplit]) -> list[str]:
+        lines: list[str] = []
+        for i, split in enumerate(splits):
+            path_start = split.start.dst_path.name
+            path_end = split.end.dst_path.name
+            if cd.pretty_type == "MP3":
+                path_start = f"{split.start.dst_path.parent.name}{os.path.sep}{path_start}"
+                path_end = f"{split.end.dst_path.parent.name}{os.path.sep}{path_end}"
+            lines.append(f"\t({i+1}/{len(splits)}): {path_start} -- {path_end}")
+        return lines
+
+    def _plan(self, cds_iter: Iterable[CD]):
+        """
+        Estimates the size and splits of every CD from what's known about their sources,
+        without running ffmpeg, ffprobe, or touching the CDs themselves
+        """
+        # Bytes needed by the CDs on each filesystem, and where that filesystem was found
+        needed: dict[int, int] = {}
+        mount_paths: dict[int, Path] = {}
+
+        cds: list[CD] = []
+        cd_paths = set[Path]()
+        with self._executor:
+            for cd in cds_iter:
+                if cd.path in cd_paths:
+                    print(f"Skipping duplicate definition of `{cd.path.name}`")
+                    continue
+                cd_paths.add(cd.path)
+                cds.append(cd)
+                cd.numberize()
+
+                measures: dict[CDTrack, int] = {}
+                unknown = 0
+                disk_size = 0
+                for track in cd.get_tracks():
+                    src_stream = track.get_known_src_stream()
+                    if src_stream is None:
+                        unknown += 1
+                        src_stream = StreamInfo(DEFAULT_DURATION)
+                    measures[track] = track.estimate_measure(src_stream)
+                    disk_size += track.estimate_disk_size(measures[track])
+
+                splits = cd.calculate_splits(lambda track: measures[track])
+                total = sum(measures.values())
+                if cd.pretty_type == "MP3":
+                    size_str = f"{total / 1_000_000:.1f} MB"
+                else:
+                    size_str = f"{total // 60}:{total % 60:02d}"
+                print(f"`{cd.path.name}` ({cd.pretty_type}): {len(measures)} tracks, {size_str}, {len(splits)} CD(s)")
+                if len(splits) > 1:
+                    self._print_splits(cd, splits)
+                if unknown > 0:
+                    print(f"\t{unknown} tracks have no known length, assumed {DEFAULT_DURATION:.0f}s each")
+
+                # Whatever the CD already holds gets replaced
+                existing_path = cd.path
+                while not existing_path.exists():
+                    existing_path = existing_path.parent
+                device = existing_path.stat().st_dev
+                mount_paths.setdefault(device, existing_path)
+                needed[device] = needed.get(device, 0) + disk_size - dir_size(cd.path)
+
+        if len(cds) == 0:
+            print("No CD definitions found!")
+            return None
 
         print()
-        self._list_empty_cds(cds, report_none=False)
-        
+        for device, needed_size in needed.items():
+            free = shutil.disk_usage(mount_paths[device]).free
+            message = f"Populating needs {max(0, needed_size) / 1_000_000:.1f} MB more on the filesystem of {mount_paths[device]}, which has {free / 1_000_000:.1f} MB free"
+            if needed_size > free:
+                print(f"{message}. There isn't enough space!")
+            else:
+                print(message)
         return None
 
     def _list_empty_cds(self, cds: list[CD], *, report_none: bool = True):
+        for line in self._format_empty_cds(cds, report_none=report_none):
+            print(line)
+        self._executor.shutdown()
+
+    def _format_empty_cds(self, cds: list[CD], *, report_none: bool = True) -> list[str]:
+        lines: list[str] = []
         empty_cds: list[CD] = list(cd for cd in cds if cd.is_empty())
         if len(empty_cds) > 0:
-            print("These CDs contain no tracks! Check your definitions for these CDs:")
+            lines.append("These CDs contain no tracks! Check your definitions for these CDs:")
             for empty_cd in empty_cds:
-                print(f"\t{empty_cd.path.name} ({empty_cd.pretty_type})")
+                lines.append(f"\t{empty_cd.path.name} ({empty_cd.pretty_type})")
         elif report_none:
-            print("No empty CD definitions found.")
-        self._executor.shutdown()
+            lines.append("No empty CD definitions found.")
+        return lines
         
 
-    def _summary_thread_function(self, track_count: int):
+    def _summary_thread_function(self):
         """
         Shows the user the current state of populating
         """
@@ -261,7 +767,6 @@ class CDManPlugin(BeetsPlugin):
         # Loading indicators
         spinner = ["-", "\\", "|", "/"]
         dancing_dots = [".", "..", " ..", "  ..", "   ..", "    .", "    .", "   ..", "  ..", " ..", "..", "."]
-        ellipses = ["", ".", ".", "..", "..", "...", "...", "...", "..."]
 
         current_indicator = 0
         indicator_time = 0.1 if not Config.verbose else None
@@ -272,9 +777,7 @@ class CDManPlugin(BeetsPlugin):
                 Stats.changed_cond.wait(indicator_time)
 
             # Determine which loading indicator to use
-            if Stats.is_calculating:
-                indicator = ellipses
-            elif Stats.tracks_populating > 0:
+            if Stats.tracks_populating > 0:
                 indicator = spinner
             else:
                 indicator = dancing_dots
@@ -302,19 +805,21 @@ class CDManPlugin(BeetsPlugin):
                 p.print_line(7, f"Tracks failed: {Stats.tracks_failed}")
                 p.print_line(8, f"Folders deleted: {Stats.folders_deleted}")
                 p.print_line(9, f"Folders moved: {Stats.folders_moved}")
+                store_lookups = Stats.transcode_store_hits + Stats.transcode_store_misses
+                if store_lookups > 0:
+                    p.print_line(10, f"Transcode cache hits: {Stats.transcode_store_hits}/{store_lookups} ({Stats.transcode_store_hits / store_lookups:.1%})")
 
                 # Show loading indicator when not verbose
                 if not Config.verbose:
-                    if Stats.is_calculating:
-                        msg = f"Checking CD sizes{indicator[current_indicator]}"
+                    if Stats.tracks_populating > 0:
+                        msg = f"Tracks populating: {Stats.tracks_populating} {indicator[current_indicator] * Stats.tracks_populating}"
                     else:
-                        if Stats.tracks_populating > 0:
-                            msg = f"Tracks populating: {Stats.tracks_populating} {indicator[current_indicator] * Stats.tracks_populating}"
-                        else:
-                            msg = f"Searching for tracks{indicator[current_indicator]}"
-                    progress = (Stats.tracks_failed + Stats.tracks_populated + Stats.tracks_skipped) / track_count
+                        msg = f"Searching for tracks{indicator[current_indicator]}"
+                    # More tracks are found while CDs are still being parsed
+                    progress = (Stats.tracks_failed + Stats.tracks_populated + Stats.tracks_skipped) / max(1, Stats.tracks_found)
                     p.print_line(11, f"Progress: {progress:.1%}")
                     p.print_line(12, msg)
+                p.print_line(13, f"Peak memory: {peak_rss() / 1_048_576:.1f} MiB")
 
                 if Stats.is_done:
                     break
@@ -1,3 +1,11 @@
+from pathlib import Path
+from typing import Optional
+
+
 class Config:
     dry = False
     verbose = False
+    # Where cdman keeps its state between runs
+    state_path: Optional[Path] = None
+    # How many threads each ffmpeg process may use
+    ffmpeg_threads = 1
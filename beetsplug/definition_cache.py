@@ -0,0 +1,101 @@
+import json
+import os
+from pathlib import Path
+import sqlite3
+from threading import Lock
+from typing import Any, Optional
+
+
+# Bump this whenever the schema or the parsed form of definitions changes, old caches will be rebuilt
+_SCHEMA_VERSION = 2
+
+
+class DefinitionCache:
+    """
+    A persistent cache of parsed CD definition files, shared by every thread.
+
+    Entries are keyed by path, and are only valid while the file's
+    size and modification time remain unchanged.
+    Definitions are stored as JSON, so the cache can never run code when it's loaded.
+    When the cache isn't open, nothing is cached.
+    """
+
+    lock = Lock()
+    _connection: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def open(cls, db_path: Path):
+        """
+        Opens the cache database at `db_path`, creating it if needed.
+        """
+        with cls.lock:
+            if cls._connection is not None:
+                cls._connection.close()
+
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(db_path, check_same_thread=False)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != _SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS definitions")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS definitions (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            connection.commit()
+            cls._connection = connection
+        return None
+
+    @classmethod
+    def close(cls):
+        """
+        Writes any pending changes and closes the cache database.
+        """
+        with cls.lock:
+            if cls._connection is None:
+                return
+            cls._connection.commit()
+            cls._connection.close()
+            cls._connection = None
+        return None
+
+    @classmethod
+    def get(cls, path: Path, stat: os.stat_result) -> Optional[Any]:
+        """
+        Gets the parsed contents of a definition file, if it hasn't changed since it was cached.
+        """
+        with cls.lock:
+            if cls._connection is None:
+                return None
+            row = cls._connection.execute(
+                "SELECT data FROM definitions WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (str(path), stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    @classmethod
+    def put(cls, path: Path, stat: os.stat_result, data: Any):
+        """
+        Caches the parsed contents of a definition file.
+        Definitions JSON can't represent exactly, such as those with dates or numeric keys, aren't cached.
+        """
+        try:
+            text = json.dumps(data)
+        except (TypeError, ValueError):
+            return
+        if json.loads(text) != data:
+            return
+        with cls.lock:
+            if cls._connection is None:
+                return
+            cls._connection.execute(
+                "INSERT OR REPLACE INTO definitions VALUES (?, ?, ?, ?)",
+                (str(path), stat.st_size, stat.st_mtime_ns, text),
+            )
+        return None
@@ -1,9 +1,28 @@
 from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
 from queue import Queue
 import sys
+from threading import Condition, local
 from typing import Any, Callable, Optional
 
 
+class Resource(Enum):
+    """
+    What a task mostly spends its time on.
+    Each resource has its own workers, so tasks only compete with tasks of the same kind.
+
+    :param CPU: Encoding, and anything else without a better fit
+    :param IO_READ: Scanning and reading files, such as during cleanup
+    :param IO_WRITE: Writing file contents into CDs
+    :param META: Filesystem metadata operations, such as links, renames and deletes
+    """
+
+    CPU = "cpu"
+    IO_READ = "io-read"
+    IO_WRITE = "io-write"
+    META = "meta"
+
+
 class _Task:
     def __init__(self, fn: Callable, args: tuple[Any], kwargs: dict[str, Any]):
         self.fn = fn
@@ -22,38 +41,91 @@ class DimensionalThreadPoolExecutor:
         thread_name_prefix: str = "",
         initializer: Optional[Callable] = None,
         initargs: tuple = (),
+        resource_limits: Optional[dict[Resource, int]] = None,
+        max_queued: int = 0,
     ):
         """
         A wrapper around ThreadPoolExecutor that supports jobs submitting jobs.
-        
+
         The current implementation of ThreadPoolExecutor will simply not wait
         for jobs submitted from jobs to complete before shutting down.
-        This class implements a task queue that must be fully emptied before shutting down.
+        This class implements task queues that must be fully emptied before shutting down.
+
+        Tasks are submitted as a Resource, and each resource has its own queue and workers.
+        `max_workers` is the limit for CPU tasks, the others are set with `resource_limits`.
+        Tasks of resources without a limit are run as CPU tasks.
+
+        With `max_queued`, submitting from outside the executor blocks while a resource
+        already has that many tasks waiting, so producers can't run far ahead of the workers.
+        Tasks submitting tasks never block, as that could leave every worker waiting on itself.
         """
+        self._limits = {Resource.CPU: max_workers}
+        if resource_limits is not None:
+            self._limits.update((resource, limit) for resource, limit in resource_limits.items() if limit > 0)
+
         self._executor = ThreadPoolExecutor(
-            max_workers,
+            sum(self._limits.values()),
             thread_name_prefix=thread_name_prefix,
             initializer=initializer,
             initargs=initargs
         )
         self._max_workers = max_workers
-        self._tasks = Queue[Optional[_Task]]()
+        self._queues = {resource: Queue[Optional[_Task]]() for resource in self._limits}
+        self._max_queued = max_queued
+        self._queued = {resource: 0 for resource in self._limits}
+        self._space_cond = Condition()
+        self._worker = local()
+        # Tasks may submit tasks of other resources, so waiting on each queue in turn isn't enough
+        self._pending = 0
+        self._pending_cond = Condition()
         self._shutdown = False
 
         # Occupy each worker with a task loop
-        for _ in range(self._max_workers):
-            self._executor.submit(self._task_loop)
+        for resource, limit in self._limits.items():
+            for _ in range(limit):
+                self._executor.submit(self._task_loop, resource)
 
     @property
     def max_workers(self) -> int:
         return self._max_workers
 
+    def effective_resource(self, resource: Resource) -> Resource:
+        """
+        The resource whose workers run tasks submitted as `resource`
+        """
+        return resource if resource in self._limits else Resource.CPU
+
+    def limit(self, resource: Resource) -> int:
+        """
+        How many tasks of a resource can run at once
+        """
+        return self._limits[self.effective_resource(resource)]
+
     def submit(self, fn: Callable, /, *args, **kwargs):
-        self._tasks.put_nowait(_Task(fn, args, kwargs))
+        self.submit_as(Resource.CPU, fn, *args, **kwargs)
+
+    def submit_as(self, resource: Resource, fn: Callable, /, *args, **kwargs):
+        resource = self.effective_resource(resource)
+        with self._space_cond:
+            if self._max_queued > 0 and not self.is_worker_thread():
+                while self._queued[resource] >= self._max_queued:
+                    self._space_cond.wait()
+            self._queued[resource] += 1
+        with self._pending_cond:
+            self._pending += 1
+        self._queues[resource].put_nowait(_Task(fn, args, kwargs))
+
+    def is_worker_thread(self) -> bool:
+        """
+        Determines whether the calling thread is one of this executor's workers
+        """
+        return getattr(self._worker, "resource", None) is not None
 
     def wait(self):
         # Wait for all tasks to complete, including any that get submitted after this wait call
-        self._tasks.join()
+        with self._pending_cond:
+            while self._pending > 0:
+                self._pending_cond.wait()
 
     def shutdown(self):
         if self._shutdown:
@@ -62,20 +134,28 @@ class DimensionalThreadPoolExecutor:
         self.wait()
 
         # Signal task loops that they're done
-        for _ in range(self._max_workers):
-            self._tasks.put(None)
+        for resource, limit in self._limits.items():
+            for _ in range(limit):
+                self._queues[resource].put(None)
 
         # Cleanup executor
         self._executor.shutdown()
         self._shutdown = True
 
-    def _task_loop(self):
+    def _task_loop(self, resource: Resource):
+        self._worker.resource = resource
+        tasks = self._queues[resource]
         while True:
-            task = self._tasks.get()
+            task = tasks.get()
             if task is None:
                 # Shutdown was called and all tasks complete, we can rest now
                 break
 
+            # Make room for producers waiting to submit
+            with self._space_cond:
+                self._queued[resource] -= 1
+                self._space_cond.notify_all()
+
             try:
                 task.run()
             except BaseException as e:
@@ -83,8 +163,11 @@ class DimensionalThreadPoolExecutor:
                 sys.stderr.write(str(e))
                 sys.stderr.write("\n")
             finally:
-                # Signal to the Queue that a task was completed
-                self._tasks.task_done()
+                # Signal that a task was completed
+                with self._pending_cond:
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._pending_cond.notify_all()
 
     def __enter__(self):
         return self
@@ -0,0 +1,109 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+import os
+from threading import Condition
+import time
+import psutil
+
+from beetsplug.config import Config
+
+
+class EncodeLimiter:
+    """
+    Limits how many ffmpeg encodes run at once.
+
+    In adaptive mode the limit is tuned while encoding: every few seconds the encode
+    throughput (source bytes per second) is measured along with the system load,
+    and the limit is moved a step in whichever direction last improved throughput.
+    The limit always backs off while the CPUs are oversubscribed.
+    """
+
+    # How long throughput is measured before the limit is tuned again, in seconds
+    WINDOW = 5.0
+    # Load per CPU above which encodes are competing with each other for CPU time
+    OVERLOAD = 1.25
+
+    _cond = Condition()
+    _limit = os.cpu_count() or 1
+    _max_limit = _limit
+    _cpu_count = _limit
+    _adaptive = False
+    _active = 0
+    _direction = -1
+    _last_throughput: float = 0.0
+    _window_start = 0.0
+    _window_weight = 0
+
+    @classmethod
+    def configure(cls, max_encodes: int, cpu_count: int, adaptive: bool):
+        """
+        :param max_encodes: The most encodes that may ever run at once
+        :param cpu_count: The number of CPUs available, used to judge the system load
+        :param adaptive: Whether to tune the limit based on throughput and load
+        """
+        with cls._cond:
+            cls._max_limit = max(1, max_encodes)
+            cls._limit = cls._max_limit
+            cls._cpu_count = max(1, cpu_count)
+            cls._adaptive = adaptive
+            cls._direction = -1
+            cls._last_throughput = 0.0
+            cls._window_start = time.monotonic()
+            cls._window_weight = 0
+            cls._cond.notify_all()
+        return None
+
+    @classmethod
+    def limit(cls) -> int:
+        return cls._limit
+
+    @classmethod
+    @contextmanager
+    def slot(cls, weight: int) -> Iterator[None]:
+        """
+        Waits until another encode may run, and holds its place while encoding.
+
+        :param weight: How much work the encode is, in source bytes
+        """
+        with cls._cond:
+            while cls._active >= cls._limit:
+                cls._cond.wait()
+            cls._active += 1
+        try:
+            yield
+        finally:
+            with cls._cond:
+                cls._active -= 1
+                cls._window_weight += weight
+                if cls._adaptive:
+                    now = time.monotonic()
+                    elapsed = now - cls._window_start
+                    if elapsed >= cls.WINDOW:
+                        # psutil emulates the load average where the OS has none, like Windows
+                        cls._tune(cls._window_weight / elapsed, psutil.getloadavg()[0] / cls._cpu_count)
+                        cls._window_start = now
+                        cls._window_weight = 0
+                cls._cond.notify_all()
+
+    @classmethod
+    def _tune(cls, throughput: float, load: float):
+        """
+        Moves the limit a step based on the last measurement window.
+        Must be called while holding the lock.
+        """
+        if load > cls.OVERLOAD:
+            # Encodes are fighting over the CPUs, more of them can only make things worse
+            cls._direction = -1
+        elif throughput < cls._last_throughput * 0.95:
+            # The last step made things worse, go back the other way
+            cls._direction = -cls._direction
+        cls._last_throughput = throughput
+
+        limit = min(cls._max_limit, max(1, cls._limit + cls._direction))
+        if limit == cls._limit and load <= cls.OVERLOAD:
+            # Stuck against a bound, so try the other way next time
+            cls._direction = -cls._direction
+        if limit != cls._limit and Config.verbose:
+            print(f"Running up to {limit} encodes at once")
+        cls._limit = limit
+        return None
@@ -0,0 +1,83 @@
+from collections.abc import Callable
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+from magic import Magic
+
+
+# Extensions that are always treated as audio without looking inside the file
+AUDIO_EXTENSIONS = {
+    ".aac", ".aif", ".aiff", ".alac", ".ape", ".dsf", ".flac", ".m4a", ".mka",
+    ".mp3", ".mpc", ".oga", ".ogg", ".opus", ".wav", ".wma", ".wv",
+}
+
+# Extensions that are never treated as audio, such as ffmpeg logs and the manifest
+NON_AUDIO_EXTENSIONS = {
+    ".cue", ".gif", ".jpeg", ".jpg", ".json", ".log", ".m3u", ".m3u8",
+    ".nfo", ".pdf", ".png", ".tmp", ".txt", ".yaml", ".yml",
+}
+
+
+class FileClassifier:
+    """
+    Decides whether files found in CD directories are audio files.
+
+    Files are classified by extension first, then by whether cdman knows it made them,
+    and only then by reading their headers with libmagic.
+    Header reads are cached for as long as the file is unchanged.
+    """
+
+    _magic_lock = Lock()
+    _magic: Optional[Magic] = None
+    _cache_lock = Lock()
+    _cache: dict[tuple[int, int, int], bool] = {}
+
+    @classmethod
+    def is_audio(cls, path: Path, is_known: Optional[Callable[[Path], bool]] = None) -> bool:
+        """
+        :param is_known: Determines whether a path is known to be made by cdman
+        """
+        suffix = path.suffix.lower()
+        if suffix in AUDIO_EXTENSIONS:
+            return True
+        if suffix in NON_AUDIO_EXTENSIONS:
+            return False
+        if is_known is not None and is_known(path):
+            return True
+        return cls._sniff(path)
+
+    @classmethod
+    def _sniff(cls, path: Path) -> bool:
+        """
+        Reads the file's headers to determine whether it's an audio file
+        """
+        try:
+            # libmagic doesn't follow links, so links have to be classified by their target
+            stat = path.stat()
+        except OSError:
+            return False
+
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        with cls._cache_lock:
+            cached = cls._cache.get(key)
+        if cached is not None:
+            return cached
+
+        with cls._magic_lock:
+            if cls._magic is None:
+                cls._magic = Magic(mime=True)
+            try:
+                mimetype = cls._magic.from_file(str(path.resolve()))
+            except OSError:
+                return False
+
+        is_audio = mimetype.startswith("audio/")
+        with cls._cache_lock:
+            cls._cache[key] = is_audio
+        return is_audio
+
+    @classmethod
+    def clear(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
+        return None
@@ -0,0 +1,179 @@
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+import os
+from pathlib import Path
+import re
+from typing import Any, Optional
+from beets.dbcore.query import CollectionQuery, DateQuery, NotQuery, OrQuery, PathQuery, Period, Query
+from beets.library import Library, parse_query_string, Item
+from more_itertools import chunked
+
+from beetsplug.query_cache import QueryCache
+from beetsplug.stream_info import StreamInfo
+from beetsplug.track_source import TrackSource
+
+
+# Only the columns cdman needs, rather than everything that makes up an Item
+_COLUMNS = ["id", "path", "length", "bitrate", "samplerate", "format", "mtime"]
+# Query results are in the order tracks appear on their albums
+_ORDER = "disc, track, artist, album, id"
+# Anything that might be a relative date, such as the `-1w` in `added:-1w..`
+_MAYBE_RELATIVE_DATE = re.compile(r"[0-9][ymwd]")
+
+
+def _has_relative_date(query: Query) -> bool:
+    """
+    Checks whether a query matches dates relative to now, so its results change over time
+    """
+    if isinstance(query, DateQuery):
+        return any(re.match(Period.relative_re, part) for part in query.pattern.split("..", 1))
+    if isinstance(query, CollectionQuery):
+        return any(_has_relative_date(subquery) for subquery in query.subqueries)
+    if isinstance(query, NotQuery):
+        return _has_relative_date(query.subquery)
+    return False
+
+
+class LibraryQueries:
+    """
+    Runs the beets queries of a run in batches, remembering the results of each distinct query.
+
+    Queries that can be answered with SQL are combined into a single statement per batch,
+    which only selects the columns cdman needs and sorts in SQL.
+    Queries beets can only answer in Python, such as those on flexible attributes,
+    go through the library one at a time.
+    Results are also kept in the QueryCache, if it's open, so later runs can skip the library.
+    Queries on relative dates are never kept there, their results change even if the library doesn't.
+    """
+
+    # How many queries are combined into one statement, well below SQLite's compound SELECT limit
+    BATCH_SIZE = 100
+
+    def __init__(self, lib: Library):
+        self._lib = lib
+        self._results: dict[str, list[TrackSource]] = {}
+
+    def get(self, query: str) -> list[TrackSource]:
+        """
+        Finds the tracks matching a beets query, in album order
+        """
+        if query not in self._results:
+            self.prefetch([query])
+        return list(self._results[query])
+
+    def prefetch(self, queries: Iterable[str]):
+        """
+        Runs every query that hasn't been run yet, so later lookups don't touch the database
+        """
+        fast: list[tuple[str, Query]] = []
+        uncached = set[str]()
+        for query in dict.fromkeys(queries):
+            if query in self._results:
+                continue
+            # Most queries can't have relative dates, those don't need parsing to be looked up
+            parsed_query: Optional[Query] = None
+            if _MAYBE_RELATIVE_DATE.search(query) is not None:
+                parsed_query, _ = parse_query_string(query, Item)
+                if _has_relative_date(parsed_query):
+                    uncached.add(query)
+            if query not in uncached:
+                cached = QueryCache.get(query)
+                if cached is not None:
+                    self._results[query] = [self._to_source(item) for item in cached]
+                    continue
+
+            if parsed_query is None:
+                parsed_query, _ = parse_query_string(query, Item)
+            if parsed_query.clause()[0] is None:
+                self._store(query, self._fetch_slow(parsed_query), query not in uncached)
+            else:
+                fast.append((query, parsed_query))
+
+        for batch in chunked(fast, self.BATCH_SIZE):
+            results: list[list[dict[str, Any]]] = [[] for _ in batch]
+            for row in self._fetch([parsed_query for _, parsed_query in batch]):
+                results[row["query_index"]].append(self._from_row(row))
+            for (query, _), items in zip(batch, results):
+                self._store(query, items, query not in uncached)
+        return None
+
+    def _store(self, query: str, items: list[dict[str, Any]], cache: bool = True):
+        self._results[query] = [self._to_source(item) for item in items]
+        if cache:
+            QueryCache.put(query, items)
+        return None
+
+    def get_infos(self, paths: Sequence[Path]) -> dict[Path, Optional[StreamInfo]]:
+        """
+        Looks up what beets knows about each track path.
+        Paths that aren't in the library are mapped to None.
+        """
+        infos: dict[Path, Optional[StreamInfo]] = {path: None for path in paths}
+        for batch in chunked(infos.keys(), self.BATCH_SIZE):
+            query = OrQuery([PathQuery("path", os.fsencode(path)) for path in batch])
+            if query.clause()[0] is None:
+                items = self._fetch_slow(query)
+            else:
+                items = [self._from_row(row) for row in self._fetch([query])]
+            for item in items:
+                source = self._to_source(item)
+                if source.path in infos:
+                    infos[source.path] = source.info
+        return infos
+
+    def iter_all(self, columns: Sequence[str], page_size: int = 5000) -> Iterator[dict[str, Any]]:
+        """
+        Goes through every item in the library a page at a time, fetching only the given columns.
+        Paths are made absolute.
+        """
+        select = ", ".join(dict.fromkeys(["id"] + list(columns)))
+        last_id = 0
+        while True:
+            with self._lib.transaction() as tx:
+                rows = tx.query(f"SELECT {select} FROM items WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size))
+            if len(rows) == 0:
+                return
+            for row in rows:
+                item = {column: row[column] for column in columns}
+                if "path" in item:
+                    item["path"] = Item._type("path").from_sql(row["path"])
+                yield item
+            last_id = rows[-1]["id"]
+
+    def _fetch(self, queries: Sequence[Query]) -> list[Any]:
+        """
+        Runs several queries in one statement.
+        Each row's `query_index` tells which query it matched.
+        """
+        selects: list[str] = []
+        subvals: list[Any] = []
+        columns = ", ".join(f"items.{column}" for column in ["disc", "track", "artist", "album"] + _COLUMNS)
+        for i, query in enumerate(queries):
+            where, query_subvals = query.clause()
+            source = "items"
+            if query.field_names & Item.other_db_fields:
+                source += f" {Item.relation_join}"
+            # Group by id to avoid duplicates when joining with albums
+            selects.append(
+                f"SELECT {i} AS query_index, {columns} FROM ({source}) WHERE {where or 1} GROUP BY items.id"
+            )
+            subvals.extend(query_subvals)
+
+        sql = " UNION ALL ".join(selects) + f" ORDER BY query_index, {_ORDER}"
+        with self._lib.transaction() as tx:
+            return tx.query(sql, subvals)
+
+    def _fetch_slow(self, query: Query) -> list[dict[str, Any]]:
+        items = list(self._lib.items(query))
+        items.sort(key=lambda item: (int(item.get("disc") or 0), int(item.get("track") or 0)))
+        return [{column: item.get(column) for column in _COLUMNS} for item in items]
+
+    def _from_row(self, row: Any) -> dict[str, Any]:
+        """
+        Takes the columns cdman needs from a database row, with the path made absolute
+        """
+        item = {column: row[column] for column in _COLUMNS}
+        item["path"] = Item._type("path").from_sql(row["path"])
+        return item
+
+    def _to_source(self, item: Mapping[str, Any]) -> TrackSource:
+        return TrackSource(Path(os.fsdecode(item["path"])), StreamInfo.from_item(item))
@@ -0,0 +1,66 @@
+from pathlib import Path
+import re
+from typing import Optional, override
+
+from beetsplug.util import ffmpeg_loudness
+
+
+# The loudest a normalized track's true peak may get, in dBFS, leaving room for encoder overshoot
+PEAK_CEILING = -1.0
+# ebur128 reports silence as this integrated loudness, which must not be amplified
+SILENCE = -70.0
+
+_INTEGRATED_PATTERN = re.compile(r"I:\s+(-?(?:[\d.]+|inf)) LUFS")
+_PEAK_PATTERN = re.compile(r"Peak:\s+(-?(?:[\d.]+|inf)) dBFS")
+
+
+class Loudness:
+    """
+    The loudness of an audio stream, as measured by ffmpeg's ebur128 filter.
+    """
+
+    def __init__(self, integrated: float, true_peak: float):
+        # In LUFS
+        self.integrated = integrated
+        # In dBFS
+        self.true_peak = true_peak
+
+    @classmethod
+    def parse(cls, output: str) -> Optional["Loudness"]:
+        """
+        Reads the summary ebur128 prints at the end of its output.
+        Returns None if there's no summary.
+        """
+        # The summary comes last, after any loudness ebur128 logs while running
+        integrated = _INTEGRATED_PATTERN.findall(output)
+        peak = _PEAK_PATTERN.findall(output)
+        if len(integrated) == 0 or len(peak) == 0:
+            return None
+        return cls(float(integrated[-1]), float(peak[-1]))
+
+    def gain(self, target: float) -> float:
+        """
+        The gain in dB that brings this stream to `target` LUFS,
+        limited so the stream's peaks don't clip.
+        """
+        if self.integrated <= SILENCE:
+            return 0.0
+        return min(target - self.integrated, PEAK_CEILING - self.true_peak)
+
+    @override
+    def __str__(self) -> str:
+        return f"Loudness(integrated={self.integrated}, true_peak={self.true_peak})"
+
+
+def measure_loudness(path: Path) -> tuple[bool, Optional[Loudness]]:
+    """
+    Measures the loudness of a file's first audio stream.
+
+    Returns whether the measurement succeeded, and the loudness, if the file has any audio.
+    """
+    result = ffmpeg_loudness(path)
+    output = result.stderr.decode(errors="replace")
+    if result.returncode != 0:
+        # ffmpeg fails on files that have no audio stream to map
+        return "matches no streams" in output, None
+    return True, Loudness.parse(output)
@@ -0,0 +1,213 @@
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+from beetsplug.config import Config
+
+
+# Bump this whenever the manifest format changes, old manifests will be ignored
+_MANIFEST_VERSION = 1
+
+
+class ManifestEntry:
+    """
+    How a single file in a populated CD was made.
+    """
+
+    def __init__(
+        self,
+        src_path: str,
+        src_size: int,
+        src_mtime_ns: int,
+        signature: str,
+        dst_size: int,
+        dst_mtime_ns: int,
+        duration: float,
+    ):
+        self.src_path = src_path
+        self.src_size = src_size
+        self.src_mtime_ns = src_mtime_ns
+        # Describes how the file was populated, e.g. the populate mode or bitrate
+        self.signature = signature
+        self.dst_size = dst_size
+        self.dst_mtime_ns = dst_mtime_ns
+        self.duration = duration
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ManifestEntry":
+        return cls(
+            data["src_path"],
+            data["src_size"],
+            data["src_mtime_ns"],
+            data["signature"],
+            data["dst_size"],
+            data["dst_mtime_ns"],
+            data["duration"],
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "src_path": self.src_path,
+            "src_size": self.src_size,
+            "src_mtime_ns": self.src_mtime_ns,
+            "signature": self.signature,
+            "dst_size": self.dst_size,
+            "dst_mtime_ns": self.dst_mtime_ns,
+            "duration": self.duration,
+        }
+
+
+class Manifest:
+    """
+    Records how each file in a populated CD was made,
+    so unchanged tracks can be recognized with a couple of stat calls.
+
+    The manifest is stored in the CD directory, and is loaded the first time it's used.
+    """
+
+    FILE_NAME = ".cdman-manifest.json"
+
+    def __init__(self, cd_path: Path):
+        self._cd_path = cd_path
+        self._lock = Lock()
+        self._entries: Optional[dict[str, ManifestEntry]] = None
+        self._dirty = False
+
+    @property
+    def path(self) -> Path:
+        return self._cd_path / self.FILE_NAME
+
+    def _key(self, dst_path: Path) -> str:
+        return Path(os.path.relpath(dst_path, self._cd_path)).as_posix()
+
+    def _load(self) -> dict[str, ManifestEntry]:
+        """
+        Loads the manifest from disk, if it hasn't been loaded already.
+        Must be called while holding the lock.
+        """
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        try:
+            with self.path.open("r") as manifest_file:
+                data = json.load(manifest_file)
+            if data.get("version") == _MANIFEST_VERSION:
+                for key, entry_data in data["entries"].items():
+                    self._entries[key] = ManifestEntry.from_dict(entry_data)
+        except (OSError, ValueError, KeyError, TypeError):
+            # A missing or broken manifest just means every track gets checked the slow way
+            self._entries = {}
+        return self._entries
+
+    def get(self, dst_path: Path) -> Optional[ManifestEntry]:
+        with self._lock:
+            return self._load().get(self._key(dst_path))
+
+    def is_current(self, dst_path: Path, src_path: Path, signature: str) -> Optional[bool]:
+        """
+        Determines whether the file at `dst_path` is still an up to date copy of `src_path`.
+
+        Returns None if the manifest has no record of `dst_path`.
+        """
+        entry = self.get(dst_path)
+        if entry is None:
+            return None
+
+        if entry.src_path != str(src_path) or entry.signature != signature:
+            return False
+
+        try:
+            src_stat = src_path.stat()
+            dst_stat = dst_path.lstat()
+        except OSError:
+            return False
+
+        return (
+            src_stat.st_size == entry.src_size
+            and src_stat.st_mtime_ns == entry.src_mtime_ns
+            and dst_stat.st_size == entry.dst_size
+            and dst_stat.st_mtime_ns == entry.dst_mtime_ns
+        )
+
+    def record(self, dst_path: Path, src_path: Path, signature: str, duration: float):
+        """
+        Records that `dst_path` was just populated from `src_path`.
+        """
+        try:
+            src_stat = src_path.stat()
+            dst_stat = dst_path.lstat()
+        except OSError:
+            return
+
+        entry = ManifestEntry(
+            str(src_path),
+            src_stat.st_size,
+            src_stat.st_mtime_ns,
+            signature,
+            dst_stat.st_size,
+            dst_stat.st_mtime_ns,
+            duration,
+        )
+        with self._lock:
+            self._load()[self._key(dst_path)] = entry
+            self._dirty = True
+        return None
+
+    def remove(self, dst_path: Path):
+        """
+        Forgets about a file, or every file in a directory.
+        """
+        with self._lock:
+            entries = self._load()
+            key = self._key(dst_path)
+            for entry_key in list(entries.keys()):
+                if entry_key == key or entry_key.startswith(key + "/"):
+                    del entries[entry_key]
+                    self._dirty = True
+        return None
+
+    def move(self, src_path: Path, dst_path: Path):
+        """
+        Follows a file, or every file in a directory, to its new path.
+        """
+        with self._lock:
+            entries = self._load()
+            src_key = self._key(src_path)
+            dst_key = self._key(dst_path)
+            for entry_key in list(entries.keys()):
+                if entry_key == src_key:
+                    entries[dst_key] = entries.pop(entry_key)
+                elif entry_key.startswith(src_key + "/"):
+                    entries[dst_key + entry_key[len(src_key):]] = entries.pop(entry_key)
+                else:
+                    continue
+                self._dirty = True
+        return None
+
+    def save(self):
+        """
+        Writes the manifest to the CD directory, if anything changed.
+        """
+        if Config.dry:
+            return
+
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            if not self._cd_path.exists():
+                return
+
+            data = {
+                "version": _MANIFEST_VERSION,
+                "entries": {key: entry.to_dict() for key, entry in self._entries.items()},
+            }
+            # Write to a temporary file first so an interrupted save can't corrupt the manifest
+            tmp_path = self.path.with_suffix(".tmp")
+            with tmp_path.open("w") as manifest_file:
+                json.dump(data, manifest_file)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        return None
@@ -0,0 +1,84 @@
+from collections.abc import Sequence
+from itertools import accumulate
+
+
+def partition(sizes: Sequence[int], capacity: int) -> list[int]:
+    """
+    Splits a sequence of items into as few consecutive parts as possible that each fit
+    into `capacity`, then balances the parts so they're filled as evenly as possible.
+    Items bigger than `capacity` are given a part of their own.
+
+    Returns the exclusive end index of each part.
+    Runs in O(n log capacity), so it stays fast for tens of thousands of items.
+    """
+    n = len(sizes)
+    if n == 0:
+        return []
+
+    prefix = [0] + list(accumulate(sizes))
+    part_count = _count_parts(prefix, capacity)
+
+    # The smallest capacity that still fits into as few parts bounds how full the fullest part gets.
+    # Oversized items can push an even share above the real capacity, which must never be exceeded
+    low = min(max(1, -(-prefix[n] // part_count)), capacity)
+    high = capacity
+    while low < high:
+        middle = (low + high) // 2
+        if _count_parts(prefix, middle) <= part_count:
+            high = middle
+        else:
+            low = middle + 1
+    capacity = low
+
+    # Of the ways to fit that capacity, end each part as close as possible to an even share of what's left
+    needed = _parts_needed(prefix, capacity)
+    ends: list[int] = []
+    start = 0
+    for remaining in range(part_count, 0, -1):
+        target = prefix[start] + (prefix[n] - prefix[start]) / remaining
+        best = None
+        end = start + 1
+        while end <= n and (end == start + 1 or prefix[end] - prefix[start] <= capacity):
+            # The rest must still fit into the parts that are left, and ties fill earlier parts first
+            if needed[end] <= remaining - 1 and (
+                best is None or abs(prefix[end] - target) <= abs(prefix[best] - target)
+            ):
+                best = end
+            end += 1
+        assert best is not None
+        ends.append(best)
+        start = best
+        if start == n:
+            break
+    return ends
+
+
+def _count_parts(prefix: list[int], capacity: int) -> int:
+    """
+    Counts the parts a greedy first-fit makes, which is the fewest possible for consecutive parts
+    """
+    n = len(prefix) - 1
+    count = 0
+    start = 0
+    while start < n:
+        end = start + 1
+        while end < n and prefix[end + 1] - prefix[start] <= capacity:
+            end += 1
+        count += 1
+        start = end
+    return count
+
+
+def _parts_needed(prefix: list[int], capacity: int) -> list[int]:
+    """
+    Finds the fewest parts needed for every suffix of the items
+    """
+    n = len(prefix) - 1
+    needed = [0] * (n + 1)
+    end = n
+    for start in range(n - 1, -1, -1):
+        # Where a part starting here must end, at the latest
+        while prefix[end] - prefix[start] > capacity and end > start + 1:
+            end -= 1
+        needed[start] = needed[end] + 1
+    return needed
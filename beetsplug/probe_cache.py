@@ -0,0 +1,277 @@
+import os
+from pathlib import Path
+import sqlite3
+from threading import Lock
+import time
+from typing import Optional
+import ffmpeg
+
+from beetsplug.loudness import Loudness, measure_loudness
+from beetsplug.stream_info import StreamInfo
+
+
+# Bump this whenever the schema changes, old caches will be rebuilt
+_SCHEMA_VERSION = 2
+
+# How many writes are batched together before committing
+_COMMIT_INTERVAL = 500
+
+
+def _ffprobe(path: Path) -> tuple[bool, Optional[StreamInfo]]:
+    """
+    Probes a file for its first audio stream.
+
+    Returns whether the probe succeeded, and the found audio stream, if any.
+    """
+    try:
+        probe = ffmpeg.probe(str(path))
+    except ffmpeg.Error:
+        return False, None
+
+    stream = next((stream for stream in probe["streams"] if stream["codec_type"] == "audio"), None)
+    if stream is None:
+        return True, None
+    return True, StreamInfo.from_probe(stream)
+
+
+class ProbeCache:
+    """
+    A persistent cache of ffprobe results and loudness measurements, shared by every thread.
+
+    Entries are keyed by path, and are only valid while the file's
+    size, modification time, and inode remain unchanged.
+    When the cache isn't open, every probe goes straight to ffprobe.
+    """
+
+    lock = Lock()
+    _connection: Optional[sqlite3.Connection] = None
+    _max_entries = 0
+    _entry_count = 0
+    _pending_writes = 0
+
+    @classmethod
+    def open(cls, db_path: Path, max_entries: int, rebuild: bool = False):
+        """
+        Opens the cache database at `db_path`, creating it if needed.
+
+        :param max_entries: The number of entries to keep before evicting the least recently used
+        :param rebuild: Discards every existing entry
+        """
+        with cls.lock:
+            if cls._connection is not None:
+                cls._connection.close()
+
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(db_path, check_same_thread=False)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if rebuild or version != _SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS probes")
+                connection.execute("DROP TABLE IF EXISTS loudness")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS probes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    has_audio INTEGER NOT NULL,
+                    duration REAL,
+                    bit_rate INTEGER,
+                    codec TEXT,
+                    sample_rate INTEGER,
+                    last_used INTEGER NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS probes_last_used ON probes (last_used)")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS loudness (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    has_audio INTEGER NOT NULL,
+                    integrated REAL,
+                    true_peak REAL,
+                    last_used INTEGER NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS loudness_last_used ON loudness (last_used)")
+            connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            connection.commit()
+
+            cls._connection = connection
+            cls._max_entries = max_entries
+            cls._entry_count = cls._count_entries(connection)
+            cls._pending_writes = 0
+        return None
+
+    @classmethod
+    def close(cls):
+        """
+        Writes any pending changes and closes the cache database.
+        """
+        with cls.lock:
+            if cls._connection is None:
+                return
+            cls._connection.commit()
+            cls._connection.close()
+            cls._connection = None
+        return None
+
+    @classmethod
+    def probe(cls, path: Path, cached_only: bool = False) -> Optional[StreamInfo]:
+        """
+        Finds the first audio stream of a file, using the cache if the file hasn't changed.
+
+        :param cached_only: Return None rather than running ffprobe if the file isn't cached
+        """
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        with cls.lock:
+            if cls._connection is not None:
+                row = cls._connection.execute(
+                    "SELECT has_audio, duration, bit_rate, codec, sample_rate FROM probes "
+                    "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                    (str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino),
+                ).fetchone()
+                if row is not None:
+                    cls._connection.execute(
+                        "UPDATE probes SET last_used = ? WHERE path = ?",
+                        (time.time_ns(), str(path)),
+                    )
+                    cls._wrote()
+                    has_audio, duration, bit_rate, codec, sample_rate = row
+                    return StreamInfo(duration, bit_rate, codec, sample_rate) if has_audio else None
+
+        if cached_only:
+            return None
+
+        # Probe outside of the lock so other threads aren't held up by ffprobe
+        success, info = _ffprobe(path)
+        if not success:
+            # Don't remember failures, the file may still be in the middle of being written
+            return None
+
+        with cls.lock:
+            if cls._connection is not None:
+                cls._store(path, stat, info)
+        return info
+
+    @classmethod
+    def loudness(cls, path: Path) -> Optional[Loudness]:
+        """
+        Measures the loudness of a file's first audio stream, using the cache if the file hasn't changed.
+        Measuring decodes the whole file, so this is much slower than probing when not cached.
+        """
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        with cls.lock:
+            if cls._connection is not None:
+                row = cls._connection.execute(
+                    "SELECT has_audio, integrated, true_peak FROM loudness "
+                    "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                    (str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino),
+                ).fetchone()
+                if row is not None:
+                    cls._connection.execute(
+                        "UPDATE loudness SET last_used = ? WHERE path = ?",
+                        (time.time_ns(), str(path)),
+                    )
+                    cls._wrote()
+                    has_audio, integrated, true_peak = row
+                    return Loudness(integrated, true_peak) if has_audio else None
+
+        # Measure outside of the lock so other threads aren't held up by ffmpeg
+        success, loudness = measure_loudness(path)
+        if not success:
+            return None
+
+        with cls.lock:
+            if cls._connection is not None:
+                cls._connection.execute(
+                    "INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        str(path),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                        stat.st_ino,
+                        loudness is not None,
+                        loudness.integrated if loudness is not None else None,
+                        loudness.true_peak if loudness is not None else None,
+                        time.time_ns(),
+                    ),
+                )
+                cls._added()
+        return loudness
+
+    @classmethod
+    def _store(cls, path: Path, stat: os.stat_result, info: Optional[StreamInfo]):
+        assert cls._connection is not None
+        cls._connection.execute(
+            "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                str(path),
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+                info is not None,
+                info.duration if info is not None else None,
+                info.bit_rate if info is not None else None,
+                info.codec if info is not None else None,
+                info.sample_rate if info is not None else None,
+                time.time_ns(),
+            ),
+        )
+        cls._added()
+
+    @classmethod
+    def _added(cls):
+        # A replaced row doesn't change the number of entries, but there's no cheap way to tell.
+        # Overcounting only means eviction recounts a little sooner.
+        cls._entry_count += 1
+        if cls._entry_count > cls._max_entries:
+            cls._evict()
+        cls._wrote()
+
+    @classmethod
+    def _count_entries(cls, connection: sqlite3.Connection) -> int:
+        return sum(
+            connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("probes", "loudness")
+        )
+
+    @classmethod
+    def _evict(cls):
+        """
+        Removes the least recently used entries until the cache is below its size limit.
+        """
+        assert cls._connection is not None
+        cls._entry_count = cls._count_entries(cls._connection)
+        if cls._entry_count <= cls._max_entries:
+            return
+
+        # Evict a little extra so every insert doesn't trigger another eviction.
+        # Both tables share the limit, so evict from each in proportion to its size.
+        evict_count = cls._entry_count - int(cls._max_entries * 0.9)
+        for table in ("probes", "loudness"):
+            table_count = cls._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            cls._connection.execute(
+                f"DELETE FROM {table} WHERE path IN (SELECT path FROM {table} ORDER BY last_used LIMIT ?)",
+                (-(-evict_count * table_count // cls._entry_count),),
+            )
+        cls._entry_count = cls._count_entries(cls._connection)
+        return None
+
+    @classmethod
+    def _wrote(cls):
+        assert cls._connection is not None
+        cls._pending_writes += 1
+        if cls._pending_writes >= _COMMIT_INTERVAL:
+            cls._connection.commit()
+            cls._pending_writes = 0
+        return None
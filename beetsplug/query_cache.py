@@ -0,0 +1,158 @@
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+import sqlite3
+from threading import Lock
+from typing import Any, Optional
+
+
+# Bump this whenever the schema changes, old caches will be rebuilt
+_SCHEMA_VERSION = 1
+
+
+def library_fingerprint(library_path: Path, music_directory: str = "") -> Optional[str]:
+    """
+    Identifies the current state of a beets library database from its files alone.
+    Any write to the library changes the fingerprint.
+    Returns None if the library isn't a file.
+
+    :param music_directory: The library's music directory, which relative item paths depend on
+    """
+    parts: list[str] = [str(library_path), music_directory]
+    for path in (library_path, library_path.with_name(library_path.name + "-wal")):
+        try:
+            stat = path.stat()
+        except OSError:
+            if path == library_path:
+                return None
+            continue
+        parts.append(f"{stat.st_size}:{stat.st_mtime_ns}:{stat.st_ino}")
+    return "|".join(parts)
+
+
+class QueryCache:
+    """
+    A persistent cache of beets query results, shared by every thread.
+
+    Every result is thrown away as soon as the library database changes,
+    so an unchanged library can answer every query without being opened.
+    When the cache isn't open, nothing is cached.
+    """
+
+    lock = Lock()
+    _connection: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def open(cls, db_path: Path, library_path: Path, music_directory: str = ""):
+        """
+        Opens the cache database at `db_path`, creating it if needed.
+        Cached results are discarded if the library at `library_path` changed since they were cached.
+        """
+        fingerprint = library_fingerprint(library_path, music_directory)
+        with cls.lock:
+            if cls._connection is not None:
+                cls._connection.close()
+                cls._connection = None
+            if fingerprint is None:
+                # In-memory libraries can't be fingerprinted
+                return None
+
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(db_path, check_same_thread=False)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != _SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS state")
+                connection.execute("DROP TABLE IF EXISTS queries")
+                connection.execute("DROP TABLE IF EXISTS results")
+            connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS queries (query TEXT PRIMARY KEY)")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    query TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    item_id INTEGER NOT NULL,
+                    path BLOB NOT NULL,
+                    length REAL,
+                    bitrate INTEGER,
+                    samplerate INTEGER,
+                    format TEXT,
+                    mtime REAL,
+                    PRIMARY KEY (query, position)
+                )
+            """)
+            connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+            row = connection.execute("SELECT value FROM state WHERE key = 'library'").fetchone()
+            if row is None or row[0] != fingerprint:
+                connection.execute("DELETE FROM queries")
+                connection.execute("DELETE FROM results")
+                connection.execute("INSERT OR REPLACE INTO state VALUES ('library', ?)", (fingerprint,))
+            connection.commit()
+            cls._connection = connection
+        return None
+
+    @classmethod
+    def close(cls):
+        """
+        Writes any pending changes and closes the cache database.
+        """
+        with cls.lock:
+            if cls._connection is None:
+                return
+            cls._connection.commit()
+            cls._connection.close()
+            cls._connection = None
+        return None
+
+    @classmethod
+    def is_open(cls) -> bool:
+        return cls._connection is not None
+
+    @classmethod
+    def get(cls, query: str) -> Optional[list[dict[str, Any]]]:
+        """
+        Gets the cached results of a query, in the same form they were cached.
+        Returns None if the query isn't cached.
+        """
+        with cls.lock:
+            if cls._connection is None:
+                return None
+            if cls._connection.execute("SELECT 1 FROM queries WHERE query = ?", (query,)).fetchone() is None:
+                return None
+            cursor = cls._connection.execute(
+                "SELECT item_id AS id, path, length, bitrate, samplerate, format, mtime FROM results "
+                "WHERE query = ? ORDER BY position",
+                (query,),
+            )
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @classmethod
+    def put(cls, query: str, items: Sequence[Mapping[str, Any]]):
+        """
+        Caches the results of a query.
+
+        :param items: The `id`, absolute `path`, and stream columns of each matching item, in order
+        """
+        with cls.lock:
+            if cls._connection is None:
+                return
+            cls._connection.execute("INSERT OR REPLACE INTO queries VALUES (?)", (query,))
+            cls._connection.execute("DELETE FROM results WHERE query = ?", (query,))
+            cls._connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        query,
+                        position,
+                        item["id"],
+                        item["path"],
+                        item["length"],
+                        item["bitrate"],
+                        item["samplerate"],
+                        item["format"],
+                        item["mtime"],
+                    )
+                    for position, item in enumerate(items)
+                ),
+            )
+        return None
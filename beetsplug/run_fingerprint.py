@@ -0,0 +1,261 @@
+from collections.abc import Iterable, Mapping
+import hashlib
+import json
+from optparse import Values
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+from confuse import ConfigView
+
+
+# Bump this whenever what goes into a fingerprint changes, old fingerprints will never match
+_FINGERPRINT_VERSION = 1
+
+# Config values that only change how fast CDs are populated, not what ends up in them
+_RUNTIME_CONFIG_KEYS = {
+    "threads",
+    "probe_cache_size",
+    "query_cache",
+    "transcode_cache_path",
+    "transcode_cache_size",
+    "ffmpeg_batch_size",
+    "ffmpeg_threads",
+    "adaptive_concurrency",
+    "scheduling_policy",
+    "scheduling_window",
+    "max_queued_tasks",
+    "io_read_threads",
+    "io_write_threads",
+    "meta_threads",
+}
+
+# What each input of a run is called when telling the user it changed
+INPUT_NAMES = {
+    "definitions": "CD definition files",
+    "playlists": "playlists",
+    "config": "config",
+    "library": "beets library",
+    "cds": "CD directories",
+}
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def populate_config(config: ConfigView, opts: Values, *, include_definitions: bool = True) -> dict[str, Any]:
+    """
+    Gathers every config value and command-line option that affects what ends up in the CDs
+
+    :param include_definitions: Whether the CDs defined in the config, and the definition files it lists, are included
+    """
+    excluded = _RUNTIME_CONFIG_KEYS if include_definitions else _RUNTIME_CONFIG_KEYS | {"cds", "cd_files"}
+    return {
+        "config": {key: value for key, value in config.flatten().items() if key not in excluded},
+        "bitrate": getattr(opts, "bitrate", None),
+        "populate_mode": getattr(opts, "populate_mode", None),
+        "skip_cleanup": bool(getattr(opts, "skip_cleanup", False)),
+    }
+
+
+def cd_fingerprint(definition: Any, config: Any, playlists: Iterable[Path], sources: Iterable[tuple[Path, Optional[float]]]) -> str:
+    """
+    Identifies a single CD by its definition, the config it was parsed with,
+    the playlists it uses, and the tracks it resolved to.
+
+    :param sources: The path of each track, and its modification time as known by the library
+    """
+    return _digest([
+        _FINGERPRINT_VERSION,
+        definition,
+        config,
+        [[str(path), _stat_state(path)] for path in playlists],
+        [[str(path), mtime] for path, mtime in sources],
+    ])
+
+
+def _stat_state(path: Path) -> Optional[list[int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _tree_state(root: Path) -> Optional[list[Any]]:
+    """
+    The modification times of a directory and everything directly inside it
+    """
+    try:
+        entries = [[".", root.stat().st_mtime_ns]]
+        with os.scandir(root) as children:
+            for child in children:
+                entries.append([child.name, child.stat(follow_symlinks=False).st_mtime_ns])
+    except OSError:
+        return None
+    return sorted(entries)
+
+
+class RunInputs:
+    """
+    The files a run depends on, besides the config and the beets library.
+    """
+
+    def __init__(
+        self,
+        definition_files: list[Path],
+        playlists: list[Path],
+        cd_roots: list[Path],
+        definition_dirs: Optional[list[Path]] = None,
+    ):
+        self.definition_files = definition_files
+        self.playlists = playlists
+        # The directories CDs are created in
+        self.cd_roots = cd_roots
+        # The directories searched for definition files, where new ones may appear
+        self.definition_dirs = definition_dirs if definition_dirs is not None else []
+
+
+class RunFingerprint:
+    """
+    Identifies the state of everything a populate run depends on, with a digest per input,
+    so a run can tell what changed since the last one.
+
+    Inputs that can't be identified, such as in-memory libraries, are always considered changed.
+    """
+
+    def __init__(self, digests: Mapping[str, Optional[str]]):
+        self.digests = dict(digests)
+
+    @classmethod
+    def create(cls, inputs: RunInputs, config: Any, library: Optional[str]) -> "RunFingerprint":
+        """
+        :param config: Every config value and command-line option that affects how CDs are populated
+        :param library: The library's fingerprint, or None if it can't be identified
+        """
+        return cls({
+            "definitions": _digest([[str(path), _stat_state(path)] for path in inputs.definition_files]),
+            "playlists": _digest([[str(path), _stat_state(path)] for path in inputs.playlists]),
+            "config": _digest([_FINGERPRINT_VERSION, config]),
+            "library": _digest(library) if library is not None else None,
+            "cds": cls.cd_tree_digest(inputs.cd_roots),
+        })
+
+    @staticmethod
+    def cd_tree_digest(cd_roots: Iterable[Path]) -> str:
+        """
+        Identifies the top level of every directory CDs are created in
+        """
+        return _digest([[str(root), _tree_state(root)] for root in cd_roots])
+
+    def changed_inputs(self, previous: "RunFingerprint") -> list[str]:
+        """
+        Names every input that changed since `previous` was taken
+        """
+        return [
+            INPUT_NAMES.get(key, key)
+            for key, digest in self.digests.items()
+            if digest is None or previous.digests.get(key) != digest
+        ]
+
+
+class LastRun:
+    """
+    The fingerprint and summary of the last successful populate run.
+    """
+
+    FILE_NAME = "last_run.json"
+
+    def __init__(self, fingerprint: RunFingerprint, summary: list[str], finished: str):
+        self.fingerprint = fingerprint
+        self.summary = summary
+        # When the run finished, as an ISO 8601 timestamp
+        self.finished = finished
+
+    @classmethod
+    def load(cls, state_path: Path) -> Optional["LastRun"]:
+        """
+        Loads the last run from the state directory.
+        Returns None if there's no record of a previous run.
+        """
+        try:
+            with (state_path / cls.FILE_NAME).open("r") as file:
+                data = json.load(file)
+            if data.get("version") != _FINGERPRINT_VERSION:
+                return None
+            return cls(RunFingerprint(data["digests"]), list(data["summary"]), data["finished"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # A missing or broken record just means the next run goes ahead
+            return None
+
+    def save(self, state_path: Path):
+        data = {
+            "version": _FINGERPRINT_VERSION,
+            "digests": self.fingerprint.digests,
+            "summary": self.summary,
+            "finished": self.finished,
+        }
+        state_path.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so an interrupted save can't corrupt the record
+        path = state_path / self.FILE_NAME
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+        return None
+
+
+class CDFingerprints:
+    """
+    The fingerprint of every CD as it was when it was last fully populated, kept in the state directory.
+    """
+
+    FILE_NAME = "cd_fingerprints.json"
+
+    def __init__(self, state_path: Path):
+        self._path = state_path / self.FILE_NAME
+        self._lock = Lock()
+        self._fingerprints: dict[str, str] = {}
+        self._dirty = False
+        try:
+            with self._path.open("r") as file:
+                data = json.load(file)
+            if data.get("version") == _FINGERPRINT_VERSION:
+                self._fingerprints = dict(data["cds"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # A missing or broken record just means every CD counts as changed
+            self._fingerprints = {}
+
+    def is_current(self, cd_path: Path, fingerprint: str) -> bool:
+        with self._lock:
+            return self._fingerprints.get(str(cd_path)) == fingerprint
+
+    def record(self, cd_path: Path, fingerprint: str):
+        with self._lock:
+            if self._fingerprints.get(str(cd_path)) != fingerprint:
+                self._fingerprints[str(cd_path)] = fingerprint
+                self._dirty = True
+        return None
+
+    def forget(self, cd_path: Path):
+        with self._lock:
+            if self._fingerprints.pop(str(cd_path), None) is not None:
+                self._dirty = True
+        return None
+
+    def save(self):
+        """
+        Writes the fingerprints to the state directory, if anything changed.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": _FINGERPRINT_VERSION, "cds": self._fingerprints}
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._path.with_suffix(".tmp")
+            with tmp_path.open("w") as file:
+                json.dump(data, file)
+            os.replace(tmp_path, self._path)
+            self._dirty = False
+        return None
@@ -0,0 +1,238 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+import heapq
+from threading import Lock
+import time
+from typing import Any, Callable, Optional, override
+
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor, Resource
+from beetsplug.stats import Stats
+from beetsplug.stream_info import StreamInfo
+
+
+# Costs are estimated in seconds of work for a single worker.
+# They only need to be right relative to each other for scheduling to work well.
+
+# How many times faster than real time ffmpeg converts audio, before codec factors
+ENCODE_SPEED = 40.0
+# How much slower decoding each source codec is than decoding FLAC
+DECODE_FACTORS = {
+    "flac": 1.0,
+    "mp3": 1.1,
+    "alac": 1.1,
+    "wavpack": 1.2,
+    "vorbis": 1.3,
+    "aac": 1.4,
+    "opus": 1.5,
+    "ape": 2.5,
+}
+# How much faster than an encode a stream copy is
+COPY_SPEEDUP = 20.0
+# The speed of copying a file, in bytes per second
+COPY_RATE = 100_000_000
+# Linking is a single metadata operation
+LINK_COST = 0.001
+# Assumed when nothing is known about a track, the length of a typical song
+DEFAULT_DURATION = 240.0
+
+
+def encode_cost(info: Optional[StreamInfo], *, copy: bool = False) -> float:
+    """
+    Estimates the cost of converting a track with ffmpeg
+    """
+    duration = info.duration if info is not None else DEFAULT_DURATION
+    codec = info.codec if info is not None else None
+    cost = duration / ENCODE_SPEED * DECODE_FACTORS.get(codec or "", 1.5)
+    return cost / COPY_SPEEDUP if copy else cost
+
+
+def copy_cost(info: Optional[StreamInfo]) -> float:
+    """
+    Estimates the cost of copying a track, using its bit rate to guess its size
+    """
+    duration = info.duration if info is not None else DEFAULT_DURATION
+    bit_rate = info.bit_rate if info is not None and info.bit_rate is not None else 1_000_000
+    return duration * bit_rate / 8 / COPY_RATE
+
+
+class PopulateJob:
+    """
+    A unit of populate work, along with an estimate of how long it takes
+    and the resource it mostly uses
+    """
+
+    def __init__(self, cost: float, fn: Callable, /, *args: Any, resource: Resource = Resource.CPU):
+        self.cost = cost
+        self.resource = resource
+        self._fn = fn
+        self._args = args
+
+    def run(self):
+        self._fn(*self._args)
+
+
+class JobGroup:
+    """
+    Calls `on_done` once every job added to the group has finished,
+    and the group has been closed to new jobs.
+    """
+
+    def __init__(self, on_done: Callable[[], None]):
+        self._on_done = on_done
+        self._lock = Lock()
+        self._pending = 0
+        self._closed = False
+        self._finished = False
+
+    def add(self, job: PopulateJob) -> PopulateJob:
+        """
+        Wraps a job so the group knows when it finishes
+        """
+        with self._lock:
+            self._pending += 1
+        return PopulateJob(job.cost, self._run, job, resource=job.resource)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._check()
+        return None
+
+    def _run(self, job: PopulateJob):
+        try:
+            job.run()
+        except BaseException:
+            # The executor reports the error, but the run must still know something went wrong
+            Stats.fail_task()
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._check()
+
+    def _check(self):
+        with self._lock:
+            if not self._closed or self._pending > 0 or self._finished:
+                return
+            self._finished = True
+        self._on_done()
+
+
+class SchedulingPolicy(ABC):
+    """
+    Decides the order populate jobs are started in
+    """
+
+    @abstractmethod
+    def order(self, jobs: Iterable[PopulateJob]) -> Iterator[PopulateJob]:
+        """
+        Yields jobs in the order they should start.
+        Jobs are pulled from `jobs` lazily, as they're needed.
+        """
+        pass
+
+    @classmethod
+    def from_str(cls, string: str, window: int = 0) -> Optional["SchedulingPolicy"]:
+        """
+        Parses a policy name.
+        If the provided string does not match any policy, this function returns None
+
+        :param window: How many jobs a policy may look ahead at, 0 for all of them
+        """
+        match string.lower():
+            case "longest_first":
+                return LongestFirstPolicy(window)
+            case "definition_order":
+                return DefinitionOrderPolicy()
+            case _:
+                return None
+
+
+class LongestFirstPolicy(SchedulingPolicy):
+    """
+    Starts the most expensive jobs first, so no long job is left to run alone at the end.
+
+    With a window, only that many jobs are held at once, and the most expensive
+    of them starts whenever another job is pulled in.
+    """
+
+    def __init__(self, window: int = 0):
+        self._window = window
+
+    @override
+    def order(self, jobs: Iterable[PopulateJob]) -> Iterator[PopulateJob]:
+        # The index keeps jobs of equal cost in definition order
+        heap: list[tuple[float, int, PopulateJob]] = []
+        for i, job in enumerate(jobs):
+            heapq.heappush(heap, (-job.cost, i, job))
+            if 0 < self._window <= len(heap):
+                yield heapq.heappop(heap)[2]
+        while len(heap) > 0:
+            yield heapq.heappop(heap)[2]
+
+
+class DefinitionOrderPolicy(SchedulingPolicy):
+    """
+    Starts jobs in the order their CDs and tracks are defined
+    """
+
+    @override
+    def order(self, jobs: Iterable[PopulateJob]) -> Iterator[PopulateJob]:
+        return iter(jobs)
+
+
+class Scheduler:
+    """
+    Submits populate jobs to an executor in the order chosen by a policy,
+    and measures how long they take.
+    """
+
+    def __init__(self, executor: DimensionalThreadPoolExecutor, policy: SchedulingPolicy):
+        self._executor = executor
+        self._policy = policy
+        self._lock = Lock()
+        self._start: Optional[float] = None
+        self._end = 0.0
+        self._busy_times: dict[Resource, float] = {}
+        self._longest_job = 0.0
+
+    def schedule(self, jobs: Iterable[PopulateJob]):
+        if self._start is None:
+            self._start = time.monotonic()
+        for job in self._policy.order(jobs):
+            self._executor.submit_as(job.resource, self._run, job)
+        return None
+
+    def _run(self, job: PopulateJob):
+        start = time.monotonic()
+        try:
+            job.run()
+        finally:
+            end = time.monotonic()
+            with self._lock:
+                resource = self._executor.effective_resource(job.resource)
+                self._busy_times[resource] = self._busy_times.get(resource, 0.0) + end - start
+                self._longest_job = max(self._longest_job, end - start)
+                self._end = max(self._end, end)
+
+    @property
+    def achieved_makespan(self) -> float:
+        """
+        How long it took from scheduling the first job to finishing the last one, in seconds
+        """
+        if self._start is None:
+            return 0.0
+        return max(0.0, self._end - self._start)
+
+    @property
+    def ideal_makespan(self) -> float:
+        """
+        The shortest the jobs could have possibly taken with this many workers, in seconds.
+        No schedule can beat either each resource's work split perfectly between its workers, or the longest job.
+        """
+        return max(
+            [self._longest_job] + [
+                busy_time / self._executor.limit(resource)
+                for resource, busy_time in self._busy_times.items()
+            ]
+        )
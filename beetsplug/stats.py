@@ -11,16 +11,21 @@ class Stats:
     tracks_deleted = 0
     tracks_moved = 0
     tracks_failed = 0
+    # Populate work that raised, rather than failing a track the usual way
+    tasks_failed = 0
     folders_deleted = 0
     folders_moved = 0
+    transcode_store_hits = 0
+    transcode_store_misses = 0
     cds = 0
+    tracks_found = 0
     is_done = False
-    is_calculating = False
 
     @classmethod
-    def found_cd(cls, cd_name: str, cd_type: str):
+    def found_cd(cls, cd_name: str, cd_type: str, track_count: int = 0):
         with cls.lock:
             cls.cds += 1
+            cls.tracks_found += track_count
         cls._notify()
 
     @classmethod
@@ -61,6 +66,12 @@ class Stats:
             cls.tracks_populating -= 1
         cls._notify()
 
+    @classmethod
+    def fail_task(cls):
+        with cls.lock:
+            cls.tasks_failed += 1
+        cls._notify()
+
     @classmethod
     def delete_folder(cls):
         with cls.lock:
@@ -74,15 +85,21 @@ class Stats:
         cls._notify()
 
     @classmethod
-    def set_done(cls):
+    def transcode_store_hit(cls):
         with cls.lock:
-            cls.is_done = True
+            cls.transcode_store_hits += 1
         cls._notify()
 
     @classmethod
-    def set_calculating(cls):
+    def transcode_store_miss(cls):
         with cls.lock:
-            cls.is_calculating = True
+            cls.transcode_store_misses += 1
+        cls._notify()
+
+    @classmethod
+    def set_done(cls):
+        with cls.lock:
+            cls.is_done = True
         cls._notify()
 
     @classmethod
@@ -93,10 +110,15 @@ class Stats:
             cls.tracks_deleted = 0
             cls.tracks_moved = 0
             cls.tracks_failed = 0
+            cls.tasks_failed = 0
             cls.folders_deleted = 0
             cls.folders_moved = 0
+            cls.transcode_store_hits = 0
+            cls.transcode_store_misses = 0
+            cls.tracks_populating = 0
+            cls.cds = 0
+            cls.tracks_found = 0
             cls.is_done = False
-            cls.is_calculating = False
         cls._notify()
 
     @classmethod
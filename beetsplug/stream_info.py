@@ -0,0 +1,95 @@
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Optional, override
+from beets.library import Item
+
+
+# Maps beets' format names to the codec names reported by ffprobe
+_FORMAT_CODECS = {
+    "aac": "aac",
+    "alac": "alac",
+    "ape": "ape",
+    "flac": "flac",
+    "mp3": "mp3",
+    "musepack": "musepack",
+    "ogg": "vorbis",
+    "opus": "opus",
+    "wavpack": "wavpack",
+    "windows media": "wmav2",
+}
+
+
+class StreamInfo:
+    """
+    The properties of an audio stream that cdman makes decisions with.
+    """
+
+    def __init__(
+        self,
+        duration: float,
+        bit_rate: Optional[int] = None,
+        codec: Optional[str] = None,
+        sample_rate: Optional[int] = None,
+        mtime: Optional[float] = None,
+    ):
+        self.duration = duration
+        self.bit_rate = bit_rate
+        self.codec = codec
+        self.sample_rate = sample_rate
+        # The modification time of the file when this info was gathered, if known
+        self.mtime = mtime
+
+    @classmethod
+    def from_probe(cls, stream: dict[str, Any]) -> "StreamInfo":
+        """
+        Creates a StreamInfo from an audio stream found by ffprobe
+        """
+        bit_rate = stream.get("bit_rate")
+        sample_rate = stream.get("sample_rate")
+        codec = stream.get("codec_name")
+        return cls(
+            float(stream.get("duration", 0.0)),
+            int(bit_rate) if bit_rate is not None else None,
+            codec.lower() if codec is not None else None,
+            int(sample_rate) if sample_rate is not None else None,
+        )
+
+    @classmethod
+    def from_item(cls, item: Item | Mapping[str, Any]) -> Optional["StreamInfo"]:
+        """
+        Creates a StreamInfo from the metadata beets stores for an item,
+        either as an Item or as the columns of its database row.
+        Returns None if beets doesn't know enough about the item.
+        """
+        length = item.get("length")
+        if not length:
+            return None
+
+        bit_rate = item.get("bitrate")
+        sample_rate = item.get("samplerate")
+        item_format: str = item.get("format") or ""
+        return cls(
+            float(length),
+            int(bit_rate) if bit_rate else None,
+            _FORMAT_CODECS.get(item_format.lower(), item_format.lower() or None),
+            int(sample_rate) if sample_rate else None,
+            float(item.get("mtime") or 0.0),
+        )
+
+    def is_current(self, path: Path) -> bool:
+        """
+        Determines whether this info still describes the file at `path`.
+        Info without a known modification time is always considered current.
+        """
+        if self.mtime is None:
+            return True
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        # beets stores modification times truncated to the second
+        return int(stat.st_mtime) == int(self.mtime)
+
+    @override
+    def __str__(self) -> str:
+        return f"StreamInfo(duration={self.duration}, bit_rate={self.bit_rate}, codec={self.codec}, sample_rate={self.sample_rate})"
@@ -0,0 +1,19 @@
+from pathlib import Path
+from typing import Optional, override
+
+from beetsplug.stream_info import StreamInfo
+
+
+class TrackSource:
+    """
+    A track found from a CD definition, before it's placed into a CD.
+    """
+
+    def __init__(self, path: Path, info: Optional[StreamInfo] = None):
+        self.path = path
+        # What beets knows about the track, if it's in the library
+        self.info = info
+
+    @override
+    def __str__(self) -> str:
+        return f"TrackSource(path={self.path}, info={self.info})"
@@ -0,0 +1,150 @@
+import hashlib
+import os
+from pathlib import Path
+from threading import Lock
+import time
+from typing import Optional
+
+from beetsplug.stats import Stats
+from beetsplug.util import link_or_copy
+
+
+class TranscodeStore:
+    """
+    A persistent, content-addressed store of finished encodes, shared between runs.
+
+    Encodes are keyed by the identity of their source file and the encoder arguments used,
+    and are materialized into CDs with hard links or reflinks whenever possible.
+    Once the store grows past its size limit, the least recently used encodes are evicted.
+    Access times are tracked with each file's atime, since the mtime is shared with
+    any CD file hard linked to it.
+    """
+
+    _lock = Lock()
+    _root: Optional[Path] = None
+    _max_size = 0
+    _size = 0
+
+    @classmethod
+    def open(cls, root: Path, max_size: int):
+        """
+        :param root: The directory encodes are stored in
+        :param max_size: The maximum size of the store in bytes
+        """
+        root.mkdir(parents=True, exist_ok=True)
+        with cls._lock:
+            cls._root = root
+            cls._max_size = max_size
+            cls._size = sum(path.stat().st_size for path in cls._entries())
+            if cls._size > cls._max_size:
+                cls._evict()
+        return None
+
+    @classmethod
+    def close(cls):
+        with cls._lock:
+            cls._root = None
+        return None
+
+    @classmethod
+    def is_open(cls) -> bool:
+        return cls._root is not None
+
+    @classmethod
+    def key(cls, src_path: Path, args: list[str]) -> Optional[str]:
+        """
+        Creates the key for encoding `src_path` with the given arguments.
+        Returns None if the source can't be read.
+        """
+        try:
+            stat = src_path.stat()
+        except OSError:
+            return None
+
+        identity = "\0".join([str(src_path), str(stat.st_size), str(stat.st_mtime_ns)] + args)
+        return hashlib.sha256(identity.encode("utf-8", "surrogateescape")).hexdigest()
+
+    @classmethod
+    def fetch(cls, key: str, dst_path: Path) -> bool:
+        """
+        Materializes a stored encode at `dst_path`.
+        Returns False if the encode isn't stored.
+        """
+        with cls._lock:
+            if cls._root is None:
+                return False
+            stored_path = cls._stored_path(key, dst_path.suffix)
+            try:
+                stat = stored_path.stat()
+                # Only touch the atime, the mtime is shared with every CD file linked to it
+                os.utime(stored_path, ns=(time.time_ns(), stat.st_mtime_ns))
+            except OSError:
+                Stats.transcode_store_miss()
+                return False
+
+        try:
+            link_or_copy(stored_path, dst_path)
+        except OSError:
+            # The encode may have been evicted in the meantime
+            Stats.transcode_store_miss()
+            return False
+        Stats.transcode_store_hit()
+        return True
+
+    @classmethod
+    def add(cls, key: str, encoded_path: Path):
+        """
+        Stores a finished encode.
+        """
+        with cls._lock:
+            if cls._root is None:
+                return
+            stored_path = cls._stored_path(key, encoded_path.suffix)
+            stored_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # Link to a temporary path first so a half-copied encode can never be fetched
+            tmp_path = stored_path.with_suffix(".tmp")
+            try:
+                link_or_copy(encoded_path, tmp_path)
+                os.replace(tmp_path, stored_path)
+            except OSError:
+                return
+            cls._size += stored_path.stat().st_size
+            if cls._size > cls._max_size:
+                cls._evict()
+        return None
+
+    @classmethod
+    def _stored_path(cls, key: str, suffix: str) -> Path:
+        assert cls._root is not None
+        return cls._root / key[:2] / f"{key}{suffix}"
+
+    @classmethod
+    def _entries(cls) -> list[Path]:
+        assert cls._root is not None
+        return [path for path in cls._root.glob("*/*") if path.is_file() and path.suffix != ".tmp"]
+
+    @classmethod
+    def _evict(cls):
+        """
+        Removes the least recently used encodes until the store is below its size limit.
+        Must be called while holding the lock.
+        """
+        entries: list[tuple[int, int, Path]] = []
+        for path in cls._entries():
+            stat = path.stat()
+            entries.append((stat.st_atime_ns, stat.st_size, path))
+        entries.sort()
+
+        # Evict a little extra so every new encode doesn't trigger another eviction
+        cls._size = sum(size for _, size, _ in entries)
+        target_size = int(cls._max_size * 0.9)
+        for _, size, path in entries:
+            if cls._size <= target_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            cls._size -= size
+        return None
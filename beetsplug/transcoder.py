@@ -0,0 +1,176 @@
+from collections.abc import Sequence
+import os
+from pathlib import Path
+from threading import Event, Lock
+from typing import Optional
+
+from beetsplug.config import Config
+from beetsplug.encode_limiter import EncodeLimiter
+from beetsplug.transcode_store import TranscodeStore
+from beetsplug.util import ffmpeg, ffmpeg_batch, link_or_copy
+
+
+# A source, a destination, and the ffmpeg output arguments to encode with
+TranscodeJob = tuple[Path, Path, list[str]]
+
+
+class _Encode:
+    """
+    An encode that has been started during this run
+    """
+
+    def __init__(self, dst_path: Path):
+        self.dst_path = dst_path
+        self.done = Event()
+        self.success = False
+
+
+class Transcoder:
+    """
+    Runs the ffmpeg encodes of a run.
+
+    Identical encodes (same source and ffmpeg arguments) are only run once per run.
+    Any other destination wanting the same encode waits for it to finish,
+    then receives a hard link, reflink, or copy of the result.
+    Encodes finished in previous runs are taken from the TranscodeStore, if it's open.
+    """
+
+    _lock = Lock()
+    _encodes: dict[tuple[str, tuple[str, ...]], _Encode] = {}
+
+    @classmethod
+    def transcode(cls, src_path: Path, dst_path: Path, args: list[str]) -> bool:
+        """
+        Encodes `src_path` into `dst_path` with the given ffmpeg arguments.
+        Returns whether the encode succeeded.
+        """
+        return cls.transcode_many([(src_path, dst_path, args)])[0]
+
+    @classmethod
+    def transcode_many(cls, jobs: Sequence[TranscodeJob]) -> list[bool]:
+        """
+        Encodes several files, using a single ffmpeg process for every job
+        that isn't already cached or being encoded elsewhere.
+        Returns whether each job succeeded.
+        """
+        results = [False] * len(jobs)
+        owned: list[tuple[int, _Encode]] = []
+        waiting: list[tuple[int, _Encode]] = []
+        with cls._lock:
+            for i, (src_path, dst_path, args) in enumerate(jobs):
+                key = (str(src_path), tuple(args))
+                encode = cls._encodes.get(key)
+                if encode is None:
+                    encode = _Encode(dst_path)
+                    cls._encodes[key] = encode
+                    owned.append((i, encode))
+                else:
+                    waiting.append((i, encode))
+
+        try:
+            # Take whatever was encoded in previous runs from the transcode cache
+            to_encode: list[int] = []
+            store_keys: dict[int, Optional[str]] = {}
+            for i, _ in owned:
+                src_path, dst_path, args = jobs[i]
+                store_key = cls._store_key(jobs[i])
+                if store_key is not None and TranscodeStore.fetch(store_key, dst_path):
+                    if Config.verbose:
+                        print(f"Found {dst_path} in the transcode cache")
+                    results[i] = True
+                    continue
+                store_keys[i] = store_key
+                to_encode.append(i)
+
+            if len(to_encode) > 0:
+                encoded = cls._encode([jobs[i] for i in to_encode])
+                for i, success in zip(to_encode, encoded):
+                    results[i] = success
+                    store_key = store_keys[i]
+                    if success and store_key is not None:
+                        TranscodeStore.add(store_key, jobs[i][1])
+        finally:
+            for i, encode in owned:
+                encode.success = results[i]
+                encode.done.set()
+
+        for i, encode in waiting:
+            src_path, dst_path, args = jobs[i]
+            encode.done.wait()
+            if encode.success and cls._share(encode.dst_path, dst_path):
+                results[i] = True
+            else:
+                # The original encode failed or has since gone missing, try encoding it ourselves
+                results[i] = cls._encode([jobs[i]])[0]
+        return results
+
+    @classmethod
+    def _store_key(cls, job: TranscodeJob) -> Optional[str]:
+        if not TranscodeStore.is_open():
+            return None
+        src_path, dst_path, args = job
+        # The output format depends on the extension, so it's part of what makes an encode unique
+        return TranscodeStore.key(src_path, args + [dst_path.suffix])
+
+    @classmethod
+    def _encode(cls, jobs: Sequence[TranscodeJob]) -> list[bool]:
+        """
+        Runs ffmpeg for the given jobs, returning whether each one succeeded.
+        """
+        # The destinations may be hard linked to other CDs or the transcode cache,
+        # so they must be replaced rather than written over
+        for _, dst_path, _ in jobs:
+            if os.path.lexists(dst_path):
+                os.remove(dst_path)
+
+        if len(jobs) == 1:
+            src_path, dst_path, args = jobs[0]
+            with EncodeLimiter.slot(cls._weight(jobs)):
+                return [ffmpeg(src_path, dst_path, args).returncode == 0]
+
+        with EncodeLimiter.slot(cls._weight(jobs)):
+            success = ffmpeg_batch(jobs).returncode == 0
+        if success:
+            return [True] * len(jobs)
+
+        # There's no telling which job broke the batch,
+        # so encode each job on its own so only the broken ones fail
+        return [cls._encode([job])[0] for job in jobs]
+
+    @classmethod
+    def _weight(cls, jobs: Sequence[TranscodeJob]) -> int:
+        """
+        Measures how much work encoding the given jobs is
+        """
+        weight = 0
+        for src_path, _, _ in jobs:
+            try:
+                weight += src_path.stat().st_size
+            except OSError:
+                pass
+        return weight
+
+    @classmethod
+    def _share(cls, encoded_path: Path, dst_path: Path) -> bool:
+        """
+        Gives `dst_path` the contents of an encode that already finished
+        """
+        if encoded_path == dst_path:
+            return True
+
+        if Config.verbose:
+            print(f"Reusing {encoded_path} for {dst_path}")
+        try:
+            link_or_copy(encoded_path, dst_path)
+        except OSError:
+            return False
+        return True
+
+    @classmethod
+    def reset(cls):
+        """
+        Forgets every encode, should be called at the start of each run
+        """
+        with cls._lock:
+            cls._encodes.clear()
+        return None
@@ -1,13 +1,24 @@
+from collections.abc import Sequence
+import os
 from pathlib import Path
+import math
 import re
+import shutil
 import subprocess
 import sys
+from typing import Optional
 
 from beetsplug.config import Config
 
 
 numbered_track_regex = r"^0*\d+\s+(.*)"
 
+# ioctl request for cloning a file's extents on Linux, see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+_CGROUP_ROOT = Path("/sys/fs/cgroup")
+_PROC_CGROUP = Path("/proc/self/cgroup")
+
 
 def unnumber_name(name: str) -> str:
     """
@@ -21,14 +32,82 @@ def unnumber_name(name: str) -> str:
     return name
 
 
+def _cgroup_cpu_limit(cgroup_root: Path = _CGROUP_ROOT, proc_cgroup: Path = _PROC_CGROUP) -> Optional[float]:
+    """
+    Reads the CPU quota of this process' cgroup from cgroup v2's `cpu.max`, in CPUs.
+    Returns None if there's no quota.
+    """
+    try:
+        # cgroup v2 is the line with hierarchy ID 0, e.g. "0::/user.slice/cdman.scope"
+        relative = next(
+            line.split("::", 1)[1].strip()
+            for line in proc_cgroup.read_text().splitlines()
+            if line.startswith("0::")
+        )
+    except (OSError, StopIteration):
+        relative = "/"
+
+    # Quotas of parent cgroups apply too, so the tightest one wins
+    limit: Optional[float] = None
+    cgroup_path = cgroup_root / relative.lstrip("/")
+    while True:
+        try:
+            quota, period = (cgroup_path / "cpu.max").read_text().split()
+            if quota != "max":
+                cpus = int(quota) / int(period)
+                limit = cpus if limit is None else min(limit, cpus)
+        except (OSError, ValueError):
+            pass
+        if cgroup_path == cgroup_root or cgroup_root not in cgroup_path.parents:
+            break
+        cgroup_path = cgroup_path.parent
+    return limit
+
+
+def effective_cpu_count() -> int:
+    """
+    Counts the CPUs this process may actually run on,
+    taking CPU affinity and cgroup quotas (such as container CPU limits) into account.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on every platform
+        count = os.cpu_count() or 1
+
+    quota = _cgroup_cpu_limit()
+    if quota is not None:
+        count = min(count, max(1, math.ceil(quota)))
+    return max(1, count)
+
+
+def peak_rss() -> int:
+    """
+    Gets the most memory this process has had resident at once, in bytes
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows keeps track of the peak itself
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss)
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, while macOS reports bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
 def ffmpeg(source: Path, destination: Path, args: list[str] = []) -> subprocess.CompletedProcess[bytes]:
     result = subprocess.run(
         [
             "ffmpeg",
             "-y",
+            "-threads", str(Config.ffmpeg_threads),
             "-i", str(source),
             "-hide_banner",
         ] + args + [
+            "-threads", str(Config.ffmpeg_threads),
             str(destination)
         ],
         stdout=subprocess.PIPE,
@@ -48,3 +127,109 @@ def ffmpeg(source: Path, destination: Path, args: list[str] = []) -> subprocess.
         with stderr_log_path.open("wb") as stderr_log:
             stderr_log.write(result.stderr)
     return result
+
+
+def ffmpeg_batch(jobs: Sequence[tuple[Path, Path, list[str]]]) -> subprocess.CompletedProcess[bytes]:
+    """
+    Runs several conversions in a single ffmpeg process.
+    Each job is a source, a destination, and the output arguments for that destination.
+
+    ffmpeg fails as a whole if any single conversion fails,
+    so callers must retry failed batches one job at a time to find the broken one.
+    """
+    input_args: list[str] = []
+    output_args: list[str] = []
+    threads = ["-threads", str(Config.ffmpeg_threads)]
+    for i, (source, destination, args) in enumerate(jobs):
+        input_args += threads + ["-i", str(source)]
+        # Without explicit mapping, every output would get the first input's audio and tags
+        output_args += ["-map", f"{i}:a:0", "-map_metadata", str(i)] + args + threads + [str(destination)]
+
+    return subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+        ] + input_args + output_args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def _reflink(source: Path, destination: Path):
+    """
+    Clones `source` to `destination` on filesystems that support it, such as Btrfs and XFS
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are only supported on Linux")
+
+    # fcntl isn't available on every platform
+    import fcntl
+    with source.open("rb") as source_file, destination.open("wb") as destination_file:
+        try:
+            fcntl.ioctl(destination_file.fileno(), _FICLONE, source_file.fileno())
+        except OSError:
+            destination_file.close()
+            os.remove(destination)
+            raise
+
+
+def link_or_copy(source: Path, destination: Path):
+    """
+    Makes `destination` contain the same data as `source`, using as little extra space as possible.
+
+    Tries a hard link first, then a reflink, and falls back to a plain copy.
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+
+    try:
+        _reflink(source, destination)
+        return
+    except OSError:
+        pass
+
+    shutil.copyfile(source, destination)
+
+
+def dir_size(path: Path) -> int:
+    """
+    Adds up the size of every file under `path`, without following links.
+    Returns 0 if `path` doesn't exist.
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def ffmpeg_loudness(source: Path) -> subprocess.CompletedProcess[bytes]:
+    """
+    Decodes the first audio stream of `source` through ffmpeg's ebur128 filter,
+    which prints the loudness summary to stderr.
+    """
+    return subprocess.run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-nostats",
+            "-threads", str(Config.ffmpeg_threads),
+            "-i", str(source),
+            "-map", "0:a:0",
+            "-filter:a", "ebur128=peak=true:framelog=quiet",
+            "-f", "null",
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
@@ -0,0 +1,207 @@
+from collections.abc import Iterable
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import time
+from typing import Any, Optional
+
+
+# inotify event flags, from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+)
+# struct inotify_event, without its trailing name
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc() -> Optional[Any]:
+    """
+    Loads the C library if it has inotify, which only Linux does
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class Watcher:
+    """
+    Waits for changes to a set of files, and to the contents of a set of directories.
+
+    Uses inotify where it's available, and otherwise checks every path's modification time
+    every `poll_interval` seconds. Changes made after `watch` was called are never missed,
+    even if they happen before `wait` is called.
+    """
+
+    def __init__(self, poll_interval: float = 2.0, use_inotify: bool = True):
+        self._poll_interval = poll_interval
+        self._libc = _load_libc() if use_inotify else None
+        self._fd: Optional[int] = None
+        self._files: set[Path] = set()
+        self._directories: set[Path] = set()
+        # The watched directory of each inotify watch
+        self._watches: dict[int, Path] = {}
+        self._snapshot: dict[Path, Any] = {}
+        self._changed: set[Path] = set()
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def watch(self, files: Iterable[Path], directories: Iterable[Path] = ()):
+        """
+        Replaces what's being watched.
+        Files are also noticed when they're created or replaced, as editors usually do when saving.
+        """
+        self._files = set(path.absolute() for path in files)
+        self._directories = set(path.absolute() for path in directories)
+        self._changed.clear()
+
+        self._close_inotify()
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                for directory in self._directories | set(path.parent for path in self._files):
+                    wd = self._libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+                    # Directories that don't exist yet can only be polled
+                    if wd >= 0:
+                        self._watches[wd] = directory
+        self._snapshot = self._take_snapshot()
+        return None
+
+    def wait(self, debounce: float = 1.0, timeout: Optional[float] = None) -> set[Path]:
+        """
+        Waits until something watched changes, then until nothing has changed for `debounce` seconds,
+        so a burst of writes is only reported once.
+        Returns every path that changed, or an empty set if `timeout` seconds passed without a change.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while len(self._changed) == 0:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return set()
+            self._check(remaining)
+
+        # Keep collecting changes until the burst is over
+        quiet_until = time.monotonic() + debounce
+        while (remaining := quiet_until - time.monotonic()) > 0:
+            if self._check(remaining):
+                quiet_until = time.monotonic() + debounce
+
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def close(self):
+        self._close_inotify()
+        return None
+
+    def _check(self, timeout: Optional[float]) -> bool:
+        """
+        Waits up to `timeout` seconds for a change, recording what changed.
+        Returns whether anything changed.
+        """
+        if self._fd is not None:
+            found = self._read_events(timeout)
+        else:
+            time.sleep(self._poll_interval if timeout is None else min(timeout, self._poll_interval))
+            found = False
+        # Paths inotify can't watch, like directories that don't exist yet, are always polled
+        snapshot = self._take_snapshot()
+        for path, state in snapshot.items():
+            if self._snapshot.get(path) != state:
+                self._changed.add(path)
+                found = True
+        self._snapshot = snapshot
+        return found
+
+    def _read_events(self, timeout: Optional[float]) -> bool:
+        assert self._fd is not None
+        poll_timeout = self._poll_interval if timeout is None else min(timeout, self._poll_interval)
+        readable, _, _ = select.select([self._fd], [], [], poll_timeout)
+        if len(readable) == 0:
+            return False
+
+        found = False
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost, assume everything changed
+                self._changed.update(self._files | self._directories)
+                found = True
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            path = directory / os.fsdecode(name) if len(name) > 0 else directory
+            if path in self._files:
+                self._changed.add(path)
+                found = True
+            elif directory in self._directories:
+                self._changed.add(directory)
+                found = True
+        return found
+
+    def _take_snapshot(self) -> dict[Path, Any]:
+        """
+        Records the state of every path inotify isn't watching
+        """
+        watched = set(self._watches.values())
+        snapshot: dict[Path, Any] = {}
+        for path in self._files:
+            if path.parent in watched:
+                continue
+            try:
+                stat = path.stat()
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            except OSError:
+                snapshot[path] = None
+        for directory in self._directories:
+            if directory in watched:
+                continue
+            try:
+                snapshot[directory] = sorted(
+                    (entry.name, entry.stat(follow_symlinks=False).st_mtime_ns) for entry in os.scandir(directory)
+                )
+            except OSError:
+                snapshot[directory] = None
+        return snapshot
+
+    def _close_inotify(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches.clear()
+        return None
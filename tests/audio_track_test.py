@@ -7,6 +7,7 @@ from pytest import fixture
 from beetsplug.cd.audio.audio_populate_mode import AudioPopulateMode
 from beetsplug.cd.audio.audio_track import AudioTrack
 from beetsplug.stats import Stats
+from beetsplug.stream_info import StreamInfo
 
 from tests import common_track_test
 
@@ -96,3 +97,19 @@ def check_populate_mode(track: AudioTrack):
 def test_len(populated_tracks):
     for track in populated_tracks:
         assert math.ceil(track.get_duration(track.dst_path)) == len(track)
+
+
+def test_estimate_disk_size(tmp_path: Path):
+    def track(name: str, codec: str, populate_mode: AudioPopulateMode = AudioPopulateMode.CONVERT) -> AudioTrack:
+        src_path = tmp_path / name
+        src_path.write_bytes(b"\0" * 1_000_000)
+        return AudioTrack(src_path, tmp_path / "cd", populate_mode, src_info=StreamInfo(240.0, codec=codec))
+
+    # Lossy sources turn into much bigger FLACs
+    assert track("Song.mp3", "mp3").estimate_disk_size(240) > 10 * 1_000_000
+    assert track("Song.ogg", "vorbis").estimate_disk_size(240) == track("Song.m4a", "aac").estimate_disk_size(240)
+    # Lossless sources stay about the size they are, as do copies
+    assert track("Song.flac", "flac").estimate_disk_size(240) == 1_000_000
+    assert track("Song.wav", "pcm_s16le").estimate_disk_size(240) == 1_000_000
+    assert track("Copy.mp3", "mp3", AudioPopulateMode.COPY).estimate_disk_size(240) == 1_000_000
+    assert track("Link.mp3", "mp3", AudioPopulateMode.HARD_LINK).estimate_disk_size(240) == 0
@@ -0,0 +1,178 @@
+from datetime import date
+from optparse import Values
+from pathlib import Path
+from beets.library import Item, Library
+from confuse import RootView
+
+from beetsplug import cd_parser
+from beetsplug.cd_parser import CDParser
+from beetsplug.definition_cache import DefinitionCache
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.run_fingerprint import CDFingerprints
+from beetsplug.stats import Stats
+
+
+DEFINITIONS = """
+first:
+  type: audio
+  tracks:
+    - query: "'artist:Nobody'"
+second:
+  type: mp3
+  folders:
+    __root__:
+      tracks:
+        - query: "'artist:Nobody'"
+broken:
+  type: minidisc
+"""
+
+
+def test_streaming(tmp_path: Path, capsys):
+    definition_path = tmp_path / "cds.yml"
+    definition_path.write_text(DEFINITIONS)
+    config = RootView([])
+    config.set({"path": str(tmp_path / "cds")})
+    opts = Values({"bitrate": None, "batch_size": None, "populate_mode": None})
+
+    with DimensionalThreadPoolExecutor(1) as executor:
+        parser = CDParser(Library(str(tmp_path / "library.db")), opts, config, executor)
+        cds_before = Stats.cds
+        cds = parser.iter_from_path(definition_path)
+
+        # Later CDs aren't parsed until they're needed
+        first = next(cds)
+        assert first.path == tmp_path / "cds" / "first"
+        assert Stats.cds == cds_before + 1
+
+        # CDs parsed before an error are still used
+        assert [cd.path.name for cd in cds] == ["second"]
+        assert "Error while loading" in capsys.readouterr().out
+
+
+def test_sources(tmp_path: Path):
+    definition_path = tmp_path / "cds.yml"
+    definition_path.write_text(DEFINITIONS)
+    config = RootView([])
+    config.set({"path": str(tmp_path / "cds")})
+    opts = Values({"bitrate": None, "batch_size": None, "populate_mode": None})
+
+    lib = Library(str(tmp_path / "library.db"), str(tmp_path))
+    lib.add(Item(path=str(tmp_path / "song.flac"), artist="Nobody", title="Song"))
+
+    with DimensionalThreadPoolExecutor(1) as executor:
+        parser = CDParser(lib, opts, config, executor)
+        cds_before = Stats.cds
+
+        # Sources are found without creating any CDs, even for definitions that can't be populated
+        sources = list(parser.iter_sources_from_path(definition_path))
+        assert [[source.path for source in cd_sources] for cd_sources in sources] == [
+            [tmp_path / "song.flac"],
+            [tmp_path / "song.flac"],
+            [],
+        ]
+        assert Stats.cds == cds_before
+
+
+def test_find_duplicates(tmp_path: Path):
+    definitions_path = tmp_path / "definitions"
+    definitions_path.mkdir()
+    (definitions_path / "a.yml").write_text(DEFINITIONS)
+    (definitions_path / "b.yml").write_text("renamed:\n  type: audio\n  name: first\nthird:\n  type: audio\n")
+    config = RootView([])
+    config.set({"path": str(tmp_path / "cds")})
+    opts = Values({"bitrate": None, "batch_size": None, "populate_mode": None, "only": None})
+
+    with DimensionalThreadPoolExecutor(1) as executor:
+        parser = CDParser(Library(str(tmp_path / "library.db")), opts, config, executor)
+        cds_before = Stats.cds
+        assert parser.find_duplicates([definitions_path]) == {"first"}
+        # Duplicates are found without parsing any CDs
+        assert Stats.cds == cds_before
+
+        # Only duplicates among the selected CDs matter
+        parser.only = ["second", "third"]
+        assert parser.find_duplicates([definitions_path]) == set()
+
+
+def test_definition_cache(tmp_path: Path, monkeypatch):
+    definitions_path = tmp_path / "definitions"
+    definitions_path.mkdir()
+    for i in range(20):
+        (definitions_path / f"{i:02}.yml").write_text(f"cd_{i:02}:\n  type: audio\n  tracks: []\n")
+    config = RootView([])
+    config.set({"path": str(tmp_path / "cds")})
+    opts = Values({"bitrate": None, "batch_size": None, "populate_mode": None})
+
+    DefinitionCache.open(tmp_path / "definition_cache.db")
+    try:
+        with DimensionalThreadPoolExecutor(1) as executor:
+            parser = CDParser(Library(str(tmp_path / "library.db")), opts, config, executor)
+            names = sorted(cd.path.name for cd in parser.iter_from_path(definitions_path))
+            assert names == [f"cd_{i:02}" for i in range(20)]
+
+            # Unchanged files aren't parsed again
+            def fail_load(*args, **kwargs):
+                raise AssertionError("Parsed an unchanged file")
+            monkeypatch.setattr(cd_parser.yaml, "load", fail_load)
+            assert len(list(parser.iter_from_path(definitions_path))) == 20
+
+            # Changed files are
+            monkeypatch.undo()
+            (definitions_path / "00.yml").write_text("renamed:\n  type: audio\n  tracks: []\n")
+            assert [cd.path.name for cd in parser.iter_from_path(definitions_path / "00.yml")] == ["renamed"]
+    finally:
+        DefinitionCache.close()
+
+
+def test_definition_cache_is_json(tmp_path: Path):
+    path = tmp_path / "cds.yml"
+    path.write_text("")
+    dated = tmp_path / "dated.yml"
+    dated.write_text("")
+    DefinitionCache.open(tmp_path / "definition_cache.db")
+    try:
+        DefinitionCache.put(path, path.stat(), {"cd": {"type": "audio", "tracks": [{"query": "'artist:Nobody'"}]}})
+        assert DefinitionCache.get(path, path.stat()) == {"cd": {"type": "audio", "tracks": [{"query": "'artist:Nobody'"}]}}
+
+        # Definitions that wouldn't come back the same aren't cached
+        DefinitionCache.put(dated, dated.stat(), {"cd": {"added": date(2024, 1, 1)}})
+        assert DefinitionCache.get(dated, dated.stat()) is None
+        DefinitionCache.put(dated, dated.stat(), {1: {"type": "audio"}})
+        assert DefinitionCache.get(dated, dated.stat()) is None
+    finally:
+        DefinitionCache.close()
+
+
+def test_selection(tmp_path: Path):
+    definition_path = tmp_path / "cds.yml"
+    definition_path.write_text(DEFINITIONS)
+    config = RootView([])
+    config.set({"path": str(tmp_path / "cds")})
+    opts = Values({"bitrate": None, "batch_size": None, "populate_mode": None, "only": ["sec*"]})
+
+    lib = Library(str(tmp_path / "library.db"), str(tmp_path))
+    lib.add(Item(path=str(tmp_path / "song.flac"), artist="Nobody", title="Song"))
+
+    with DimensionalThreadPoolExecutor(1) as executor:
+        # CDs that aren't selected aren't parsed, so their errors aren't either
+        parser = CDParser(lib, opts, config, executor)
+        assert [cd.path.name for cd in parser.iter_from_path(definition_path)] == ["second"]
+        assert parser.error_count == 0
+
+        # CDs recorded with the same fingerprint are skipped
+        opts.only = None
+        parser = CDParser(lib, opts, config, executor)
+        parser.unchanged = CDFingerprints(tmp_path)
+        cds = list(parser.iter_from_path(definition_path))
+        assert [cd.path.name for cd in cds] == ["first", "second"]
+        parser.unchanged.record(cds[0].path, cds[0].fingerprint)
+        assert [cd.path.name for cd in parser.iter_from_path(definition_path)] == ["second"]
+        assert parser.unchanged_count == 1
+
+        # Changing the tracks a CD resolves to changes its fingerprint
+        lib.add(Item(path=str(tmp_path / "other.flac"), artist="Nobody", title="Other"))
+        parser = CDParser(lib, opts, config, executor)
+        parser.unchanged = CDFingerprints(tmp_path)
+        parser.unchanged.record(cds[0].path, cds[0].fingerprint)
+        assert [cd.path.name for cd in parser.iter_from_path(definition_path)] == ["first", "second"]
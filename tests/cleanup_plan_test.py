@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+from pytest import fixture
+
+from beetsplug.cd.cleanup_plan import CleanupPlan
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.util import unnumber_name
+
+
+@fixture
+def directory(tmp_path: Path) -> Path:
+    for name in ["01 A", "02 B", "03 C", "04 D", "05 Gone"]:
+        # Each file's content is its unnumbered name, so it can be matched to a target
+        (tmp_path / f"{name}.mp3").write_text(unnumber_name(name))
+    return tmp_path
+
+
+def make_plan(directory: Path, target_names: list[str]) -> CleanupPlan[Path]:
+    targets = [directory / f"{name}.mp3" for name in target_names]
+    return CleanupPlan(
+        directory.iterdir(),
+        targets,
+        path_of=lambda target: target,
+        name_of=lambda target: unnumber_name(target.stem),
+        existing_name_of=lambda path: unnumber_name(path.stem),
+        is_match=lambda target, path: path.read_text() == unnumber_name(target.stem),
+    )
+
+
+def run_plan(plan: CleanupPlan[Path], executor=None) -> tuple[list[Path], list[Path]]:
+    removed: list[Path] = []
+    moved: list[Path] = []
+
+    def move(src: Path, dst: Path):
+        assert not dst.exists()
+        src.rename(dst)
+        moved.append(dst)
+
+    def rename(src: Path, dst: Path):
+        assert not dst.exists()
+        src.rename(dst)
+
+    def remove(path: Path):
+        os.remove(path)
+        removed.append(path)
+
+    plan.execute(executor, remove, move, rename)
+    return removed, moved
+
+
+def check_contents(directory: Path, names: list[str]):
+    paths = sorted(directory.iterdir())
+    assert [path.stem for path in paths] == names
+    for path in paths:
+        assert path.read_text() == unnumber_name(path.stem)
+
+
+def test_plan(directory):
+    plan = make_plan(directory, ["01 A", "02 C", "03 B", "04 E"])
+    assert plan.keep == [directory / "01 A.mp3"]
+    assert plan.renames == {
+        directory / "02 B.mp3": directory / "03 B.mp3",
+        directory / "03 C.mp3": directory / "02 C.mp3",
+    }
+    assert plan.deletes == [directory / "04 D.mp3", directory / "05 Gone.mp3"]
+    assert plan.creates == [directory / "04 E.mp3"]
+
+
+def test_swap(directory):
+    plan = make_plan(directory, ["01 A", "02 C", "03 B", "04 D", "05 Gone"])
+    removed, moved = run_plan(plan)
+    assert len(removed) == 0
+    assert len(moved) == 2
+    check_contents(directory, ["01 A", "02 C", "03 B", "04 D", "05 Gone"])
+
+
+def test_rotation(directory):
+    plan = make_plan(directory, ["01 E", "02 D", "03 A", "04 B", "05 C"])
+    removed, moved = run_plan(plan)
+    assert removed == [directory / "05 Gone.mp3"]
+    assert len(moved) == 4
+    check_contents(directory, ["02 D", "03 A", "04 B", "05 C"])
+    assert plan.creates == [directory / "01 E.mp3"]
+
+
+def test_chain_into_deleted(directory):
+    plan = make_plan(directory, ["02 A", "03 B", "04 C", "05 D"])
+    removed, moved = run_plan(plan)
+    assert removed == [directory / "05 Gone.mp3"]
+    assert len(moved) == 4
+    check_contents(directory, ["02 A", "03 B", "04 C", "05 D"])
+
+
+def test_executor(directory):
+    with DimensionalThreadPoolExecutor(4) as executor:
+        plan = make_plan(directory, ["01 B", "02 A", "03 D", "04 C"])
+        removed, moved = run_plan(plan, executor)
+    assert removed == [directory / "05 Gone.mp3"]
+    assert len(moved) == 4
+    check_contents(directory, ["01 B", "02 A", "03 D", "04 C"])
+
+
+def test_duplicates(tmp_path):
+    (tmp_path / "01 A.mp3").write_text("A")
+    (tmp_path / "02 A.mp3").write_text("A")
+    plan = make_plan(tmp_path, ["01 A", "02 A"])
+    assert len(plan.keep) == 2
+    assert len(plan.renames) == 0
+    assert len(plan.deletes) == 0
@@ -0,0 +1,81 @@
+from threading import Event, Lock, Thread
+import time
+
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor, Resource
+
+
+def test_tasks_submitting_tasks():
+    done: list[str] = []
+    lock = Lock()
+
+    def finish(name: str):
+        time.sleep(0.01)
+        with lock:
+            done.append(name)
+
+    def scan(executor: DimensionalThreadPoolExecutor, name: str):
+        executor.submit_as(Resource.META, finish, f"{name} meta")
+        executor.submit(finish, f"{name} cpu")
+
+    with DimensionalThreadPoolExecutor(2, resource_limits={Resource.META: 1, Resource.IO_READ: 1}) as executor:
+        for name in ["a", "b"]:
+            executor.submit_as(Resource.IO_READ, scan, executor, name)
+        executor.wait()
+        assert sorted(done) == ["a cpu", "a meta", "b cpu", "b meta"]
+
+
+def test_resources_dont_block_each_other():
+    release = Event()
+    cpu_done = Event()
+    with DimensionalThreadPoolExecutor(1, resource_limits={Resource.IO_WRITE: 1}) as executor:
+        # A stuck copy doesn't hold up encodes
+        executor.submit_as(Resource.IO_WRITE, release.wait)
+        executor.submit(cpu_done.set)
+        assert cpu_done.wait(1)
+        release.set()
+
+
+def test_unlimited_resource():
+    executor = DimensionalThreadPoolExecutor(3, resource_limits={Resource.META: 0})
+    # Resources without workers run as CPU tasks
+    assert executor.effective_resource(Resource.META) == Resource.CPU
+    assert executor.limit(Resource.META) == 3
+    ran = Event()
+    executor.submit_as(Resource.META, ran.set)
+    executor.shutdown()
+    assert ran.is_set()
+
+
+def test_backpressure():
+    release = Event()
+    submitted = 0
+
+    def produce(executor: DimensionalThreadPoolExecutor):
+        nonlocal submitted
+        for _ in range(10):
+            executor.submit(release.wait)
+            submitted += 1
+
+    with DimensionalThreadPoolExecutor(1, max_queued=2) as executor:
+        producer = Thread(target=produce, args=(executor,))
+        producer.start()
+        time.sleep(0.1)
+        # One task is running and two are waiting, so the producer is held back
+        assert submitted == 3
+        release.set()
+        producer.join(1)
+        assert submitted == 10
+
+
+def test_tasks_never_block_on_submit():
+    done = Event()
+
+    def fan_out(executor: DimensionalThreadPoolExecutor):
+        # Far more tasks than the bound, submitted from the only worker
+        for _ in range(20):
+            executor.submit(time.sleep, 0)
+        done.set()
+
+    with DimensionalThreadPoolExecutor(1, max_queued=2) as executor:
+        executor.submit(fan_out, executor)
+        assert done.wait(1)
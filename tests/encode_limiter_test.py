@@ -0,0 +1,86 @@
+from pathlib import Path
+from threading import Thread
+import time
+
+from beetsplug import util
+from beetsplug.encode_limiter import EncodeLimiter
+
+
+def write_cgroup(root: Path, relative: str, cpu_max: str):
+    path = root / relative
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "cpu.max").write_text(f"{cpu_max}\n")
+
+
+def test_cgroup_cpu_limit(tmp_path: Path):
+    cgroup_root = tmp_path / "cgroup"
+    proc_cgroup = tmp_path / "proc_cgroup"
+    proc_cgroup.write_text("0::/docker/cdman\n")
+
+    write_cgroup(cgroup_root, "", "max 100000")
+    write_cgroup(cgroup_root, "docker/cdman", "max 100000")
+    assert util._cgroup_cpu_limit(cgroup_root, proc_cgroup) is None
+
+    # The tightest quota along the way wins
+    write_cgroup(cgroup_root, "docker", "150000 100000")
+    assert util._cgroup_cpu_limit(cgroup_root, proc_cgroup) == 1.5
+    write_cgroup(cgroup_root, "docker/cdman", "50000 100000")
+    assert util._cgroup_cpu_limit(cgroup_root, proc_cgroup) == 0.5
+
+
+def test_effective_cpu_count(monkeypatch):
+    monkeypatch.setattr(util.os, "sched_getaffinity", lambda pid: {0, 1, 2, 3}, raising=False)
+    monkeypatch.setattr(util, "_cgroup_cpu_limit", lambda: None)
+    assert util.effective_cpu_count() == 4
+
+    monkeypatch.setattr(util, "_cgroup_cpu_limit", lambda: 1.5)
+    assert util.effective_cpu_count() == 2
+
+    monkeypatch.setattr(util, "_cgroup_cpu_limit", lambda: 0.25)
+    assert util.effective_cpu_count() == 1
+
+
+def test_slot_limit():
+    EncodeLimiter.configure(2, 2, adaptive=False)
+    active = 0
+    most_active = 0
+
+    def encode():
+        nonlocal active, most_active
+        with EncodeLimiter.slot(1):
+            active += 1
+            most_active = max(most_active, active)
+            time.sleep(0.02)
+            active -= 1
+
+    threads = [Thread(target=encode) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert most_active <= 2
+
+
+def test_tune():
+    EncodeLimiter.configure(8, 8, adaptive=True)
+    assert EncodeLimiter.limit() == 8
+
+    # Fewer encodes didn't hurt throughput, so keep going
+    EncodeLimiter._tune(100.0, 0.5)
+    assert EncodeLimiter.limit() == 7
+    EncodeLimiter._tune(100.0, 0.5)
+    assert EncodeLimiter.limit() == 6
+
+    # Throughput dropped, so go back up
+    EncodeLimiter._tune(50.0, 0.5)
+    assert EncodeLimiter.limit() == 7
+
+    # Overloaded CPUs always back off
+    EncodeLimiter._tune(200.0, 3.0)
+    assert EncodeLimiter.limit() == 6
+
+    # The limit never leaves its bounds
+    for _ in range(20):
+        EncodeLimiter._tune(100.0, 3.0)
+    assert EncodeLimiter.limit() == 1
+    EncodeLimiter.configure(8, 8, adaptive=False)
@@ -0,0 +1,51 @@
+from pathlib import Path
+import shutil
+import subprocess
+import time
+from pytest import mark
+
+from beetsplug.util import ffmpeg, ffmpeg_batch
+
+
+TRACK_COUNT = 12
+MP3_ARGS = ["-codec:a", "libmp3lame", "-b:a", "128k", "-vn"]
+
+
+def make_tracks(directory: Path) -> list[Path]:
+    paths = [directory / f"{i:02} Song.flac" for i in range(TRACK_COUNT)]
+    for path in paths:
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=frequency=440:duration=5", str(path)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+    return paths
+
+
+@mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_batch_against_per_track(tmp_path: Path):
+    """
+    Benchmarks a folder of short tracks converted with one ffmpeg process per track,
+    against the same folder converted by a single ffmpeg process.
+    Run with `pytest -s` to see the timings.
+    """
+    src_paths = make_tracks(tmp_path)
+    per_track_directory = tmp_path / "per_track"
+    per_track_directory.mkdir()
+    batch_directory = tmp_path / "batch"
+    batch_directory.mkdir()
+
+    start = time.perf_counter()
+    for path in src_paths:
+        assert ffmpeg(path, per_track_directory / path.with_suffix(".mp3").name, MP3_ARGS).returncode == 0
+    per_track_time = time.perf_counter() - start
+
+    jobs = [(path, batch_directory / path.with_suffix(".mp3").name, MP3_ARGS) for path in src_paths]
+    start = time.perf_counter()
+    assert ffmpeg_batch(jobs).returncode == 0
+    batch_time = time.perf_counter() - start
+
+    print(f"\n{TRACK_COUNT} tracks: per track {per_track_time:.2f}s, batched {batch_time:.2f}s")
+    for _, dst_path, _ in jobs:
+        assert dst_path.stat().st_size > 0
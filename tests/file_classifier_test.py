@@ -0,0 +1,64 @@
+from pathlib import Path
+import struct
+from magic import Magic
+
+from beetsplug import file_classifier
+from beetsplug.file_classifier import FileClassifier
+
+
+def wav_bytes() -> bytes:
+    data = b"\0" * 64
+    fmt = struct.pack("<HHIIHH", 1, 1, 44100, 88200, 2, 16)
+    return (
+        b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"data" + struct.pack("<I", len(data)) + data
+    )
+
+
+class CountingMagic:
+    calls = 0
+
+    def __init__(self, mime: bool):
+        self._magic = Magic(mime=mime)
+
+    def from_file(self, path: str) -> str:
+        CountingMagic.calls += 1
+        return self._magic.from_file(path)
+
+
+def test_extensions(tmp_path: Path):
+    assert FileClassifier.is_audio(tmp_path / "01 Song.MP3")
+    assert FileClassifier.is_audio(tmp_path / "01 Song.flac")
+    assert not FileClassifier.is_audio(tmp_path / "01 Song.stderr.log")
+    assert not FileClassifier.is_audio(tmp_path / ".cdman-manifest.json")
+
+
+def test_known(tmp_path: Path):
+    path = tmp_path / "01 Song.weird"
+    path.write_text("not audio")
+    assert FileClassifier.is_audio(path, lambda p: p == path)
+    assert not FileClassifier.is_audio(path, lambda p: False)
+
+
+def test_sniff_is_cached(tmp_path: Path, monkeypatch):
+    FileClassifier.clear()
+    CountingMagic.calls = 0
+    monkeypatch.setattr(FileClassifier, "_magic", None)
+    monkeypatch.setattr(file_classifier, "Magic", CountingMagic)
+
+    audio_path = tmp_path / "01 Song"
+    audio_path.write_bytes(wav_bytes())
+    text_path = tmp_path / "notes"
+    text_path.write_text("just some notes")
+    link_path = tmp_path / "02 Song"
+    link_path.symlink_to(audio_path)
+
+    assert FileClassifier.is_audio(audio_path)
+    assert FileClassifier.is_audio(audio_path)
+    assert not FileClassifier.is_audio(text_path)
+    # Links are classified by their target, which has already been read
+    assert FileClassifier.is_audio(link_path)
+    assert CountingMagic.calls == 2
+
+    assert not FileClassifier.is_audio(tmp_path / "missing")
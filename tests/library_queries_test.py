@@ -0,0 +1,108 @@
+from pathlib import Path
+from beets.library import Item, Library
+from pytest import fixture
+
+from beetsplug.library_queries import LibraryQueries
+from beetsplug.query_cache import QueryCache
+
+
+@fixture
+def lib(tmp_path: Path) -> Library:
+    lib = Library(str(tmp_path / "library.db"), str(tmp_path))
+    tracks = [
+        ("Daft Punk", "Discovery", 1, 2, 211.0),
+        ("Daft Punk", "Discovery", 1, 1, 320.0),
+        ("Daft Punk", "Homework", 2, 1, 100.0),
+        ("Foals", "Life Is Yours", 1, 1, 180.0),
+    ]
+    for i, (artist, album, disc, track, length) in enumerate(tracks):
+        item = Item(
+            path=str(tmp_path / f"{i}.flac"),
+            artist=artist,
+            album=album,
+            disc=disc,
+            track=track,
+            length=length,
+            format="FLAC",
+        )
+        if artist == "Foals":
+            item["mood"] = "upbeat"
+        lib.add(item)
+    return lib
+
+
+def test_batched(lib: Library, tmp_path: Path):
+    queries = LibraryQueries(lib)
+    queries.prefetch(["'artist:Daft Punk'", "'album:Life Is Yours'", "'artist:Daft Punk'", "'artist:Nobody'"])
+
+    # Ordered by disc and track
+    sources = queries.get("'artist:Daft Punk'")
+    assert [source.path for source in sources] == [tmp_path / "1.flac", tmp_path / "0.flac", tmp_path / "2.flac"]
+    assert sources[0].info is not None
+    assert sources[0].info.duration == 320.0
+    assert sources[0].info.codec == "flac"
+
+    assert [source.path for source in queries.get("'album:Life Is Yours'")] == [tmp_path / "3.flac"]
+    assert queries.get("'artist:Nobody'") == []
+
+
+def test_slow_query(lib: Library, tmp_path: Path):
+    # Flexible attributes can only be matched in Python
+    queries = LibraryQueries(lib)
+    assert [source.path for source in queries.get("mood:upbeat")] == [tmp_path / "3.flac"]
+
+
+def test_get_infos(lib: Library, tmp_path: Path):
+    queries = LibraryQueries(lib)
+    infos = queries.get_infos([tmp_path / "2.flac", tmp_path / "missing.flac"])
+    info = infos[tmp_path / "2.flac"]
+    assert info is not None
+    assert info.duration == 100.0
+    assert infos[tmp_path / "missing.flac"] is None
+
+
+def test_query_cache(lib: Library, tmp_path: Path, monkeypatch):
+    library_path = tmp_path / "fingerprinted.db"
+    library_path.write_bytes(b"")
+    QueryCache.open(tmp_path / "query_cache.db", library_path)
+    try:
+        LibraryQueries(lib).prefetch(["'artist:Daft Punk'", "'artist:Nobody'"])
+
+        # Later runs don't touch the library
+        monkeypatch.setattr(LibraryQueries, "_fetch", None)
+        queries = LibraryQueries(lib)
+        sources = queries.get("'artist:Daft Punk'")
+        assert [source.path for source in sources] == [tmp_path / "1.flac", tmp_path / "0.flac", tmp_path / "2.flac"]
+        assert sources[0].info is not None
+        assert sources[0].info.duration == 320.0
+        assert queries.get("'artist:Nobody'") == []
+
+        # Changing the library forgets every result
+        library_path.write_bytes(b"changed")
+        QueryCache.open(tmp_path / "query_cache.db", library_path)
+        assert QueryCache.get("'artist:Daft Punk'") is None
+    finally:
+        QueryCache.close()
+
+
+def test_relative_dates_arent_cached(lib: Library, tmp_path: Path):
+    library_path = tmp_path / "fingerprinted.db"
+    library_path.write_bytes(b"")
+    QueryCache.open(tmp_path / "query_cache.db", library_path)
+    try:
+        queries = ["added:-1w..", "'artist:Nobody' ^added:..2d", "added:2000..2010", "'title:Track 1d'"]
+        LibraryQueries(lib).prefetch(queries)
+
+        # Relative dates match different tracks as time passes, even if the library doesn't change
+        assert QueryCache.get("added:-1w..") is None
+        assert QueryCache.get("'artist:Nobody' ^added:..2d") is None
+        assert QueryCache.get("added:2000..2010") is not None
+        assert QueryCache.get("'title:Track 1d'") is not None
+    finally:
+        QueryCache.close()
+
+
+def test_iter_all(lib: Library, tmp_path: Path):
+    items = list(LibraryQueries(lib).iter_all(["path", "title"], page_size=3))
+    assert [item["path"] for item in items] == [bytes(tmp_path / f"{i}.flac") for i in range(4)]
+    assert set(items[0].keys()) == {"path", "title"}
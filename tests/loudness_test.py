@@ -0,0 +1,40 @@
+from beetsplug.loudness import Loudness
+
+
+summary = """
+[Parsed_ebur128_0 @ 0x5581] Summary:
+
+  Integrated loudness:
+    I:         -11.3 LUFS
+    Threshold: -21.6 LUFS
+
+  Loudness range:
+    LRA:         5.1 LU
+    Threshold: -31.5 LUFS
+    LRA low:   -15.0 LUFS
+    LRA high:   -9.9 LUFS
+
+  True peak:
+    Peak:        0.4 dBFS
+"""
+
+
+def test_parse():
+    loudness = Loudness.parse(summary)
+    assert loudness is not None
+    assert loudness.integrated == -11.3
+    assert loudness.true_peak == 0.4
+
+    assert Loudness.parse("Output file is empty, nothing was encoded") is None
+
+
+def test_gain():
+    # Loud tracks are brought down to the target
+    assert Loudness(-11.3, 0.4).gain(-18.0) == -18.0 + 11.3
+
+    # Quiet tracks are only brought up as far as their peaks allow
+    assert Loudness(-30.0, -6.0).gain(-18.0) == 5.0
+    assert Loudness(-24.0, -12.0).gain(-18.0) == 6.0
+
+    # Silence is left alone
+    assert Loudness(-70.0, float("-inf")).gain(-18.0) == 0.0
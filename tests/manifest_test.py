@@ -0,0 +1,142 @@
+import os
+from pathlib import Path
+from pytest import fixture
+
+from beetsplug.cd.audio.audio_cd import AudioCD
+from beetsplug.cd.audio.audio_populate_mode import AudioPopulateMode
+from beetsplug.cd.audio.audio_track import AudioTrack
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.manifest import Manifest
+from beetsplug.stream_info import StreamInfo
+
+
+@fixture
+def cd_path(tmp_path: Path) -> Path:
+    path = tmp_path / "cd"
+    (path / "01 Folder").mkdir(parents=True)
+    return path
+
+
+@fixture
+def src_path(tmp_path: Path) -> Path:
+    path = tmp_path / "Song.flac"
+    path.write_bytes(b"source")
+    return path
+
+
+@fixture
+def dst_path(cd_path: Path) -> Path:
+    path = cd_path / "01 Folder" / "01 Song.mp3"
+    path.write_bytes(b"destination")
+    return path
+
+
+def test_is_current(cd_path, src_path, dst_path):
+    manifest = Manifest(cd_path)
+    assert manifest.is_current(dst_path, src_path, "mp3:128") is None
+
+    manifest.record(dst_path, src_path, "mp3:128", 207.5)
+    assert manifest.is_current(dst_path, src_path, "mp3:128")
+    assert not manifest.is_current(dst_path, src_path, "mp3:192")
+    assert not manifest.is_current(dst_path, src_path.with_name("Other.flac"), "mp3:128")
+
+    # Source was re-ripped
+    stat = src_path.stat()
+    os.utime(src_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not manifest.is_current(dst_path, src_path, "mp3:128")
+
+    # Destination was partially written
+    manifest.record(dst_path, src_path, "mp3:128", 207.5)
+    dst_path.write_bytes(b"dest")
+    assert not manifest.is_current(dst_path, src_path, "mp3:128")
+
+
+def test_save_and_load(cd_path, src_path, dst_path):
+    manifest = Manifest(cd_path)
+    manifest.record(dst_path, src_path, "copy", 207.5)
+    manifest.save()
+    assert manifest.path.exists()
+
+    loaded = Manifest(cd_path)
+    entry = loaded.get(dst_path)
+    assert entry is not None
+    assert entry.src_path == str(src_path)
+    assert entry.signature == "copy"
+    assert entry.duration == 207.5
+    assert loaded.is_current(dst_path, src_path, "copy")
+
+
+def test_broken_manifest(cd_path, dst_path):
+    (cd_path / Manifest.FILE_NAME).write_text("{ not json")
+    assert Manifest(cd_path).get(dst_path) is None
+
+
+def test_move_and_remove(cd_path, src_path, dst_path):
+    manifest = Manifest(cd_path)
+    manifest.record(dst_path, src_path, "mp3:128", 207.5)
+
+    moved_track = dst_path.with_name("02 Song.mp3")
+    manifest.move(dst_path, moved_track)
+    assert manifest.get(dst_path) is None
+    assert manifest.get(moved_track) is not None
+
+    moved_folder = cd_path / "02 Folder"
+    manifest.move(cd_path / "01 Folder", moved_folder)
+    assert manifest.get(moved_track) is None
+    assert manifest.get(moved_folder / moved_track.name) is not None
+
+    manifest.remove(moved_folder)
+    assert manifest.get(moved_folder / moved_track.name) is None
+
+
+def test_track_detects_changed_source(cd_path, src_path):
+    track = AudioTrack(src_path, cd_path, AudioPopulateMode.COPY, src_info=StreamInfo(1.0))
+    track.manifest = Manifest(cd_path)
+    track.set_dst_path(1, 1)
+    assert track._is_populated() is None
+
+    track.dst_path.write_bytes(src_path.read_bytes())
+    track._record_populated()
+    assert track._is_populated()
+
+    src_path.write_bytes(b"re-ripped source")
+    assert not track._is_populated()
+
+
+def test_track_measures_from_manifest(cd_path, src_path):
+    track = AudioTrack(src_path, cd_path, AudioPopulateMode.COPY, src_info=StreamInfo(207.5))
+    track.manifest = Manifest(cd_path)
+    track.set_dst_path(1, 1)
+    track.dst_path.write_bytes(src_path.read_bytes())
+    track._record_populated()
+
+    # The CD can be measured without probing the populated file
+    assert len(track) == 208
+
+    # A later run learns the measure from the manifest when skipping the track
+    skipped = AudioTrack(src_path, cd_path, AudioPopulateMode.COPY)
+    skipped.manifest = track.manifest
+    skipped.set_dst_path(1, 1)
+    assert skipped._is_populated()
+    assert len(skipped) == 208
+
+
+def test_failed_repopulate_is_not_fully_populated(cd_path, src_path):
+    with DimensionalThreadPoolExecutor(1) as executor:
+        track = AudioTrack(src_path, cd_path, AudioPopulateMode.CONVERT, src_info=StreamInfo(1.0))
+        cd = AudioCD(cd_path, [track], executor)
+        track.set_dst_path(1, 1)
+        track.dst_path.write_bytes(b"converted")
+        track._record_populated()
+        cd.save_manifest()
+        assert cd.is_fully_populated()
+
+        # Normalizing was turned on, but re-encoding the track failed, leaving the old entry behind
+        normalized = AudioTrack(src_path, cd_path, AudioPopulateMode.CONVERT, src_info=StreamInfo(1.0), loudness_target=-18)
+        normalized_cd = AudioCD(cd_path, [normalized], executor)
+        normalized.set_dst_path(1, 1)
+        assert not normalized_cd.is_fully_populated()
+
+        # The re-encode removed the old conversion before failing
+        track.dst_path.unlink()
+        assert not cd.is_fully_populated()
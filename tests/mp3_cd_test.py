@@ -278,8 +278,8 @@ def test_calculate_splits(cds):
     cd = cds[0]
     tracks = cd.get_tracks()
     
-    # Split right at folder
-    cd._test_size = 4437541 + 3976559
+    # Split right at folder, with each track taking up whole sectors
+    cd._test_size = 2168 * 2048 + 1942 * 2048
     splits = cd.calculate_splits()
     assert len(splits) == 2
     assert splits[0].start == tracks[0]
@@ -288,7 +288,7 @@ def test_calculate_splits(cds):
     assert splits[1].end == tracks[3]
 
     # Split in between folders
-    cd._test_size = 4695280
+    cd._test_size = 2293 * 2048
     splits = cd.calculate_splits()
     assert len(splits) == 4
     assert splits[0].start == tracks[0]
@@ -299,3 +299,32 @@ def test_calculate_splits(cds):
     assert splits[2].end == tracks[2]
     assert splits[3].start == tracks[3]
     assert splits[3].end == tracks[3]
+
+
+def test_balanced_splits(executor):
+    with executor:
+        folders = [
+            MP3Folder(cd_path / "cd_split" / f"Folder {i}", [
+                MP3Track(music_path / f"Song {i}-{j}.mp3", 128) for j in range(3)
+            ])
+            for i in range(3)
+        ]
+        cd = MP3CD(cd_path / "cd_split", folders, executor)
+        tracks = cd.get_tracks()
+        cd._test_size = 8 * 2048
+
+        # Greedily filling each CD would leave a single track on the last one
+        splits = cd.calculate_splits(lambda track: 1000)
+        assert [split.size for split in splits] == [5 * 2048, 4 * 2048]
+        assert splits[0].end == tracks[4]
+
+        # Keeping folders together still takes two CDs
+        cd._split_at_folders = True
+        splits = cd.calculate_splits(lambda track: 1000)
+        assert [split.size for split in splits] == [6 * 2048, 3 * 2048]
+        assert splits[0].end == tracks[5]
+
+        # Unless a folder has to be split to avoid burning another CD
+        cd._test_size = 5 * 2048
+        splits = cd.calculate_splits(lambda track: 1000)
+        assert len(splits) == 2
@@ -4,8 +4,11 @@ import shutil
 import ffmpeg
 from pytest import fixture
 
-from beetsplug.cd.mp3.mp3_track import MP3Track
+from beetsplug.cd.mp3.mp3_track import MP3_OVERHEAD, MP3Track
+from beetsplug.loudness import Loudness
+from beetsplug.probe_cache import ProbeCache
 from beetsplug.stats import Stats
+from beetsplug.stream_info import StreamInfo
 
 from tests import common_track_test
 
@@ -85,3 +88,47 @@ def test_populate(numbered_tracks, capsys):
 def test_len(populated_tracks):
     for track in populated_tracks:
         assert track.get_size() == len(track)
+
+
+def test_passthrough(tmp_path: Path):
+    def track(info: StreamInfo, passthrough: bool = True) -> MP3Track:
+        return MP3Track(tmp_path / "Song.mp3", 192, tmp_path, src_info=info, passthrough=passthrough)
+
+    # Already a suitable MP3, so it's copied
+    copied = track(StreamInfo(200.0, 128_000, "mp3", 44100))
+    assert copied._get_encoder_args() == ["-acodec", "copy", "-vn"]
+    assert copied._get_populate_signature() == "mp3:192:copy"
+    assert copied._get_expected_bit_rate() == 128_000
+
+    # Passthrough disabled, too high a bitrate, the wrong sample rate, or not an MP3
+    assert not track(StreamInfo(200.0, 128_000, "mp3", 44100), passthrough=False)._is_copy()
+    assert not track(StreamInfo(200.0, 320_000, "mp3", 44100))._is_copy()
+    assert not track(StreamInfo(200.0, 128_000, "mp3", 48000))._is_copy()
+    assert not track(StreamInfo(200.0, 900_000, "flac", 44100))._is_copy()
+
+    # Sources that are already 44.1 kHz aren't resampled
+    encoded = track(StreamInfo(200.0, 900_000, "flac", 44100))
+    assert "-ar" not in encoded._get_encoder_args()
+    assert encoded._get_populate_signature() == "mp3:192"
+    assert "-ar" in track(StreamInfo(200.0, 900_000, "flac", 48000))._get_encoder_args()
+
+
+def test_estimate_measure(tmp_path: Path):
+    track = MP3Track(tmp_path / "Song.flac", 192, tmp_path, src_info=StreamInfo(200.0, 900_000, "flac", 44100))
+    assert track.estimate_measure(StreamInfo(200.0, 900_000, "flac", 44100)) == 200 * 192_000 // 8 + MP3_OVERHEAD
+
+    # Copies keep the bit rate of their source
+    copied = MP3Track(tmp_path / "Song.mp3", 192, tmp_path, passthrough=True)
+    assert copied.estimate_measure(StreamInfo(200.0, 128_000, "mp3", 44100)) == 200 * 128_000 // 8 + MP3_OVERHEAD
+
+
+def test_normalize(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(ProbeCache, "loudness", classmethod(lambda cls, path: Loudness(-12.0, -0.5)))
+    info = StreamInfo(200.0, 128_000, "mp3", 44100)
+    track = MP3Track(tmp_path / "Song.mp3", 192, tmp_path, src_info=info, passthrough=True, loudness_target=-18.0)
+
+    # Normalized tracks are always encoded, with the gain applied during the encode
+    assert not track._is_copy()
+    assert track._get_populate_signature() == "mp3:192:norm-18"
+    args = track._get_encoder_args()
+    assert args[args.index("-filter:a") + 1] == "volume=-6.00dB"
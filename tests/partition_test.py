@@ -0,0 +1,43 @@
+import random
+import time
+
+from beetsplug.partition import partition
+
+
+def test_fewest_parts():
+    assert partition([], 10) == []
+    assert partition([4, 4, 4], 12) == [3]
+    assert len(partition([5, 5, 5, 5, 5], 10)) == 3
+
+
+def test_balanced():
+    # Greedy would fill the first part and leave one item in the second
+    assert partition([1] * 10, 7) == [5, 10]
+    assert partition([3, 3, 3, 3, 1], 9) == [2, 5]
+
+
+def test_oversized():
+    # Items bigger than a part get one of their own
+    assert partition([2, 20, 2, 2], 5) == [1, 2, 4]
+
+    # An oversized item mustn't raise the capacity of the other parts
+    sizes = [3000, 3000, 20000]
+    ends = partition(sizes, 4800)
+    assert ends == [1, 2, 3]
+    start = 0
+    for end in ends:
+        assert end - start == 1 or sum(sizes[start:end]) <= 4800
+        start = end
+
+
+def test_large():
+    sizes = [random.randint(2_000_000, 12_000_000) for _ in range(50_000)]
+    start = time.monotonic()
+    ends = partition(sizes, 735_397_888)
+    assert time.monotonic() - start < 10
+
+    assert ends[-1] == len(sizes)
+    start = 0
+    for end in ends:
+        assert sum(sizes[start:end]) <= 735_397_888
+        start = end
@@ -0,0 +1,156 @@
+import os
+from pathlib import Path
+from pytest import fixture
+
+from beetsplug import probe_cache
+from beetsplug.loudness import Loudness
+from beetsplug.probe_cache import ProbeCache
+
+
+probe_calls: list[str] = []
+
+
+def fake_probe(path: str):
+    probe_calls.append(path)
+    if path.endswith(".txt"):
+        return {"streams": [{"codec_type": "data"}]}
+    return {
+        "streams": [
+            {"codec_type": "video"},
+            {
+                "codec_type": "audio",
+                "codec_name": "MP3",
+                "duration": "207.641338",
+                "bit_rate": "128000",
+                "sample_rate": "44100",
+            },
+        ],
+    }
+
+
+def fake_measure_loudness(path: Path):
+    probe_calls.append(str(path))
+    return True, Loudness(-12.0, -0.5)
+
+
+@fixture
+def cache(tmp_path: Path, monkeypatch):
+    probe_calls.clear()
+    monkeypatch.setattr(probe_cache.ffmpeg, "probe", fake_probe)
+    monkeypatch.setattr(probe_cache, "measure_loudness", fake_measure_loudness)
+    ProbeCache.open(tmp_path / "probe_cache.db", 3)
+    yield ProbeCache
+    ProbeCache.close()
+
+
+@fixture
+def files(tmp_path: Path) -> list[Path]:
+    paths: list[Path] = []
+    for i in range(5):
+        path = tmp_path / f"{i}.mp3"
+        path.write_bytes(b"\0" * (i + 1))
+        paths.append(path)
+    return paths
+
+
+def test_probe(cache, files):
+    info = cache.probe(files[0])
+    assert info is not None
+    assert info.duration == 207.641338
+    assert info.bit_rate == 128_000
+    assert info.codec == "mp3"
+    assert info.sample_rate == 44100
+
+    # Second probe is answered by the cache
+    info = cache.probe(files[0])
+    assert info is not None
+    assert info.duration == 207.641338
+    assert len(probe_calls) == 1
+
+
+def test_cached_only(cache, files):
+    assert cache.probe(files[0], cached_only=True) is None
+    assert len(probe_calls) == 0
+
+    cache.probe(files[0])
+    info = cache.probe(files[0], cached_only=True)
+    assert info is not None
+    assert info.duration == 207.641338
+    assert len(probe_calls) == 1
+
+
+def test_loudness(cache, files):
+    loudness = cache.loudness(files[0])
+    assert loudness is not None
+    assert loudness.integrated == -12.0
+    assert loudness.true_peak == -0.5
+
+    # Measured once, then kept alongside the probe results
+    cache.probe(files[0])
+    loudness = cache.loudness(files[0])
+    assert loudness is not None
+    assert loudness.integrated == -12.0
+    assert len(probe_calls) == 2
+
+    # Changing the file measures it again
+    files[0].write_bytes(b"\0" * 10)
+    cache.loudness(files[0])
+    assert len(probe_calls) == 3
+
+
+def test_probe_no_audio(cache, tmp_path):
+    text_path = tmp_path / "notes.txt"
+    text_path.write_text("not audio")
+    assert cache.probe(text_path) is None
+    assert cache.probe(text_path) is None
+    assert len(probe_calls) == 1
+
+
+def test_probe_missing(cache, tmp_path):
+    assert cache.probe(tmp_path / "missing.mp3") is None
+    assert len(probe_calls) == 0
+
+
+def test_invalidation(cache, files):
+    cache.probe(files[0])
+    files[0].write_bytes(b"\0" * 100)
+    cache.probe(files[0])
+    assert len(probe_calls) == 2
+
+    stat = files[0].stat()
+    os.utime(files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    cache.probe(files[0])
+    assert len(probe_calls) == 3
+
+
+def test_persistence(cache, files, tmp_path):
+    cache.probe(files[0])
+    cache.close()
+    cache.open(tmp_path / "probe_cache.db", 3)
+    cache.probe(files[0])
+    assert len(probe_calls) == 1
+
+    cache.close()
+    cache.open(tmp_path / "probe_cache.db", 3, rebuild=True)
+    cache.probe(files[0])
+    assert len(probe_calls) == 2
+
+
+def test_eviction(cache, files):
+    for path in files:
+        cache.probe(path)
+    assert len(probe_calls) == 5
+
+    # The most recently used entries survive eviction
+    cache.probe(files[4])
+    assert len(probe_calls) == 5
+    cache.probe(files[0])
+    assert len(probe_calls) == 6
+
+
+def test_closed(files, monkeypatch):
+    probe_calls.clear()
+    monkeypatch.setattr(probe_cache.ffmpeg, "probe", fake_probe)
+    ProbeCache.probe(files[0])
+    ProbeCache.probe(files[0])
+    assert len(probe_calls) == 2
@@ -0,0 +1,79 @@
+from optparse import Values
+from pathlib import Path
+from beets.library import Library
+from confuse import RootView
+
+from beetsplug.cd_parser import CDParser
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.run_fingerprint import LastRun, RunFingerprint, RunInputs
+
+
+DEFINITIONS = """
+first:
+  type: audio
+  tracks:
+    - playlist: "{playlist}"
+second:
+  type: mp3
+  path: "{elsewhere}"
+  folders:
+    __root__:
+      tracks:
+        - query: "'artist:Nobody'"
+"""
+
+
+def test_changed_inputs(tmp_path: Path):
+    definition_path = tmp_path / "cds.yml"
+    definition_path.write_text("first:\n  type: audio\n")
+    cds_path = tmp_path / "cds"
+    (cds_path / "first").mkdir(parents=True)
+    inputs = RunInputs([definition_path], [], [cds_path])
+
+    fingerprint = RunFingerprint.create(inputs, {"bitrate": 192}, "library")
+    assert fingerprint.changed_inputs(RunFingerprint.create(inputs, {"bitrate": 192}, "library")) == []
+
+    other = RunFingerprint.create(inputs, {"bitrate": 128}, "changed library")
+    assert fingerprint.changed_inputs(other) == ["config", "beets library"]
+
+    # Only the top level of CD directories is looked at
+    (cds_path / "second").mkdir()
+    assert RunFingerprint.create(inputs, {"bitrate": 192}, "library").changed_inputs(fingerprint) == ["CD directories"]
+
+    # Libraries that can't be identified never match
+    unknown = RunFingerprint.create(inputs, {"bitrate": 192}, None)
+    assert unknown.changed_inputs(unknown) == ["beets library"]
+
+
+def test_last_run(tmp_path: Path):
+    assert LastRun.load(tmp_path) is None
+
+    fingerprint = RunFingerprint({"config": "abc", "library": "def"})
+    LastRun(fingerprint, ["Found 2 CDs"], "2024-01-01 00:00:00").save(tmp_path)
+    last_run = LastRun.load(tmp_path)
+    assert last_run is not None
+    assert last_run.fingerprint.changed_inputs(fingerprint) == []
+    assert last_run.summary == ["Found 2 CDs"]
+
+    (tmp_path / LastRun.FILE_NAME).write_text("{")
+    assert LastRun.load(tmp_path) is None
+
+
+def test_find_inputs(tmp_path: Path):
+    playlist_path = tmp_path / "playlist.m3u"
+    elsewhere = tmp_path / "elsewhere"
+    definition_path = tmp_path / "definitions" / "cds.yml"
+    definition_path.parent.mkdir()
+    definition_path.write_text(DEFINITIONS.format(playlist=playlist_path, elsewhere=elsewhere))
+    (definition_path.parent / "notes.txt").write_text("Not a definition")
+
+    config = RootView([])
+    config.set({"path": str(tmp_path / "cds")})
+    opts = Values({"bitrate": None, "batch_size": None, "populate_mode": None})
+    with DimensionalThreadPoolExecutor(1) as executor:
+        parser = CDParser(Library(str(tmp_path / "library.db")), opts, config, executor)
+        inputs = parser.find_inputs([definition_path.parent])
+
+    assert inputs.definition_files == [definition_path]
+    assert inputs.playlists == [playlist_path]
+    assert inputs.cd_roots == [tmp_path / "cds", elsewhere]
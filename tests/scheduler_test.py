@@ -0,0 +1,106 @@
+from pytest import raises
+
+from beetsplug.dimensional_thread_pool_executor import DimensionalThreadPoolExecutor
+from beetsplug.scheduler import (
+    DefinitionOrderPolicy,
+    JobGroup,
+    LongestFirstPolicy,
+    PopulateJob,
+    Scheduler,
+    SchedulingPolicy,
+    copy_cost,
+    encode_cost,
+)
+from beetsplug.stats import Stats
+from beetsplug.stream_info import StreamInfo
+
+
+def test_costs():
+    flac = StreamInfo(300.0, 900_000, "flac", 44100)
+    ape = StreamInfo(300.0, 900_000, "ape", 44100)
+    short = StreamInfo(60.0, 900_000, "flac", 44100)
+    assert encode_cost(ape) > encode_cost(flac) > encode_cost(short)
+    assert encode_cost(flac, copy=True) < encode_cost(flac)
+    assert copy_cost(flac) > copy_cost(short)
+    # Unknown tracks are treated as a typical song
+    assert encode_cost(None) > 0
+
+
+def test_policies():
+    jobs = [PopulateJob(cost, lambda: None) for cost in [1.0, 5.0, 3.0, 5.0]]
+    assert list(LongestFirstPolicy().order(jobs)) == [jobs[1], jobs[3], jobs[2], jobs[0]]
+    assert list(DefinitionOrderPolicy().order(jobs)) == jobs
+
+    # A window only picks the longest of the jobs pulled in so far
+    assert list(LongestFirstPolicy(2).order(jobs)) == [jobs[1], jobs[2], jobs[3], jobs[0]]
+    assert list(LongestFirstPolicy(1).order(jobs)) == jobs
+
+
+def test_window_is_lazy():
+    pulled = 0
+
+    def jobs():
+        nonlocal pulled
+        for cost in range(100):
+            pulled += 1
+            yield PopulateJob(float(cost), lambda: None)
+
+    order = LongestFirstPolicy(10).order(jobs())
+    assert next(order).cost == 9.0
+    assert pulled == 10
+
+
+def test_from_str():
+    assert isinstance(SchedulingPolicy.from_str("LONGEST_FIRST"), LongestFirstPolicy)
+    assert isinstance(SchedulingPolicy.from_str("definition_order"), DefinitionOrderPolicy)
+    assert SchedulingPolicy.from_str("shortest_first") is None
+
+
+def test_longest_first_order():
+    # One long job defined last would run alone at the end in definition order
+    def jobs(started: list[float]):
+        return [PopulateJob(cost, started.append, cost) for cost in [0.02, 0.02, 0.02, 0.02, 0.08]]
+
+    starts: dict[str, list[float]] = {}
+    for name, policy in [("definition", DefinitionOrderPolicy()), ("longest", LongestFirstPolicy())]:
+        started: list[float] = []
+        # A single worker starts jobs in exactly the order they're scheduled
+        with DimensionalThreadPoolExecutor(1) as executor:
+            scheduler = Scheduler(executor, policy)
+            scheduler.schedule(jobs(started))
+            executor.wait()
+        assert scheduler.achieved_makespan >= scheduler.ideal_makespan
+        starts[name] = started
+
+    assert starts["definition"] == [0.02, 0.02, 0.02, 0.02, 0.08]
+    assert starts["longest"] == [0.08, 0.02, 0.02, 0.02, 0.02]
+
+
+def test_job_group():
+    finished: list[str] = []
+    group = JobGroup(lambda: finished.append("group"))
+    jobs = [group.add(PopulateJob(1.0, finished.append, name)) for name in ["a", "b"]]
+
+    jobs[0].run()
+    jobs[1].run()
+    # More jobs may still be added until the group is closed
+    assert finished == ["a", "b"]
+    group.close()
+    assert finished == ["a", "b", "group"]
+
+    # An empty group is done as soon as it's closed
+    empty = JobGroup(lambda: finished.append("empty"))
+    empty.close()
+    assert finished[-1] == "empty"
+
+    # A job that raises still finishes its group, and is counted as a failure
+    def fail():
+        raise PermissionError("read-only CD directory")
+    failing = JobGroup(lambda: finished.append("failing"))
+    job = failing.add(PopulateJob(1.0, fail))
+    failing.close()
+    failed_before = Stats.tasks_failed
+    with raises(PermissionError):
+        job.run()
+    assert finished[-1] == "failing"
+    assert Stats.tasks_failed == failed_before + 1
@@ -0,0 +1,59 @@
+import os
+from pathlib import Path
+from beets.library import Item
+
+from beetsplug.cd.mp3.mp3_track import MP3Track
+from beetsplug.stream_info import StreamInfo
+
+
+def test_from_probe():
+    info = StreamInfo.from_probe({
+        "codec_type": "audio",
+        "codec_name": "flac",
+        "duration": "293.12",
+        "sample_rate": "48000",
+    })
+    assert info.duration == 293.12
+    assert info.bit_rate is None
+    assert info.codec == "flac"
+    assert info.sample_rate == 48000
+
+
+def test_from_item():
+    item = Item(length=207.5, bitrate=320_000, samplerate=44100, format="MP3", mtime=1_700_000_000.0)
+    info = StreamInfo.from_item(item)
+    assert info is not None
+    assert info.duration == 207.5
+    assert info.bit_rate == 320_000
+    assert info.codec == "mp3"
+    assert info.sample_rate == 44100
+    assert info.mtime == 1_700_000_000.0
+
+    item = Item(length=100.0, format="OGG")
+    info = StreamInfo.from_item(item)
+    assert info is not None
+    assert info.codec == "vorbis"
+    assert info.bit_rate is None
+
+    assert StreamInfo.from_item(Item()) is None
+
+
+def test_is_current(tmp_path: Path):
+    path = tmp_path / "track.mp3"
+    path.write_bytes(b"\0")
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+
+    assert StreamInfo(1.0, mtime=1_700_000_000.0).is_current(path)
+    assert not StreamInfo(1.0, mtime=1_600_000_000.0).is_current(path)
+    assert not StreamInfo(1.0, mtime=1_700_000_000.0).is_current(tmp_path / "missing.mp3")
+    assert StreamInfo(1.0).is_current(path)
+
+
+def test_track_uses_library_info(tmp_path: Path):
+    path = tmp_path / "01 Track.flac"
+    path.write_bytes(b"\0")
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+
+    info = StreamInfo(207.5, codec="flac", mtime=1_700_000_000.0)
+    track = MP3Track(path, 128, tmp_path, src_info=info)
+    assert track.get_duration(path) == 207.5
@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+from pytest import fixture
+
+from beetsplug import transcoder
+from beetsplug.stats import Stats
+from beetsplug.transcode_store import TranscodeStore
+from beetsplug.transcoder import Transcoder
+
+from tests import transcoder_test
+
+
+@fixture
+def store(tmp_path: Path, monkeypatch):
+    transcoder_test.encode_calls.clear()
+    monkeypatch.setattr(transcoder, "ffmpeg", transcoder_test.fake_ffmpeg)
+    Transcoder.reset()
+    Stats.reset()
+    TranscodeStore.open(tmp_path / "store", 100)
+    yield TranscodeStore
+    TranscodeStore.close()
+
+
+@fixture
+def src_path(tmp_path: Path) -> Path:
+    path = tmp_path / "Song.flac"
+    path.write_text("source")
+    return path
+
+
+def test_reuse_between_runs(store, src_path, tmp_path):
+    assert Transcoder.transcode(src_path, tmp_path / "cd_1.mp3", ["-b:a", "128k"])
+    assert len(transcoder_test.encode_calls) == 1
+
+    # A new run, where the CD was renamed
+    Transcoder.reset()
+    renamed_path = tmp_path / "cd_renamed.mp3"
+    assert Transcoder.transcode(src_path, renamed_path, ["-b:a", "128k"])
+    assert len(transcoder_test.encode_calls) == 1
+    assert renamed_path.read_text() == "Song.flac -b:a 128k"
+    assert Stats.transcode_store_hits == 1
+    assert Stats.transcode_store_misses == 1
+
+    # Changing the source or the encoder arguments is a different encode
+    Transcoder.reset()
+    assert Transcoder.transcode(src_path, tmp_path / "cd_2.mp3", ["-b:a", "192k"])
+    src_path.write_text("re-ripped source")
+    assert Transcoder.transcode(src_path, tmp_path / "cd_3.mp3", ["-b:a", "128k"])
+    assert len(transcoder_test.encode_calls) == 3
+
+
+def test_reencode_keeps_stored_encode(store, src_path, tmp_path):
+    dst_path = tmp_path / "cd_1.mp3"
+    assert Transcoder.transcode(src_path, dst_path, ["-b:a", "128k"])
+    Transcoder.reset()
+    assert Transcoder.transcode(src_path, dst_path, ["-b:a", "192k"])
+
+    # The 128k encode must not have been overwritten through a hard link
+    Transcoder.reset()
+    other_path = tmp_path / "cd_2.mp3"
+    assert Transcoder.transcode(src_path, other_path, ["-b:a", "128k"])
+    assert other_path.read_text() == "Song.flac -b:a 128k"
+
+
+def test_eviction(store, tmp_path):
+    # Every fake encode is 21 bytes, so only two fit in the store
+    store.open(tmp_path / "store", 50)
+    for i in range(4):
+        src_path = tmp_path / f"Song {i}.flac"
+        src_path.write_text("source")
+        assert Transcoder.transcode(src_path, tmp_path / f"cd_{i}.mp3", ["-b:a", "128k"])
+        # Make sure access times are distinct
+        stored = [path for path in (tmp_path / "store").glob("*/*")]
+        for path in stored:
+            stat = path.stat()
+            os.utime(path, ns=(stat.st_atime_ns - 1_000_000_000, stat.st_mtime_ns))
+
+    stored = list((tmp_path / "store").glob("*/*"))
+    assert len(stored) == 2
+    assert sum(path.stat().st_size for path in stored) <= 50
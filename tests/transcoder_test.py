@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+import time
+from pytest import fixture
+
+from beetsplug import transcoder
+from beetsplug.transcoder import Transcoder
+from beetsplug.util import link_or_copy
+
+
+class FakeResult:
+    def __init__(self, returncode: int):
+        self.returncode = returncode
+
+
+encode_calls: list[Path] = []
+encode_lock = Lock()
+
+
+def fake_ffmpeg(source: Path, destination: Path, args: list[str] = []):
+    with encode_lock:
+        encode_calls.append(destination)
+    time.sleep(0.05)
+    if source.name.startswith("bad"):
+        return FakeResult(1)
+    destination.write_text(f"{source.name} {' '.join(args)}")
+    return FakeResult(0)
+
+
+@fixture
+def fake_encoder(monkeypatch):
+    encode_calls.clear()
+    Transcoder.reset()
+    monkeypatch.setattr(transcoder, "ffmpeg", fake_ffmpeg)
+
+
+def test_single_flight(fake_encoder, tmp_path: Path):
+    src_path = tmp_path / "Song.flac"
+    dst_paths = [tmp_path / f"cd_{i}.mp3" for i in range(6)]
+
+    with ThreadPoolExecutor(len(dst_paths)) as executor:
+        results = list(executor.map(
+            lambda dst_path: Transcoder.transcode(src_path, dst_path, ["-b:a", "128k"]),
+            dst_paths,
+        ))
+
+    assert all(results)
+    assert len(encode_calls) == 1
+    for dst_path in dst_paths:
+        assert dst_path.read_text() == "Song.flac -b:a 128k"
+
+    # Different encoder arguments are a different encode
+    assert Transcoder.transcode(src_path, tmp_path / "other.mp3", ["-b:a", "192k"])
+    assert len(encode_calls) == 2
+
+
+def test_failed_encode(fake_encoder, tmp_path: Path):
+    src_path = tmp_path / "bad.flac"
+    assert not Transcoder.transcode(src_path, tmp_path / "cd_1.mp3", [])
+    assert not Transcoder.transcode(src_path, tmp_path / "cd_2.mp3", [])
+    assert len(encode_calls) == 2
+
+
+def test_missing_encode(fake_encoder, tmp_path: Path):
+    src_path = tmp_path / "Song.flac"
+    first_path = tmp_path / "cd_1.mp3"
+    assert Transcoder.transcode(src_path, first_path, [])
+    first_path.unlink()
+    assert Transcoder.transcode(src_path, tmp_path / "cd_2.mp3", [])
+    assert len(encode_calls) == 2
+
+
+def test_link_or_copy(tmp_path: Path):
+    src_path = tmp_path / "src.mp3"
+    src_path.write_text("data")
+    dst_path = tmp_path / "dst.mp3"
+    dst_path.write_text("old data")
+
+    link_or_copy(src_path, dst_path)
+    assert dst_path.read_text() == "data"
+
+
+def test_linked_destination_is_replaced(fake_encoder, tmp_path: Path):
+    src_path = tmp_path / "Song.flac"
+    src_path.write_text("source")
+    other_cd_path = tmp_path / "other_cd.mp3"
+    other_cd_path.write_text("other CD")
+    dst_path = tmp_path / "cd.mp3"
+    link_or_copy(other_cd_path, dst_path)
+
+    # Encoding into a linked destination mustn't change the file it was linked to
+    assert Transcoder.transcode(src_path, dst_path, ["-b:a", "128k"])
+    assert other_cd_path.read_text() == "other CD"
+    assert dst_path.read_text() == "Song.flac -b:a 128k"
+
+
+batch_calls: list[int] = []
+
+
+def fake_ffmpeg_batch(jobs):
+    batch_calls.append(len(jobs))
+    if any(source.name.startswith("bad") for source, _, _ in jobs):
+        return FakeResult(1)
+    for source, destination, args in jobs:
+        destination.write_text(f"{source.name} {' '.join(args)}")
+    return FakeResult(0)
+
+
+@fixture
+def fake_batch_encoder(fake_encoder, monkeypatch):
+    batch_calls.clear()
+    monkeypatch.setattr(transcoder, "ffmpeg_batch", fake_ffmpeg_batch)
+
+
+def test_batch(fake_batch_encoder, tmp_path: Path):
+    jobs = [(tmp_path / f"Song {i}.flac", tmp_path / f"0{i} Song {i}.mp3", ["-b:a", "128k"]) for i in range(4)]
+    # The same encode twice in one batch is only encoded once
+    jobs.append((jobs[0][0], tmp_path / "05 Song 0.mp3", ["-b:a", "128k"]))
+
+    results = Transcoder.transcode_many(jobs)
+    assert results == [True] * 5
+    assert batch_calls == [4]
+    assert len(encode_calls) == 0
+    for source, destination, _ in jobs:
+        assert destination.read_text() == f"{source.name} -b:a 128k"
+
+
+def test_failed_batch(fake_batch_encoder, tmp_path: Path):
+    jobs = [
+        (tmp_path / "Song 1.flac", tmp_path / "01 Song 1.mp3", []),
+        (tmp_path / "bad.flac", tmp_path / "02 bad.mp3", []),
+        (tmp_path / "Song 3.flac", tmp_path / "03 Song 3.mp3", []),
+    ]
+    results = Transcoder.transcode_many(jobs)
+    assert results == [True, False, True]
+    assert batch_calls == [3]
+    # Every job was retried on its own
+    assert len(encode_calls) == 3
@@ -0,0 +1,42 @@
+from pathlib import Path
+from pytest import mark
+
+from beetsplug.watcher import Watcher
+
+
+@mark.parametrize("use_inotify", [True, False])
+def test_file_changes(tmp_path: Path, use_inotify: bool):
+    watched_path = tmp_path / "cds.yml"
+    watched_path.write_text("first: {}\n")
+    other_path = tmp_path / "notes.txt"
+
+    watcher = Watcher(poll_interval=0.05, use_inotify=use_inotify)
+    try:
+        watcher.watch([watched_path])
+        assert watcher.wait(debounce=0.05, timeout=0.2) == set()
+
+        # Only watched files are reported, even when their directory is watched by inotify
+        other_path.write_text("Not watched")
+        assert watcher.wait(debounce=0.05, timeout=0.2) == set()
+
+        # Changes made before waiting aren't missed, and a burst is reported once
+        watched_path.write_text("first: {}\nsecond: {}\n")
+        watched_path.write_text("first: {}\nsecond: {}\nthird: {}\n")
+        assert watcher.wait(debounce=0.1, timeout=1.0) == {watched_path}
+        assert watcher.wait(debounce=0.05, timeout=0.2) == set()
+    finally:
+        watcher.close()
+
+
+@mark.parametrize("use_inotify", [True, False])
+def test_directory_changes(tmp_path: Path, use_inotify: bool):
+    definitions_path = tmp_path / "definitions"
+    definitions_path.mkdir()
+
+    watcher = Watcher(poll_interval=0.05, use_inotify=use_inotify)
+    try:
+        watcher.watch([], [definitions_path])
+        (definitions_path / "new.yml").write_text("first: {}\n")
+        assert watcher.wait(debounce=0.1, timeout=1.0) == {definitions_path}
+    finally:
+        watcher.close()